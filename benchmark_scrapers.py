@@ -0,0 +1,132 @@
+"""
+Benchmark of the scrapers against recorded pages (no network needed).
+
+Recording the pages of some scrapers once (talks to the websites):
+    python benchmark_scrapers.py --record biunsinnorden live_gigs
+
+Benchmarking them against the recording (pages/sec, events/sec, parse time per scraper):
+    python benchmark_scrapers.py biunsinnorden live_gigs --json benchmark.json
+
+Comparing against an earlier result (exits with 1 if event counts changed or a scraper got slower than the tolerance):
+    python benchmark_scrapers.py biunsinnorden live_gigs --compare benchmark.json
+
+Parse time is the run time of a scraper minus the time spent loading pages and waiting for them (load, wait and sleep in the
+time profile of the run, see time_accounting.py, or the load time counted by the replay archive if accounting is off), so
+it covers finding the events in the pages, extracting and preprocessing them. Saved pages are the pages not loaded because the event list
+reached beyond the scraping horizon (see pagination.py). The archive folder can be changed with REPLAY_ARCHIVE.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Directory containing the scraper scripts
+SCRAPER_DIR = Path(__file__).resolve().parent / "finalized_scrapers"
+if not (SCRAPER_DIR / "scraper_registry.py").exists():
+    SCRAPER_DIR = Path(__file__).resolve().parent / "finalized scrapers"
+
+# Slowdown of the events/sec of a scraper (compared to --compare) that counts as regression
+DEFAULT_TOLERANCE = 0.2
+
+def benchmark_scraper(source):
+    """Runs one scraper against the replay archive and returns its measurements."""
+    from scraper_registry import run_scraper_plugin
+    from replay_cache import get_stats, reset_stats
+    from time_accounting import ACCOUNTING_ENABLED, TIME_PROFILE_DIR
+    import pagination
+
+    reset_stats()
+    pagination.reset_stats()
+    start = time.perf_counter()
+    df = run_scraper_plugin(source)
+    duration = time.perf_counter() - start
+    stats = get_stats()
+    pages_saved = sum(source_stats["pages_saved"] for source_stats in pagination.get_stats().values())
+
+    # The profile counts the time waiting for pages loading in tabs as waiting, the replay archive as loading time
+    profile = read_profile_seconds(TIME_PROFILE_DIR / f"{source}.json") if ACCOUNTING_ENABLED else {}
+    wait_seconds = profile.get("wait", 0.0) + profile.get("sleep", 0.0)
+    load_seconds = profile["load"] if profile else stats["load_seconds"]
+    parse_seconds = max(duration - load_seconds - wait_seconds, 0.0)
+    return {
+        "source": source,
+        "events": len(df),
+        "pages": stats["pages"],
+        "pages_saved": pages_saved,
+        "seconds": round(duration, 3),
+        "load_seconds": round(load_seconds, 3),
+        "wait_seconds": round(wait_seconds, 3),
+        "parse_seconds": round(parse_seconds, 3),
+        "pages_per_second": round(stats["pages"] / duration, 2) if duration else 0.0,
+        "events_per_second": round(len(df) / duration, 2) if duration else 0.0,
+    }
+
+def read_profile_seconds(profile_file):
+    """Returns the seconds per category of the time profile of a scraper run (empty if there is no profile)."""
+    try:
+        return json.loads(Path(profile_file).read_text(encoding="utf-8"))["seconds"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def print_table(results):
+    """Prints the measurements as table."""
+    print(f"{'scraper':<20} {'events':>7} {'pages':>6} {'saved':>6} {'total s':>8} {'parse s':>8} {'pages/s':>8} {'events/s':>9}")
+    for result in results:
+        print(
+            f"{result['source']:<20} {result['events']:>7} {result['pages']:>6} {result.get('pages_saved', 0):>6} {result['seconds']:>8.2f} "
+            f"{result['parse_seconds']:>8.2f} {result['pages_per_second']:>8.2f} {result['events_per_second']:>9.2f}"
+        )
+
+def compare(results, baseline_file, tolerance):
+    """Compares with an earlier benchmark result and returns the list of regressions."""
+    baseline = {result["source"]: result for result in json.loads(Path(baseline_file).read_text())}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["source"])
+        if before is None:
+            continue
+        if result["events"] != before["events"]:
+            regressions.append(f"{result['source']}: {result['events']} events instead of {before['events']}")
+        elif result["events_per_second"] < before["events_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['source']}: {result['events_per_second']} events/s instead of {before['events_per_second']}"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against recorded pages.")
+    parser.add_argument("sources", nargs="*", help="Names of the scrapers (see scraper_registry.py), default: all")
+    parser.add_argument("--record", action="store_true", help="Record the pages from the live websites instead")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed events/s slowdown (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # The replay mode has to be set before the scrapers and their helpers are imported
+    os.environ["REPLAY_MODE"] = "record" if args.record else "replay"
+    sys.path.insert(0, str(SCRAPER_DIR))
+    from scraper_registry import SCRAPER_PLUGINS
+
+    sources = args.sources or list(SCRAPER_PLUGINS)
+    results = []
+    for source in sources:
+        try:
+            results.append(benchmark_scraper(source))
+        except Exception as ex:
+            print(f"Benchmark of {source} failed: {ex}")
+    print_table(results)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,77 +4,45 @@
 
 # Imports
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from http_fetch import iter_pages
+from structured_data import extract_events
+from event_sink import collect_events
+from pagination import PaginationController
 
-import pandas as pd
-import time
 
 
 # Scraping function
 
-def scrape_biunsinnorden_sh_hh():
-
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website, defining waits, creating a list to store events)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    url = "https://www.biunsinnorden.de/veranstaltungen/neumuenster/musik/umkreis-100"
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get(url)
-    wait = WebDriverWait(driver, 10)
-    events_list = []
-    time.sleep(5)
-
-    # Closing the cookie window, if it appears (not always when using Chrome driver)
-    try:
-        button = driver.find_element(By.ID, 'cookie-accept-required')
-        button.click()
-    except Exception as e:
-        print(e)
-
-    # Navigating through the first eight pages of results (8 was chosen as a heuristic for covering an appropriate timeframe)
+def scrape_biunsinnorden_sh_hh(sink=None):
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_biunsinnorden_events(), sink)
+
+
+def iter_biunsinnorden_events():
+
+    # Preparations for scraping (defining the urls of the pages to scrape)
+    # Navigating through at most the first eight pages of results (8 was chosen as a heuristic for covering an appropriate timeframe),
+    # the pages are sorted by date, so no further page is requested once a page reaches beyond the scraping horizon (see pagination.py)
     # Navigation choice: Varying the URL to use it as an api to navigate through pages (proved as more stable than clicking on "next" button)
-    for i in range(1,9):
-        url = f"https://www.biunsinnorden.de/veranstaltungen/neumuenster/musik/umkreis-100?Page={i}#Termine"
-        driver.get(url)
-        time.sleep(5)
-        
-        # Finding all events per page, the specific web element representing an event is identified via CSS selector
-        event_elements = driver.find_elements(By.CSS_SELECTOR, 'div.row[itemscope][itemtype="http://schema.org/Event"]')
-
-        for event in event_elements:
-
-            # Sometimes no start time is given, so the retrieval of this information had to be made more robust
-            try:
-                start_time = event.find_element(By.CSS_SELECTOR, '.time.standard').text[:-4]
-            except Exception as e:
-                start_time = " "
-
-            # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-            event_info = {
-                'Start_date': event.find_element(By.CSS_SELECTOR, 'meta[itemprop="startDate"]').get_attribute('content')[:-6],
-                'End_date': event.find_element(By.CSS_SELECTOR, 'meta[itemprop="startDate"]').get_attribute('content')[:-6],
-                'Start_time': start_time,
-                'End_time': " ",
-                'Subject': event.find_element(By.CSS_SELECTOR, '.title a').get_attribute('title'),
-                'Category': event.find_element(By.CSS_SELECTOR, '.category').text,
-                'Music_label': True, # All events on this website are music related
-                'Location': event.find_element(By.CSS_SELECTOR, '.venue a').get_attribute('title'),
-                'City': event.find_element(By.CSS_SELECTOR, '.city span[itemprop="addressLocality"]').text,
-                'Description': event.find_element(By.CSS_SELECTOR, '.title a').get_attribute('href')
-            }
-            events_list.append(event_info)
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(events_list)
-    driver.close()
-
-    return df_raw   
+    urls = [f"https://www.biunsinnorden.de/veranstaltungen/neumuenster/musik/umkreis-100?Page={i}#Termine" for i in range(1,9)]
+
+    # The website renders its events on the server, so the pages are requested several at a time without a browser (see http_fetch.py, the browser is only used as fallback)
+    with PaginationController("biunsinnorden", max_pages=len(urls)) as pager:
+        for url, page in iter_pages(urls, "biunsinnorden", ready_selector=event_selector):
+
+            # The events are published as schema.org microdata, so they are read in the final data format in one pass over the page
+            # (see structured_data.py), the CSS selectors in event_fields only fill information missing in the microdata
+            # All events on this website are music related
+            events = extract_events(page, base_url=url, fields=event_fields, defaults={'Music_label': True})
+            for event in events:
+
+                # Sometimes no start time is given (left empty in preprocessing), events missing other information are skipped
+                if None in (event['Start_date'], event['Subject'], event['Category'], event['Location'], event['City'], event['Description']):
+                    continue
+                yield event
+
+            if not pager.add_page([event['Start_date'] for event in events]):
+                break
 
 
 # Preprocessing function
@@ -87,10 +55,27 @@ def preprocess_biunsinnorden(df_raw):
     return df_prep
 
 
+# Helper functions and elements
+
+# CSS selector of the web element representing an event
+event_selector = 'div.row[itemscope][itemtype="http://schema.org/Event"]'
+
+# Fields read from each event element if they are missing in the microdata (CSS selector and attribute per column, see dom_extraction.py)
+event_fields = {
+    'Start_time': ('.time.standard', 'text'),
+    'Subject': ('.title a', 'title'),
+    'Category': ('.category', 'text'),
+    'Location': ('.venue a', 'title'),
+    'City': ('.city span[itemprop="addressLocality"]', 'text'),
+    'Description': ('.title a', 'href'),
+}
+
+
 # Recommended usage of the above functions
 
-df_raw = scrape_biunsinnorden_sh_hh()
-df_prep = preprocess_biunsinnorden(df_raw)
-df_prep.to_csv("Scraped_Events_BiUnsInNorden_SH_HH.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_biunsinnorden_sh_hh()
+    df_prep = preprocess_biunsinnorden(df_raw)
+    df_prep.to_csv("Scraped_Events_BiUnsInNorden_SH_HH.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -0,0 +1,91 @@
+# Browser profiles: what Chrome is allowed to download and how long it waits per page load for each website
+# By default Chrome fetches everything a listing page references (images, fonts, videos, ad and tracking scripts) and
+# driver.get() only returns after all of it was loaded. The scrapers only need the html of the event lists, so every
+# website declares here what it actually needs:
+#
+#     page_load_strategy: "normal" (wait for all resources), "eager" (return when the html is parsed) or "none"
+#     blocked_urls:       url patterns Chrome doesn't request at all (via CDP Network.setBlockedURLs, "*" as wildcard)
+#     block_images:       don't download any images
+#     javascript:         False runs the page without its own JavaScript (for websites rendering the events on the server)
+#     capture_network:    True records the responses the page fetches, so the events can be read from its JSON API (see network_capture.py)
+#
+# The scrapers wait for the elements they need anyway (see waiting.py), so "eager" doesn't change what they find.
+# Consent banner scripts and stylesheets are not blocked, as the scrapers click on buttons (which have to be visible) and read
+# the visible text of elements.
+
+# Imports
+
+import os
+
+
+# Url patterns of resources no scraper needs
+AD_AND_TRACKING_URLS = [
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*googleadservices.com*", "*facebook.net*", "*connect.facebook.*", "*hotjar.com*", "*adnxs.com*", "*criteo.*",
+    "*taboola.com*", "*outbrain.com*", "*scorecardresearch.com*", "*bing.com/bat*", "*tiktok.com*",
+]
+FONT_URLS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*fonts.googleapis.com*", "*fonts.gstatic.com*", "*use.typekit.net*"]
+MEDIA_URLS = ["*.mp4", "*.webm", "*.m3u8", "*.mp3", "*youtube.com/embed*", "*player.vimeo.com*"]
+IMAGE_URLS = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.jpg?*", "*.jpeg?*", "*.png?*", "*.webp?*"]
+
+# Profile of websites not listed below (the behaviour before profiles existed)
+DEFAULT_PROFILE = {
+    "page_load_strategy": "normal",
+    "blocked_urls": [],
+    "block_images": False,
+    "javascript": True,
+    "capture_network": False,
+}
+
+# Profile for listing pages: html and scripts only, returning as soon as the html is parsed
+LEAN_PROFILE = {
+    "page_load_strategy": "eager",
+    "blocked_urls": AD_AND_TRACKING_URLS + FONT_URLS + MEDIA_URLS,
+    "block_images": True,
+    "javascript": True,
+}
+
+# Profile for single page applications rendering their events from JSON responses
+SPA_PROFILE = {**LEAN_PROFILE, "capture_network": True}
+
+# Profile per website (the websites fetched over http only use the browser as fallback, see http_fetch.py)
+BROWSER_PROFILES = {
+    "biunsinnorden": LEAN_PROFILE,
+    "eventbrite": SPA_PROFILE,  # image heavy event cards
+    "eventim": LEAN_PROFILE,
+    "hamburg_de": LEAN_PROFILE,
+    "neumuenster": LEAN_PROFILE,
+    "kiel_sailing_city": SPA_PROFILE,
+    "live_gigs": LEAN_PROFILE,
+    "sh_tourismus": LEAN_PROFILE,
+    "rausgegangen": LEAN_PROFILE,  # image heavy event tiles
+    "unser_luebeck": LEAN_PROFILE,
+    "kiel_magazin": LEAN_PROFILE,
+    "meine_stadt": LEAN_PROFILE,
+    "wasgeht": LEAN_PROFILE,
+}
+
+# Setting BROWSER_PROFILES=off loads all websites with the default profile (e.g. for debugging)
+PROFILES_ENABLED = os.getenv("BROWSER_PROFILES", "on") != "off"
+
+
+def browser_profile(site):
+    """Returns the complete browser profile of a website (missing settings are taken from DEFAULT_PROFILE)."""
+    if not PROFILES_ENABLED or site is None:
+        return dict(DEFAULT_PROFILE)
+    return {**DEFAULT_PROFILE, **BROWSER_PROFILES.get(site, {})}
+
+
+def blocked_url_patterns(profile):
+    """Returns all url patterns blocked by a profile."""
+    patterns = list(profile["blocked_urls"])
+    if profile["block_images"]:
+        patterns += IMAGE_URLS
+    return patterns
+
+
+def apply_profile(driver, profile):
+    """Applies the per tab settings of a profile (blocked urls, JavaScript) to a driver via the Chrome DevTools Protocol."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_url_patterns(profile)})
+    driver.execute_cdp_cmd("Emulation.setScriptExecutionDisabled", {"value": not profile["javascript"]})
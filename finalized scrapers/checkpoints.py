@@ -0,0 +1,209 @@
+# Checkpoints for long running scrapers
+# Scrapers like meine_stadt (24 urls) and wasgeht (cities x days) split their work into units (a url, a city on a day, a page).
+# Every completed unit is written to a checkpoint file together with the events extracted from it. If the scraper is started
+# again on the same day (e.g. after a crash), completed units are not scraped again, their events are read from the checkpoint
+# and the scraper continues with the first incomplete unit. A unit that fails because the browser crashed is retried with a
+# fresh browser from the pool. Checkpoints of earlier days are deleted, so every day starts from scratch. Once all units
+# were completed the checkpoint is deleted too (finish()), so a second run on the same day scrapes the websites again instead
+# of handing on the events of the first run.
+# Only the position of every completed unit in the file is kept in memory, its events are read from the file when needed.
+
+# Imports
+
+from selenium.common.exceptions import WebDriverException
+
+from datetime import date
+from pathlib import Path
+
+import json
+import os
+import threading
+
+
+# Folder of the checkpoint files
+CHECKPOINT_DIR = Path(os.getenv("CHECKPOINT_DIR", "checkpoints"))
+
+# Setting CHECKPOINT_RESUME=off ignores existing checkpoints and starts from scratch
+CHECKPOINT_RESUME = os.getenv("CHECKPOINT_RESUME", "on") != "off"
+
+# How often a unit is retried with a fresh browser after the browser crashed
+MAX_RESTARTS = int(os.getenv("CHECKPOINT_MAX_RESTARTS", "2"))
+
+
+def unit_key(unit):
+    """Turns a unit (a string or a tuple like (city, day)) into the key stored in the checkpoint file."""
+    if isinstance(unit, (tuple, list)):
+        return "|".join(str(part) for part in unit)
+    return str(unit)
+
+
+def cities_key(cities):
+    """Key of the checkpoint of a run limited to some cities (None for all cities), named like the spool files in work_queue.py."""
+    return "_".join(cities) if cities else None
+
+
+def is_day(text):
+    try:
+        date.fromisoformat(text)
+        return True
+    except ValueError:
+        return False
+
+
+class CheckpointStore:
+    """
+    Completed units of one scraper on one day, stored as JSON lines (one line per unit with its events).
+
+    Runs of the same scraper for different cities at the same time (e.g. one work unit per city in work_queue.py) pass the
+    cities as key, so every run has a checkpoint file of its own and does not delete or truncate the file of another run.
+    """
+
+    def __init__(self, source, day=None, resume=CHECKPOINT_RESUME, key=None):
+        self.source = source
+        name = source if key is None else f"{source}_{key}"
+        self.path = CHECKPOINT_DIR / f"{name}_{(day or date.today()).isoformat()}.jsonl"
+        self._units = {}  # key of every completed unit -> byte offset of its line in the file
+        self._lock = threading.Lock()  # units may be completed by several threads (see wasgeht.py)
+
+        # Deleting the checkpoints of earlier days with the same key (the files of other keys are left alone)
+        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+        for old in CHECKPOINT_DIR.glob(f"{name}_*.jsonl"):
+            if old != self.path and is_day(old.stem[len(name) + 1:]):
+                old.unlink()
+
+        if resume:
+            self._load()
+        else:
+            self.path.write_text("")
+
+    def _load(self):
+        # A last line cut off by a crash is ignored, that unit is simply scraped again
+        if not self.path.exists():
+            return
+        offset = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                if record is not None and line.endswith(b"\n"):
+                    self._units[record["unit"]] = offset
+                offset += len(line)
+        if offset and not line.endswith(b"\n"):
+            # Cutting off the incomplete line, so the next unit starts on a line of its own
+            os.truncate(self.path, offset - len(line))
+
+    def is_done(self, unit):
+        return unit_key(unit) in self._units
+
+    def events(self, unit):
+        """Returns the events stored for a completed unit (read from the checkpoint file)."""
+        offset = self._units[unit_key(unit)]
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.readline())["events"]
+
+    def complete(self, unit, events):
+        """Marks a unit as completed and stores its events (written to disk immediately)."""
+        key = unit_key(unit)
+        line = (json.dumps({"unit": key, "events": events}, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as file:
+                offset = file.tell()
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self._units[key] = offset
+
+    def finish(self):
+        """Deletes the checkpoint after all units were completed, so the next run starts from scratch."""
+        with self._lock:
+            self._units.clear()
+            self.path.unlink(missing_ok=True)
+
+    def __len__(self):
+        return len(self._units)
+
+
+def log_resumed(store, units):
+    """Prints how many of the units were completed in an earlier run of today."""
+    resumed = sum(1 for unit in units if store.is_done(unit))
+    if resumed:
+        print(f"Resuming {store.source}: {resumed} of {len(units)} units already completed.")
+
+
+def iter_checkpointed(store, units, scrape_unit, restart=None, max_restarts=MAX_RESTARTS):
+    """
+    Yields the events of all units, skipping the units completed before and retrying units after a browser crash.
+
+    Args:
+        store (CheckpointStore): Checkpoints of the scraper.
+        units (list): Work units in the order to scrape them.
+        scrape_unit (function): Returns (or yields) the events of one unit.
+        restart (function): Replaces the crashed browser of the scraper by a fresh one (no retries if None).
+        max_restarts (int): How often a unit is retried.
+    """
+    log_resumed(store, units)
+
+    for unit in units:
+        if store.is_done(unit):
+            yield from store.events(unit)
+            continue
+
+        for attempt in range(max_restarts + 1):
+            try:
+                events = list(scrape_unit(unit))
+                break
+            except WebDriverException as e:
+                if restart is None or attempt == max_restarts:
+                    raise
+                print(f"Browser failed on {unit_key(unit)} ({e.__class__.__name__}), restarting it and retrying.")
+                restart()
+
+        store.complete(unit, events)
+        yield from events
+
+    store.finish()
+
+
+def iter_checkpointed_batch(store, units, scrape_pending, restart=None, max_restarts=MAX_RESTARTS):
+    """
+    Like iter_checkpointed(), but for scrapers working on several units at once (e.g. in parallel tabs of one browser).
+
+    After a browser crash all units not completed yet are retried. As in iter_checkpointed(), the budget of restarts is
+    per unit: it starts again as soon as a unit is completed, so only max_restarts crashes in a row without progress give up.
+
+    Args:
+        store (CheckpointStore): Checkpoints of the scraper.
+        units (list): Work units of the scraper.
+        scrape_pending (function): Gets the list of pending units and yields (unit, events) in the order the units are done.
+        restart (function): Replaces the crashed browser of the scraper by a fresh one (no retries if None).
+        max_restarts (int): How often the pending units are retried without any of them being completed.
+    """
+    log_resumed(store, units)
+
+    for unit in units:
+        if store.is_done(unit):
+            yield from store.events(unit)
+
+    pending = [unit for unit in units if not store.is_done(unit)]
+    restarts = 0
+    while pending:
+        try:
+            for unit, events in scrape_pending(list(pending)):
+                events = list(events)
+                store.complete(unit, events)
+                pending.remove(unit)
+                restarts = 0
+                yield from events
+            break
+        except WebDriverException as e:
+            if restart is None or restarts == max_restarts:
+                raise
+            restarts += 1
+            print(f"Browser failed on {store.source} ({e.__class__.__name__}), restarting it and retrying {len(pending)} units.")
+            restart()
+
+    if not pending:
+        store.finish()
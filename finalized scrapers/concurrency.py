@@ -0,0 +1,283 @@
+# Adaptive concurrency per domain, shared by all scrapers of this process
+# A fixed number of parallel requests is either too timid for a website or gets us throttled (eventim blocks automatic
+# scrapers altogether). Instead every request to a website (http requests, see http_fetch.py and infomax.py, pages and tabs
+# loaded in the browser, see driver_pool.py) takes a slot of its domain first. The number of slots of a domain adapts to how
+# the website responds (additive increase, multiplicative decrease):
+#
+#     ok        the limit grows by 1 / limit, so by about one slot per round of requests (up to MAX_LIMIT)
+#     slow      the response took more than SLOW_FACTOR times the usual latency of the domain, the limit stays
+#     empty     the page had no events (e.g. no event list in an http response), the limit stays, EMPTY_STREAK empty pages
+#               in a row count as error
+#     error     the request failed (timeout, server error), the limit is halved
+#     blocked   HTTP 403/429 or a captcha / "access denied" page, the limit is halved and no new request is started for
+#               BLOCK_COOLDOWN seconds (or as long as the Retry-After header of the response asks)
+#
+# Requests that were already running when the limit was lowered don't lower it again, so a burst of failing parallel requests
+# only halves the limit once. A thread that already holds a slot of a domain (e.g. a scraper looping over open tabs) isn't
+# held back by further requests to the same domain, it can't wait for its own slots. The controller only knows the requests
+# of its own process; scrapers running in separate processes each adapt on their own. Setting ADAPTIVE_CONCURRENCY=off turns
+# the limits off (requests are still classified and counted).
+
+# Imports
+
+from time_accounting import timed
+
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import math
+import os
+import threading
+import time
+
+
+# Setting ADAPTIVE_CONCURRENCY=off never holds requests back
+CONCURRENCY_ENABLED = os.getenv("ADAPTIVE_CONCURRENCY", "on") != "off"
+
+# Number of parallel requests per domain at the start, at most and at least
+INITIAL_LIMIT = float(os.getenv("DOMAIN_INITIAL_CONCURRENCY", "4"))
+MAX_LIMIT = int(os.getenv("DOMAIN_MAX_CONCURRENCY", "12"))
+MIN_LIMIT = 1
+
+# Factor the limit is multiplied with on errors and blocks
+DECREASE_FACTOR = 0.5
+
+# Responses taking longer than SLOW_FACTOR times the usual latency of the domain don't increase the limit
+SLOW_FACTOR = 3.0
+
+# Weight of a new latency in the usual latency of a domain (exponential moving average)
+LATENCY_WEIGHT = 0.2
+
+# Number of empty pages in a row that counts as error
+EMPTY_STREAK = 3
+
+# Pause of a domain after a block, and the longest pause a Retry-After header can ask for (in seconds)
+BLOCK_COOLDOWN = float(os.getenv("DOMAIN_BLOCK_COOLDOWN", "30"))
+MAX_COOLDOWN = 300
+
+# HTTP status codes and page texts showing that a website blocks or throttles us
+BLOCK_STATUS_CODES = {403, 429}
+BLOCK_MARKERS = [
+    "captcha",
+    "access denied",
+    "zugriff verweigert",
+    "are you a robot",
+    "unusual traffic",
+    "request blocked",
+    "too many requests",
+]
+
+# JavaScript returning the title and the beginning of the visible text of a page (in lower case)
+PAGE_TEXT_SCRIPT = """
+return (document.title + ' ' + (document.body ? document.body.innerText.slice(0, 3000) : '')).toLowerCase();
+"""
+
+OUTCOMES = ["ok", "slow", "empty", "error", "blocked"]
+
+
+def domain_of(url):
+    """Returns the domain requests to url count for (the host name without "www.")."""
+    host = urlparse(url).hostname or url
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_block_text(text):
+    text = text.lower()
+    return any(marker in text for marker in BLOCK_MARKERS)
+
+
+def classify_response(response):
+    """Returns the outcome of an http response (blocked, error or ok) and the pause the website asked for (or None)."""
+    if response.status_code in BLOCK_STATUS_CODES:
+        retry_after = response.headers.get("Retry-After", "")
+        return "blocked", float(retry_after) if retry_after.isdigit() else None
+    if response.status_code >= 500:
+        return "error", None
+    if "html" in response.headers.get("Content-Type", "") and is_block_text(response.text[:5000]):
+        return "blocked", None
+    return "ok", None
+
+
+def classify_page(driver):
+    """Returns the outcome of the page open in the driver (blocked if it is a captcha or "access denied" page, else ok)."""
+    try:
+        return "blocked" if is_block_text(driver.execute_script(PAGE_TEXT_SCRIPT) or "") else "ok"
+    except Exception:
+        return "ok"  # the page is still being replaced, it is checked again on the next request
+
+
+class DomainLimit:
+    """Adaptive number of parallel requests to one domain."""
+
+    def __init__(self, domain, limit=INITIAL_LIMIT):
+        self.domain = domain
+        self.limit = limit
+        self.in_flight = 0
+        self.latency = None  # usual latency in seconds
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.empty_streak = 0
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.lowest_limit = self.highest_limit = limit
+
+    def has_capacity(self, now):
+        if not CONCURRENCY_ENABLED:
+            return True
+        return now >= self.paused_until and self.in_flight < max(MIN_LIMIT, math.floor(self.limit))
+
+    def record(self, outcome, latency, started, pause=None):
+        # Adapts the limit to the outcome of a request that was started at the time started
+        if outcome == "ok" and None not in (self.latency, latency) and latency > SLOW_FACTOR * self.latency:
+            outcome = "slow"
+        if outcome == "empty":
+            self.empty_streak += 1
+            if self.empty_streak >= EMPTY_STREAK:
+                outcome, self.empty_streak = "error", 0
+        else:
+            self.empty_streak = 0
+        self.counts[outcome] += 1
+
+        if outcome in ("ok", "slow") and latency is not None:
+            self.latency = latency if self.latency is None else (1 - LATENCY_WEIGHT) * self.latency + LATENCY_WEIGHT * latency
+        if outcome == "ok":
+            self.limit = min(MAX_LIMIT, self.limit + 1 / self.limit)
+        elif outcome in ("error", "blocked") and started >= self.last_decrease:
+            self.limit = max(MIN_LIMIT, self.limit * DECREASE_FACTOR)
+            self.last_decrease = time.monotonic()
+            if outcome == "blocked":
+                self.paused_until = self.last_decrease + min(pause or BLOCK_COOLDOWN, MAX_COOLDOWN)
+                print(f"{self.domain} blocks requests, pausing it and lowering its concurrency to {math.floor(self.limit)}.")
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.highest_limit = max(self.highest_limit, self.limit)
+
+
+class Slot:
+    """Permission to run one request against a domain, the outcome of the request is reported on the slot."""
+
+    def __init__(self, domain, counted):
+        self.domain = domain
+        self.counted = counted  # False for requests of a thread that already holds a slot of the domain
+        self.started = time.monotonic()
+        self.outcome = "ok"
+        self.pause = None
+
+    def report(self, outcome, pause=None):
+        self.outcome, self.pause = outcome, pause
+
+
+class ConcurrencyController:
+    """Adaptive limits of all domains, shared by all threads of the process."""
+
+    def __init__(self):
+        self.domains = {}
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def _domain(self, domain):
+        if domain not in self.domains:
+            self.domains[domain] = DomainLimit(domain)
+        return self.domains[domain]
+
+    def _held(self):
+        if not hasattr(self._local, "held"):
+            self._local.held = {}
+        return self._local.held
+
+    def acquire(self, url, block=True):
+        """
+        Returns a slot for a request to url, waiting until its domain has capacity. Without block, None is returned at once if
+        the domain has no capacity (e.g. for opening one more tab while tabs of the same domain are loading).
+        """
+        domain = domain_of(url)
+        held = self._held()
+        with self._condition:
+            limit = self._domain(domain)
+            if block and held.get(domain):
+                return Slot(domain, counted=False)
+            with timed("wait"):
+                while not limit.has_capacity(time.monotonic()):
+                    if not block:
+                        return None
+                    self._condition.wait(max(min(limit.paused_until - time.monotonic(), 1.0), 0.05))
+            limit.in_flight += 1
+        held[domain] = held.get(domain, 0) + 1
+        return Slot(domain, counted=True)
+
+    def release(self, slot):
+        """Gives a slot back and adapts the limit of its domain to the reported outcome."""
+        with self._condition:
+            limit = self._domain(slot.domain)
+            limit.record(slot.outcome, time.monotonic() - slot.started, slot.started, slot.pause)
+            if slot.counted:
+                limit.in_flight -= 1
+                held = self._held()
+                held[slot.domain] -= 1
+            self._condition.notify_all()
+
+    def cancel(self, slot):
+        """Gives a slot back without reporting an outcome (e.g. for a tab closed before it was visited)."""
+        if not slot.counted:
+            return
+        with self._condition:
+            self._domain(slot.domain).in_flight -= 1
+            self._held()[slot.domain] -= 1
+            self._condition.notify_all()
+
+    def report(self, url, outcome):
+        """Reports an outcome only known after the request finished (e.g. an empty page) for the domain of url."""
+        with self._condition:
+            self._domain(domain_of(url)).record(outcome, None, time.monotonic())
+
+    @contextmanager
+    def slot(self, url):
+        """Context manager version of acquire() and release(), a request raising an exception counts as error."""
+        slot = self.acquire(url)
+        try:
+            yield slot
+        except Exception:
+            slot.report("error")
+            raise
+        finally:
+            self.release(slot)
+
+    def current_limit(self, url):
+        """Number of requests to the domain of url that may run at the same time right now."""
+        with self._condition:
+            return max(MIN_LIMIT, math.floor(self._domain(domain_of(url)).limit)) if CONCURRENCY_ENABLED else MAX_LIMIT
+
+    def request_counts(self):
+        """Number of requests with a reported outcome per domain (to find the domains a scraper talked to)."""
+        with self._condition:
+            return {domain: sum(limit.counts.values()) for domain, limit in self.domains.items()}
+
+    def summary(self, domains=None):
+        """Returns the limits and request outcomes of the given domains (all if None) as human readable table."""
+        lines = [f"{'domain':<32} {'limit':>5} {'range':>7} " + " ".join(f"{outcome:>7}" for outcome in OUTCOMES)]
+        with self._condition:
+            for domain, limit in sorted(self.domains.items()):
+                if domains is not None and domain not in domains:
+                    continue
+                lines.append(f"{domain:<32} {math.floor(limit.limit):>5} {math.floor(limit.lowest_limit):>3}-{math.floor(limit.highest_limit):<3} "
+                             + " ".join(f"{limit.counts[outcome]:>7}" for outcome in OUTCOMES))
+        return "\n".join(lines)
+
+
+# Controller shared by all scrapers of this process
+
+_controller = ConcurrencyController()
+
+
+def get_controller():
+    return _controller
+
+
+def request_slot(url):
+    """Context manager taking a slot of the domain of url from the shared controller (see ConcurrencyController.slot())."""
+    return _controller.slot(url)
+
+
+def report_outcome(url, outcome):
+    _controller.report(url, outcome)
+
+
+def current_limit(url):
+    return _controller.current_limit(url)
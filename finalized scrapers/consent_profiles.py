@@ -0,0 +1,133 @@
+# Consent profiles: remembering the answer to the cookie banner of a website between runs
+# Most websites show a consent dialog on the first visit and the scrapers waited up to 10 seconds for it and clicked it away
+# (meine_stadt even once per url). After a scraper answered the dialog, the cookies of the website (which contain the answer)
+# are stored in a consent profile per website (CONSENT_PROFILE_DIR/<site>.json). When a browser is leased for the website
+# (see driver_pool.py), the stored cookies are set in it before the first page is opened, so the website doesn't show the
+# dialog and the scraper skips that step:
+#
+#     driver = acquire_driver(site="rausgegangen")          # restores the consent profile if it is still valid
+#     driver.get(url)
+#     ensure_consent(driver, "rausgegangen", close_cookie_window)  # only clicks if nothing was restored
+#
+# A profile is only used while it is valid: its version matches CONSENT_VERSIONS (increased when a website changes its
+# dialog, which invalidates the stored answers), it is younger than CONSENT_MAX_AGE_DAYS and none of its cookies expired.
+# Otherwise the scraper clicks the dialog like before and the profile is stored again.
+# The browsers of the pool are shared by all websites, so instead of a Chrome user data folder per website (which would
+# need a browser per website) only the cookies of the website are stored and restored via the Chrome DevTools Protocol.
+
+# Imports
+
+from replay_cache import REPLAY_MODE
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import json
+import os
+import time
+
+
+# Folder of the consent profiles
+CONSENT_PROFILE_DIR = Path(os.getenv("CONSENT_PROFILE_DIR", "consent_profiles"))
+
+# Setting CONSENT_PROFILES=off ignores stored profiles, so the scrapers answer every dialog themselves
+CONSENT_ENABLED = os.getenv("CONSENT_PROFILES", "on") != "off"
+
+# Maximum age of a profile in days (websites ask again after some months, stored answers are refreshed before that)
+CONSENT_MAX_AGE_DAYS = int(os.getenv("CONSENT_MAX_AGE_DAYS", "30"))
+
+# Websites with a consent dialog: url whose cookies are stored and version of the profile
+CONSENT_VERSIONS = {
+    "eventim": ("https://www.eventim.de/", 1),
+    "kiel_sailing_city": ("https://kiel-sailing-city.de/", 1),
+    "meine_stadt": ("https://veranstaltungen.meinestadt.de/", 1),
+    "rausgegangen": ("https://rausgegangen.de/", 1),
+    "unser_luebeck": ("https://www.unser-luebeck.de/", 1),
+}
+
+# Properties of a cookie accepted by Network.setCookies
+COOKIE_PARAMS = ["name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires", "priority"]
+
+
+def profile_path(site):
+    return CONSENT_PROFILE_DIR / f"{site}.json"
+
+
+def load_profile(site):
+    """Returns the stored cookies of a website if its consent profile is valid, None otherwise."""
+    if not CONSENT_ENABLED or site not in CONSENT_VERSIONS or not profile_path(site).exists():
+        return None
+    try:
+        profile = json.loads(profile_path(site).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    if profile.get("version") != CONSENT_VERSIONS[site][1]:
+        return None
+    if datetime.fromisoformat(profile["saved_at"]) < datetime.now() - timedelta(days=CONSENT_MAX_AGE_DAYS):
+        return None
+    if any(0 < cookie.get("expires", -1) < time.time() for cookie in profile["cookies"]):
+        return None
+    return profile["cookies"] or None
+
+
+def restore_consent(driver, site):
+    """Sets the stored consent cookies of a website in a browser, returns whether a valid profile was restored."""
+    if REPLAY_MODE == "replay":
+        return False  # replayed pages are stored after the dialog was answered
+    cookies = load_profile(site)
+    if cookies is None:
+        return False
+    try:
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+    except Exception as e:
+        print(f"Consent profile of {site} could not be restored: {e}")
+        return False
+    driver.consent_sites.add(site)
+    return True
+
+
+def save_consent(driver, site):
+    """Stores the current cookies of a website as its consent profile (after the scraper answered the dialog)."""
+    if not CONSENT_ENABLED or site not in CONSENT_VERSIONS or REPLAY_MODE == "replay":
+        return
+    url, version = CONSENT_VERSIONS[site]
+    cookies = driver.execute_cdp_cmd("Network.getCookies", {"urls": [url]})["cookies"]
+    if not cookies:
+        return
+    profile = {
+        "site": site,
+        "version": version,
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "cookies": [cookie_param(cookie) for cookie in cookies],
+    }
+    # Written to a temporary file first, so a crash doesn't leave a broken profile behind
+    CONSENT_PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    temporary = profile_path(site).with_suffix(".tmp")
+    temporary.write_text(json.dumps(profile, ensure_ascii=False, indent=1), encoding="utf-8")
+    temporary.replace(profile_path(site))
+
+
+def ensure_consent(driver, site, answer_dialog):
+    """
+    Answers the consent dialog of a website with answer_dialog(driver), unless the browser already has the consent of the
+    website (restored from the profile or answered before in this browser). answer_dialog returns whether it answered the
+    dialog, only then the answer is stored as profile.
+    """
+    if site in driver.consent_sites:
+        return
+    if not answer_dialog(driver):
+        return
+    driver.consent_sites.add(site)
+    try:
+        save_consent(driver, site)
+    except Exception as e:
+        print(f"Consent profile of {site} could not be stored: {e}")
+
+
+def cookie_param(cookie):
+    # Cookies without expiry date (session cookies) are stored without "expires", so they are set as session cookies again
+    param = {key: cookie[key] for key in COOKIE_PARAMS if key in cookie}
+    if cookie.get("session") or param.get("expires", -1) <= 0:
+        param.pop("expires", None)
+    return param
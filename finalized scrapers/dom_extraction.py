@@ -0,0 +1,168 @@
+# Bulk extraction of event information from the loaded website
+# Instead of one WebDriver call per field and event (find_element(...).text, get_attribute(...)), all events of a page are read
+# by one JavaScript call that returns all records as JSON. The fields are described declaratively as a dictionary:
+#
+#     {"Subject": ("h2 a", "title"), "Source": ("h2 a", "href"), "Categories": ("span.tag", "text", "all")}
+#
+# Per field a CSS selector (relative to the event element, None for the event element itself) and what to read from the
+# found element: "text" (the visible text, like .text in Selenium), "html" (innerHTML) or the name of a property/attribute
+# (like get_attribute() in Selenium). With "all" as third entry a list with the values of all matching elements is returned.
+# Fields whose element doesn't exist are returned as None.
+# The same field dictionaries can be used on html fetched without a browser with extract_records_from_soup().
+# Lists growing with every click on "load more" are read step by step with an IncrementalHarvester, which only reads the newly
+# appended events and removes the events already read from the page, so every step costs the same and Chrome memory stays bounded.
+
+# Imports
+
+from time_accounting import timed_function
+from replay_cache import REPLAY_MODE
+
+from urllib.parse import urljoin
+import json
+import os
+
+
+# JavaScript executed in the browser, reads all fields of all events in a single call
+EXTRACT_RECORDS_SCRIPT = """
+var itemSelector = arguments[0], fields = arguments[1], root = arguments[2] || document, start = arguments[3] || 0, harvest = arguments[4];
+
+function read(element, attribute) {
+    if (element === null) { return null; }
+    if (attribute === 'text') { return (element.innerText || element.textContent || '').trim(); }
+    if (attribute === 'html') { return element.innerHTML; }
+    var value = element[attribute];
+    if (value === undefined || value === null || typeof value === 'object' || typeof value === 'function') {
+        value = element.getAttribute(attribute);
+    }
+    return value === null ? null : String(value);
+}
+
+var items = Array.from(root.querySelectorAll(itemSelector)).slice(start);
+if (harvest) {
+    items = items.filter(function (item) { return !item.hasAttribute('data-harvested'); });
+}
+
+var records = [];
+items.forEach(function (item) {
+    var record = {};
+    Object.keys(fields).forEach(function (name) {
+        var selector = fields[name][0], attribute = fields[name][1], all = fields[name][2] === 'all';
+        if (all) {
+            var elements = selector ? Array.from(item.querySelectorAll(selector)) : [item];
+            record[name] = elements.map(function (element) { return read(element, attribute); });
+        } else {
+            record[name] = read(selector ? item.querySelector(selector) : item, attribute);
+        }
+    });
+    records.push(record);
+});
+
+// Harvesting: marking the events as read and removing the ones read before (the last one stays as anchor for the list)
+if (harvest) {
+    items.forEach(function (item) { item.setAttribute('data-harvested', ''); });
+    if (harvest === 'remove') {
+        var read = Array.from(root.querySelectorAll(itemSelector)).filter(function (item) { return item.hasAttribute('data-harvested'); });
+        read.slice(0, -1).forEach(function (item) { item.remove(); });
+    }
+}
+return JSON.stringify(records);
+"""
+
+# Setting DOM_HARVEST_REMOVE=off keeps the events already read on the page (e.g. if a website stops loading without them)
+# While recording pages for replay they are always kept, so the snapshot of the page contains all events (see replay_cache.py)
+HARVEST_REMOVE = os.getenv("DOM_HARVEST_REMOVE", "on") != "off" and REPLAY_MODE != "record"
+
+
+@timed_function("extract")
+def extract_records(driver, item_selector, fields, root=None, start=0):
+    """
+    Extracts the fields of all elements matching item_selector with one round trip to the browser.
+
+    Args:
+        driver: Selenium WebDriver with the page loaded.
+        item_selector (str): CSS selector of the element representing one event.
+        fields (dict): Field name -> (selector, attribute) or (selector, attribute, "all").
+        root: Optional WebElement to search in instead of the whole document.
+        start (int): Number of matching elements to skip (e.g. the events already read before "load more" was clicked).
+
+    Returns:
+        list: One dictionary per event with the requested fields.
+    """
+    spec = {name: list(field) for name, field in fields.items()}
+    return json.loads(driver.execute_script(EXTRACT_RECORDS_SCRIPT, item_selector, spec, root, start))
+
+
+class IncrementalHarvester:
+    """
+    Reads a lazy-load list step by step: every call of harvest() returns the events appended since the last call and
+    removes the events read before from the page (except the last one, which stays as anchor for the list).
+
+        harvester = IncrementalHarvester(driver, '.event', fields)
+        events = harvester.harvest()
+        ... click on "load more" ...
+        wait_for_count_growth(driver, harvester.pending_selector, 0, timeout)
+        events = harvester.harvest()
+    """
+
+    def __init__(self, driver, item_selector, fields, remove=HARVEST_REMOVE):
+        self.driver = driver
+        self.item_selector = item_selector
+        self.spec = {name: list(field) for name, field in fields.items()}
+        self.mode = "remove" if remove else "mark"
+        self.harvested = 0
+
+        # CSS selector of the events not read yet (e.g. to wait until new events were appended)
+        self.pending_selector = ", ".join(f"{part.strip()}:not([data-harvested])" for part in item_selector.split(","))
+
+    @timed_function("extract")
+    def harvest(self):
+        """Returns the fields of all events not read yet (one round trip to the browser)."""
+        records = json.loads(self.driver.execute_script(EXTRACT_RECORDS_SCRIPT, self.item_selector, self.spec, None, 0, self.mode))
+        self.harvested += len(records)
+        return records
+
+
+def count_elements(driver, selector):
+    """Returns how many elements match a CSS selector (one round trip)."""
+    return driver.execute_script("return document.querySelectorAll(arguments[0]).length;", selector)
+
+
+@timed_function("extract")
+def extract_records_from_soup(soup, item_selector, fields, base_url=None):
+    """
+    Extracts the same fields as extract_records() from html parsed with BeautifulSoup (no browser needed).
+
+    Args:
+        soup: BeautifulSoup object (or tag) of the page.
+        item_selector (str): CSS selector of the element representing one event.
+        fields (dict): Field name -> (selector, attribute) or (selector, attribute, "all").
+        base_url (str): Url of the page, used to turn relative links into absolute ones like the browser does.
+    """
+    return [read_fields(item, fields, base_url) for item in soup.select(item_selector)]
+
+
+def read_fields(item, fields, base_url=None):
+    """Reads the fields (see extract_records_from_soup()) of one element parsed with BeautifulSoup."""
+    def read(element, attribute):
+        if element is None:
+            return None
+        if attribute == 'text':
+            return ' '.join(element.get_text(' ').split())
+        if attribute == 'html':
+            return element.decode_contents()
+        value = element.get(attribute)
+        if isinstance(value, list):
+            value = ' '.join(value)
+        if value is not None and attribute in ('href', 'src') and base_url:
+            value = urljoin(base_url, value)
+        return value
+
+    record = {}
+    for name, field in fields.items():
+        selector, attribute = field[0], field[1]
+        if len(field) > 2 and field[2] == 'all':
+            elements = item.select(selector) if selector else [item]
+            record[name] = [read(element, attribute) for element in elements]
+        else:
+            record[name] = read(item.select_one(selector) if selector else item, attribute)
+    return record
@@ -0,0 +1,408 @@
+# Shared pool of headless Chrome drivers for all scrapers
+# Instead of every scraper starting (and tearing down) its own Chrome, scrapers lease an already running browser from this pool
+# and hand it back when they are done. The pool limits how many Chrome processes run at the same time, checks that a browser
+# still responds before handing it out and replaces browsers after a configurable number of loaded pages.
+# Every lease applies the browser profile of the website (see browser_profiles.py), also to the tabs opened during the lease.
+# The page load strategy and the network log (see network_capture.py) can only be set when Chrome starts, so idle browsers are
+# handed out to websites with the same launch options first. The stored answer to the consent dialog of the website is set in
+# the browser on every lease (see consent_profiles.py). Every page and tab takes a slot of its domain from the shared concurrency
+# controller, so the pages loading at the same time adapt to what the website tolerates (see concurrency.py).
+
+# Imports
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.remote.command import Command
+from selenium.common.exceptions import JavascriptException
+from browser_profiles import apply_profile, browser_profile
+from consent_profiles import restore_consent
+from replay_cache import REPLAY_MODE, browser_url, count_page, record_snapshot
+from waiting import POLL_INTERVAL
+from time_accounting import set_page, timed
+from concurrency import classify_page, get_controller, request_slot
+
+from contextlib import contextmanager
+import atexit
+import os
+import threading
+import time
+
+
+# Maximum number of Chrome browsers running at the same time in this process
+POOL_SIZE = int(os.getenv("CHROME_POOL_SIZE", "2"))
+
+# Number of loaded pages after which a browser is replaced by a fresh one (keeps Chrome memory bounded)
+MAX_PAGES_PER_DRIVER = int(os.getenv("CHROME_MAX_PAGES", "300"))
+
+# Maximum number of tabs loading at the same time in one browser (see PooledChrome.iter_tabs() and PooledChrome.iter_ready_tabs(),
+# the adaptive limit of the domain may allow fewer)
+PARALLEL_TABS = int(os.getenv("CHROME_PARALLEL_TABS", "5"))
+
+# User agent used by scrapers of websites that block the default headless user agent
+DESKTOP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+def build_chrome_options(page_load_strategy="normal", capture_network=False):
+    # Options shared by all scrapers (union of the options the scrapers used individually before)
+    options = Options()
+    options.page_load_strategy = page_load_strategy
+    if capture_network:
+        # Network events of the pages are written to the performance log (only the network domain, see network_capture.py)
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")  # to avoid some rendering issues
+    options.add_argument("--window-size=1920,1080")  # to avoid window size issues
+    options.add_argument("--log-level=3")  # to suppress most logs
+    return options
+
+
+class PooledChrome(webdriver.Chrome):
+    """Chrome driver that counts the pages it loaded, so that the pool knows when to recycle it."""
+
+    def __init__(self, *args, page_load_strategy="normal", capture_network=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_load_strategy = page_load_strategy
+        self.capture_network = capture_network
+        self.launch_options = (page_load_strategy, capture_network)
+        self.pages_loaded = 0
+        self.snapshot_url = None
+        self.consent_sites = set()  # websites whose consent dialog was answered in this browser (kept in its cookies)
+        self.tab_settings = None  # user agent and browser profile of the current lease, applied to every new tab as well
+        self.default_user_agent = self.execute_script("return navigator.userAgent;")
+
+    def execute(self, driver_command, params=None):
+        # Every round trip to the browser is counted in the time profile of the scraper (see time_accounting.py)
+        with timed("load" if driver_command == Command.GET else "driver"):
+            return super().execute(driver_command, params)
+
+    def get(self, url):
+        set_page(url)
+        self.pages_loaded += 1
+        self.save_snapshot()
+        start = time.monotonic()
+        with request_slot(url) as slot:
+            super().get(browser_url(url))  # in replay mode the page is loaded from the replay archive (see replay_cache.py)
+            slot.report(classify_page(self))
+        count_page(time.monotonic() - start)
+        if REPLAY_MODE == "record":
+            self.snapshot_url = url
+
+    def iter_tabs(self, urls, ready=None, max_tabs=None):
+        """
+        Loads several urls at the same time, each in a new tab, and yields (url, handle) with the driver switched to one
+        tab after the other (in the order of urls). At most max_tabs tabs are loading at once (fewer if the domain currently
+        allows fewer, see concurrency.py), further urls are opened as soon as a tab was handed on. ready(driver) is called
+        on every tab before it is yielded (e.g. waiting until it loaded), the tab is closed when the next one is visited.
+        The tabs share the cookies of this browser.
+        """
+        self.save_snapshot()
+        main = self.current_window_handle
+        waiting = list(urls)
+        tabs = []  # (url, handle, slot)
+
+        try:
+            start = time.monotonic()
+            self._open_tabs(waiting, tabs, max_tabs, lambda url, handle, slot: (url, handle, slot))
+
+            while tabs:
+                url, handle, slot = tabs[0]
+                self.switch_to.window(handle)
+                set_page(url)
+                if ready is not None:
+                    ready(self)
+                # The tabs load in parallel, so only the time spent waiting for each of them counts as loading time
+                count_page(time.monotonic() - start)
+                slot.report(classify_page(self))
+                get_controller().release(slot)
+                if REPLAY_MODE == "record":
+                    record_snapshot(url, self.page_source)
+                tabs[0] = (url, handle, None)
+                yield url, handle
+                self.close()
+                tabs.pop(0)
+                start = time.monotonic()
+                self._open_tabs(waiting, tabs, max_tabs, lambda url, handle, slot: (url, handle, slot))
+        finally:
+            for url, handle, slot in tabs:
+                if slot is not None:
+                    get_controller().cancel(slot)
+                if handle in self.window_handles:
+                    self.switch_to.window(handle)
+                    self.close()
+            self.switch_to.window(main)
+
+    def iter_ready_tabs(self, urls, is_ready, max_tabs=None, timeout=10):
+        """
+        Like iter_tabs(), but yields (url, handle) in the order the tabs become ready instead of the order of urls: the open
+        tabs are checked in turn with is_ready(driver), which must return at once (e.g. whether the event list is there),
+        and the first ready tab is handed on, so a slow page doesn't hold up the pages behind it. A tab that is not ready
+        after timeout seconds is handed on anyway (e.g. a list without results). The tab is closed when the next one is
+        visited and the next url is opened in its place (as long as the domain allows, see iter_tabs()).
+        """
+        self.save_snapshot()
+        main = self.current_window_handle
+        waiting = list(urls)
+        tabs = []  # (url, handle, slot, time the tab was opened)
+
+        def next_ready_tab():
+            while True:
+                for tab in tabs:
+                    url, handle, slot, opened = tab
+                    self.switch_to.window(handle)
+                    try:
+                        ready = is_ready(self)
+                    except JavascriptException:
+                        ready = False  # the page is still being replaced
+                    if ready or time.monotonic() - opened >= timeout:
+                        # A tab that never became ready counts as empty page of its domain
+                        slot.report(classify_page(self) if ready else "empty")
+                        return tab
+                time.sleep(POLL_INTERVAL)
+
+        try:
+            start = time.monotonic()
+            self._open_tabs(waiting, tabs, max_tabs, lambda url, handle, slot: (url, handle, slot, time.monotonic()))
+
+            while tabs:
+                with timed("wait"):
+                    tab = next_ready_tab()
+                url, handle, slot, _ = tab
+                get_controller().release(slot)
+                set_page(url)
+                # The tabs load in parallel, so only the time spent waiting for a ready tab counts as loading time
+                count_page(time.monotonic() - start)
+                if REPLAY_MODE == "record":
+                    record_snapshot(url, self.page_source)
+                tabs[tabs.index(tab)] = tab = (url, handle, None, 0.0)
+                yield url, handle
+                self.close()
+                tabs.remove(tab)
+                start = time.monotonic()
+                self._open_tabs(waiting, tabs, max_tabs, lambda url, handle, slot: (url, handle, slot, time.monotonic()))
+        finally:
+            for url, handle, slot, _ in tabs:
+                if slot is not None:
+                    get_controller().cancel(slot)
+                if handle in self.window_handles:
+                    self.switch_to.window(handle)
+                    self.close()
+            self.switch_to.window(main)
+
+    def _open_tabs(self, waiting, tabs, max_tabs, make_tab):
+        # Opening the next waiting urls in new tabs while fewer than max_tabs tabs are loading and their domain has a free slot
+        # (without any loading tab, the first url waits for a slot)
+        controller = get_controller()
+        while waiting and len(tabs) < (max_tabs or PARALLEL_TABS):
+            slot = controller.acquire(waiting[0], block=not any(tab[2] is not None for tab in tabs))
+            if slot is None:
+                return
+            url = waiting.pop(0)
+            try:
+                handle = self._open_tab(url)
+            except Exception:
+                controller.cancel(slot)
+                raise
+            tabs.append(make_tab(url, handle, slot))
+
+    def _open_tab(self, url):
+        # Opening a url in a new tab (without switching to it) and returning the handle of the tab
+        # The settings of the lease are sent to the blank tab before the url is loaded in it, as they only apply to the tab
+        # they are sent to. The url is then loaded from the current tab by the name of the new one, so the driver doesn't wait
+        # for the page to load.
+        current = self.current_window_handle
+        known = set(self.window_handles)
+        name = f"pooled-tab-{self.pages_loaded}"
+        self.execute_script("window.open('about:blank', arguments[0]);", name)
+        handle = next(handle for handle in self.window_handles if handle not in known)
+        if self.tab_settings is not None:
+            self.switch_to.window(handle)
+            configure_tab(self, *self.tab_settings)
+            self.switch_to.window(current)
+        self.execute_script("window.open(arguments[0], arguments[1]);", browser_url(url), name)
+        self.pages_loaded += 1
+        return handle
+
+    def save_snapshot(self):
+        # In record mode the final state of a page is stored when the scraper leaves it
+        if self.snapshot_url is not None:
+            url, self.snapshot_url = self.snapshot_url, None
+            record_snapshot(url, self.page_source)
+
+    def reset(self):
+        # Closing additional tabs and leaving frames and the last website, so the next scraper starts from a blank tab
+        self.save_snapshot()
+        handles = self.window_handles
+        for handle in handles[1:]:
+            self.switch_to.window(handle)
+            self.close()
+        self.switch_to.window(handles[0])
+        self.switch_to.default_content()
+        super().get("about:blank")
+        if self.capture_network:
+            self.get_log("performance")  # the network events of the last scraper are thrown away
+
+
+def configure_tab(driver, user_agent, profile):
+    # Sending the user agent and the browser profile of a lease to the current tab of the driver (via the Chrome DevTools Protocol)
+    driver.execute_cdp_cmd("Network.setUserAgentOverride", {"userAgent": user_agent or driver.default_user_agent})
+    apply_profile(driver, profile)
+
+
+def launch_options(profile):
+    # Settings of a browser profile that can only be set when Chrome starts
+    return (profile["page_load_strategy"], profile["capture_network"])
+
+
+def create_chrome(page_load_strategy="normal", capture_network=False):
+    """Starts a new headless Chrome with the given launch options."""
+    return PooledChrome(
+        service=Service(),
+        options=build_chrome_options(page_load_strategy, capture_network),
+        page_load_strategy=page_load_strategy,
+        capture_network=capture_network,
+    )
+
+
+class DriverPool:
+    """Bounded pool of warm Chrome drivers that scrapers lease and give back."""
+
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_DRIVER, driver_factory=create_chrome):
+        self.size = size
+        self.max_pages = max_pages
+        self.driver_factory = driver_factory  # starts a browser with the launch options (page load strategy, network capture)
+        self._idle = []
+        self._created = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, user_agent=None, profile=None):
+        """Returns a healthy driver set up with the browser profile, waiting for a free one if the pool is exhausted."""
+        profile = profile or browser_profile(None)
+        options = launch_options(profile)
+        while True:
+            evicted = None
+            with self._condition:
+                while not self._idle and self._created >= self.size:
+                    self._condition.wait()
+                driver = next((idle for idle in reversed(self._idle) if idle.launch_options == options), None)
+                if driver is not None:
+                    self._idle.remove(driver)
+                elif self._created < self.size:
+                    self._created += 1
+                else:
+                    # All browsers are idle but started with other launch options, one of them makes room for a new one
+                    evicted = self._idle.pop(0)
+
+            if evicted is not None:
+                self._quit(evicted)
+            if driver is None:
+                try:
+                    driver = self.driver_factory(*options)
+                except Exception:
+                    self._forget()
+                    raise
+            elif not self._is_healthy(driver):
+                self._discard(driver)
+                continue
+
+            driver.tab_settings = (user_agent, profile)
+            configure_tab(driver, user_agent, profile)
+            return driver
+
+    def release(self, driver):
+        """Gives a driver back to the pool, recycling it if it is broken or loaded too many pages."""
+        try:
+            driver.reset()
+        except Exception:
+            self._discard(driver)
+            return
+
+        if driver.pages_loaded >= self.max_pages:
+            self._discard(driver)
+            return
+
+        with self._condition:
+            self._idle.append(driver)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, user_agent=None, profile=None):
+        """Context manager version of acquire() and release()."""
+        driver = self.acquire(user_agent=user_agent, profile=profile)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def replace(self, driver, user_agent=None, profile=None):
+        """Throws away a (crashed) driver and returns a fresh one in its place."""
+        self._discard(driver)
+        return self.acquire(user_agent=user_agent, profile=profile)
+
+    def close(self):
+        """Quits all idle drivers."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    def _discard(self, driver):
+        self._quit(driver)
+        self._forget()
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _forget(self):
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+
+# Pool shared by all scrapers running in this process (created when first needed)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool():
+    """Returns the driver pool shared by all scrapers of this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def acquire_driver(user_agent=None, site=None):
+    """
+    Leases a Chrome driver from the shared pool, set up with the browser profile of the website (see browser_profiles.py)
+    and with its stored consent (see consent_profiles.py).
+    """
+    driver = get_driver_pool().acquire(user_agent=user_agent, profile=browser_profile(site))
+    restore_consent(driver, site)
+    return driver
+
+
+def release_driver(driver):
+    """Hands a leased Chrome driver back to the shared pool."""
+    get_driver_pool().release(driver)
+
+
+def replace_driver(driver, user_agent=None, site=None):
+    """Throws away a crashed Chrome driver and leases a fresh one from the shared pool in its place."""
+    driver = get_driver_pool().replace(driver, user_agent=user_agent, profile=browser_profile(site))
+    restore_consent(driver, site)
+    return driver
@@ -0,0 +1,179 @@
+# Streaming scraper output
+# The scrapers yield their events one by one from a generator (iter_..._events()) instead of collecting all events in a list
+# and building the dataframe at the very end. collect_events() hands the events to a sink, which buffers them and flushes
+# them in batches (every BATCH_SIZE events or FLUSH_INTERVAL seconds, whichever comes first):
+#
+#     MemorySink     keeps the events in memory (the behaviour before sinks existed, default when running a script directly)
+#     JsonLinesSink  appends the events to a JSON lines file, so everything scraped so far is on disk if the scraper crashes
+#
+# Every flushed batch is complete on disk (one JSON object per line, written and synced at once), so other stages can read
+# the file while the scraper is still running (see read_events()). JSON lines keep the Python types of the raw events
+# (None, True/False, numbers), so the dataframe read back is the same as the one built from a list.
+#
+# collect_events() returns the dataframe for a MemorySink, but the sink itself for a JsonLinesSink: the events are not read
+# back into one dataframe, the caller reads them in chunks of CHUNK_SIZE events (iter_frames(), see scraper_registry.py),
+# so the memory needed doesn't grow with the number of events.
+
+# Imports
+
+from pathlib import Path
+
+import json
+import os
+import pandas as pd
+import time
+
+
+# Folder of the event files written by the scrapers run through the registry
+EVENT_SPOOL_DIR = Path(os.getenv("EVENT_SPOOL_DIR", "event_spool"))
+
+# Number of events after which a batch is flushed
+BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50"))
+
+# Maximum time in seconds events are buffered before they are flushed (slow websites yield few events per minute)
+FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "30"))
+
+# Number of events per dataframe when the events of a file are read back in chunks
+CHUNK_SIZE = int(os.getenv("EVENT_CHUNK_SIZE", "5000"))
+
+
+class EventSink:
+    """Receives the events of a scraper one by one and flushes them in batches."""
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, event):
+        """Adds one event, flushing the buffer if the batch is full or was buffered too long."""
+        self._buffer.append(event)
+        self.count += 1
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered events."""
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def frame(self):
+        """Returns all events written to this sink as dataframe."""
+        raise NotImplementedError
+
+    def result(self):
+        """What collect_events() returns for this sink."""
+        return self.frame()
+
+    def _write_batch(self, events):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Also flushing when the scraper failed, so the events scraped until then are kept
+        self.close()
+        return False
+
+
+class MemorySink(EventSink):
+    """Keeps all events in a list."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.events = []
+
+    def _write_batch(self, events):
+        self.events.extend(events)
+
+    def frame(self):
+        self.flush()
+        return pd.DataFrame(self.events)
+
+
+class JsonLinesSink(EventSink):
+    """Appends the events to a JSON lines file (append=False starts a new file)."""
+
+    def __init__(self, path, append=False, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not append:
+            self.path.write_text("")
+
+    def _write_batch(self, events):
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + "\n" for event in events)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def frame(self):
+        self.flush()
+        return pd.DataFrame(list(read_events(self.path)))
+
+    def iter_frames(self, chunk_size=CHUNK_SIZE):
+        """Yields the events of the file as dataframes of at most chunk_size events."""
+        self.flush()
+        chunk = []
+        for event in read_events(self.path):
+            chunk.append(event)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk)
+
+    def result(self):
+        # The events stay on disk, the caller reads them in chunks
+        return self
+
+
+def read_events(path):
+    """Yields the events of a JSON lines file (a last line cut off by a crash is skipped)."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def spool_sink(source, append=False):
+    """Returns the JSON lines sink of a scraper in EVENT_SPOOL_DIR."""
+    return JsonLinesSink(EVENT_SPOOL_DIR / f"{source}.jsonl", append=append)
+
+
+def collect_events(events, sink=None):
+    """
+    Hands the events of a generator to a sink and returns them: as dataframe of raw data for a MemorySink, the sink itself
+    for a JsonLinesSink (read its events in chunks with iter_event_frames()).
+
+    Args:
+        events: Generator (or any iterable) of event dictionaries.
+        sink (EventSink): Where to write the events, in memory if None.
+    """
+    sink = sink or MemorySink()
+    with sink:
+        for event in events:
+            sink.write(event)
+    return sink.result()
+
+
+def iter_event_frames(result, chunk_size=CHUNK_SIZE):
+    """Yields the events a scraper returned (a dataframe or a JsonLinesSink, see collect_events()) as dataframes."""
+    if isinstance(result, JsonLinesSink):
+        yield from result.iter_frames(chunk_size)
+    elif result is not None and not result.empty:
+        yield result
@@ -4,60 +4,65 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver
+from dom_extraction import extract_records
+from waiting import site_timeout, wait_for_elements, wait_for_network_idle
+from event_sink import collect_events
+from network_capture import SPA_CAPTURE, NetworkCapture, find_values, iter_event_records, normalize_record
 
-import pandas as pd
-import time
 from datetime import datetime, timedelta
 
 
 # Scraping function
 
-def scrape_eventbrite_hh_sh():
+def scrape_eventbrite_hh_sh(sink=None):
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_eventbrite_events(), sink)
 
-    # Preparations for scraping (setting options, instantiating the Chrome driver, specifying the urls to scrape, creating a dataframe to save the event data in)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
+
+def iter_eventbrite_events():
+
+    # Preparations for scraping (leasing a Chrome driver from the shared pool, specifying the urls to scrape)
     urls = ["https://www.eventbrite.de/d/germany--hamburg/music--events--this-month/?page=1",
         "https://www.eventbrite.de/d/germany--hamburg/music--events--next-month/?page=1",
         "https://www.eventbrite.de/d/germany--schleswig-holstein/music--events--this-month/?page=1",
         "https://www.eventbrite.de/d/germany--schleswig-holstein/music--events--next-month/?page=1"]
-    driver = webdriver.Chrome(service=Service(), options=options)
-    df_raw = pd.DataFrame()
-
-    # Iterating over the urls to scrape (urls are used as an api to stably navigate through the website regarding switching location and timeframe)
-    for url in urls:
-
-        # Opening each url and getting the event information from that page (with helper function)
-        driver.get(url)
-        events_df = get_events_on_page(driver)
-        df_raw = pd.concat([df_raw, events_df], ignore_index=True)
-
-        # Navigating through the pages if results per location and timeframe choice have several pages by modifying the page number specified in the url
-        try: 
-            pagination_element = driver.find_element(By.CSS_SELECTOR, '.Pagination-module__search-pagination__navigation-minimal___1eHd9')
-            pagination_text = pagination_element.text
-            max_pages = int(pagination_text[-1])
-            if max_pages > 1:
-                further_urls = []
-                for i in range (2,max_pages+1):
-                    further_urls.append(url[:-1] + str(i))
-                # Opening each new url and getting the event information from that page (with helper function)
-                for furl in further_urls:
-                    driver.get(furl)
-                    events_df = get_events_on_page(driver)
-                    df_raw = pd.concat([df_raw, events_df], ignore_index=True)
-        except Exception as e:
-            continue
-    # Last steps: Closing the driver and returning the dataframe of raw event data
-    driver.close()
-
-    return df_raw
+    driver = acquire_driver(site="eventbrite")
+
+    # The driver is handed back to the pool in any case, also if the generator is not consumed until the end
+    try:
+        # The result pages are rendered from JSON the page fetches, these responses are captured (see network_capture.py)
+        capture = NetworkCapture(driver) if SPA_CAPTURE and driver.capture_network else None
+
+        # Iterating over the urls to scrape (urls are used as an api to stably navigate through the website regarding switching location and timeframe)
+        for url in urls:
+
+            # Opening each url and yielding the event information from that page (with helper function)
+            driver.get(url)
+            events, max_pages = captured_events(driver, capture) if capture is not None else ([], None)
+            if not events:
+                # Fallback if nothing was captured: Reading the rendered event cards and the page count of the pagination
+                events = get_events_on_page(driver)
+                max_pages = read_page_count(driver)
+            yield from events
+
+            # Navigating through the pages if results per location and timeframe choice have several pages by modifying the page number specified in the url
+            try:
+                if max_pages and max_pages > 1:
+                    further_urls = []
+                    for i in range (2,max_pages+1):
+                        further_urls.append(url[:-1] + str(i))
+                    # Opening each new url and yielding the event information from that page (with helper function)
+                    for furl in further_urls:
+                        driver.get(furl)
+                        events = captured_events(driver, capture)[0] if capture is not None else []
+                        yield from events or get_events_on_page(driver)
+            except Exception as e:
+                continue
+    finally:
+        # Last step: Handing the driver back to the pool
+        release_driver(driver)
 
 
 # Preprocessing function
@@ -86,39 +91,84 @@ def preprocess_eventbrite(df_raw):
 
 # Helper functions and elements
 
+def captured_events(driver, capture):
+    # Helper function to bring the events of the captured JSON responses of a result page into the raw data format of the event cards,
+    # also returning the number of result pages given in the responses (None if not given)
+    wait_for_network_idle(driver, site_timeout("eventbrite"))
+    payloads = [payload for url, payload in capture.collect()]
+
+    events = []
+    for record in iter_event_records(payloads):
+        event = normalize_record(record, base_url='https://www.eventbrite.de/')
+        if event['url'] is None:
+            continue
+        events.append({
+            'Title': event['title'],
+            'Source': event['url'],
+            'City': event['city'] or ' ',
+            'Music_label': ', '.join(event['categories']),
+            'Date and time': format_date_and_time(event['start_date'], event['start_time']),
+            'Location': event['location'] or ' '
+        })
+
+    page_counts = [value for payload in payloads for value in find_values(payload, 'page_count') if isinstance(value, int)]
+    return events, max(page_counts) if page_counts else None
+
+
+def format_date_and_time(start_date, start_time):
+    # Writing date and time like the event cards do ("Sa., 17. Mai, 20:00", see extract_and_reformat_date())
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    weekdays = ['Mo.', 'Di.', 'Mi.', 'Do.', 'Fr.', 'Sa.', 'So.']
+    months = ['Jan.', 'Feb.', 'Mär.', 'Apr.', 'Mai', 'Jun.', 'Jul.', 'Aug.', 'Sep.', 'Okt.', 'Nov.', 'Dez.']
+    return f"{weekdays[day.weekday()]}, {day.day}. {months[day.month - 1]}, {start_time or '00:00'}"
+
+
+def read_page_count(driver):
+    # Reading the number of result pages from the pagination of the page (None if there is only one page)
+    try:
+        pagination_element = driver.find_element(By.CSS_SELECTOR, '.Pagination-module__search-pagination__navigation-minimal___1eHd9')
+        return int(pagination_element.text[-1])
+    except Exception:
+        return None
+
+
 def get_events_on_page(driver):
     # Helper function to retrieve all event information per page by extracting the information from the individual webelements related to the required information
-    time.sleep(5)
+    # Waiting until the event cards are rendered (up to the timeout of this website)
+    wait_for_elements(driver, '.event-card-details', site_timeout("eventbrite"))
 
-    # Finding all events per page, the specific web element representing an event is identified via class name 
-    event_cards = driver.find_elements(By.CLASS_NAME, 'event-card-details')
+    # Finding all events per page and extracting the required information with one call to the browser, the specific web element representing an event is identified via class name 
+    event_cards = extract_records(driver, '.event-card-details', card_fields)
 
     # List to store extracted event information
     events = []
 
-    # Iterating over all found event elements and extracting the required information from attributes and textual elements of specific web elements and storing them in dictionaries
+    # Iterating over all found events and storing the information from attributes and textual elements in dictionaries (cards with missing information are skipped)
     for card in event_cards:
-        try:
-            title = card.find_element(By.CLASS_NAME, 'event-card-link').get_attribute('aria-label')
-            source = card.find_element(By.CLASS_NAME, 'event-card-link').get_attribute('href')
-            city = card.find_element(By.CLASS_NAME, 'event-card-link').get_attribute('data-event-location')
-            music_label = card.find_element(By.CLASS_NAME, 'event-card-link').get_attribute('data-event-category')
-            date_time = card.find_element(By.XPATH, ".//p[contains(@class, 'event-card__clamp-line--one')][1]").text
-            location = card.find_element(By.XPATH, ".//p[contains(@class, 'event-card__clamp-line--one')][2]").text
-            
-            events.append({
-                'Title': title,
-                'Source': source,
-                'City': city,
-                'Music_label': music_label,
-                'Date and time': date_time,
-                'Location': location
-            })
-        except Exception as e:
+        lines = card['Lines']
+        if None in card.values() or len(lines) < 2:
             continue
+
+        events.append({
+            'Title': card['Title'],
+            'Source': card['Source'],
+            'City': card['City'],
+            'Music_label': card['Music_label'],
+            'Date and time': lines[0],
+            'Location': lines[1]
+        })
     
-    # Handing back the dataframe of events found on this page to the scraping function defined above
-    return pd.DataFrame(events)
+    # Handing back the events found on this page to the scraping function defined above
+    return events
+
+# Fields read from each event card (CSS selector and attribute per field, see dom_extraction.py)
+card_fields = {
+    'Title': ('.event-card-link', 'aria-label'),
+    'Source': ('.event-card-link', 'href'),
+    'City': ('.event-card-link', 'data-event-location'),
+    'Music_label': ('.event-card-link', 'data-event-category'),
+    'Lines': ('p.event-card__clamp-line--one', 'text', 'all'),
+}
 
 def check_music_label(label):
     # Function to check if an event is music related or not according to its category and provide the correct label
@@ -171,8 +221,9 @@ def convert_date(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_eventbrite_hh_sh()
-df_prep = preprocess_eventbrite(df_raw)
-df_prep.to_csv("Scraped_Events_HH_SH_Eventbrite.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_eventbrite_hh_sh()
+    df_prep = preprocess_eventbrite(df_raw)
+    df_prep.to_csv("Scraped_Events_HH_SH_Eventbrite.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -7,107 +7,98 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver, DESKTOP_USER_AGENT
+from waiting import site_timeout, wait_for_network_idle
+from event_sink import collect_events
+from consent_profiles import ensure_consent
 
 import pandas as pd
-import time
 from datetime import datetime, timedelta
 
 
 # Scraping function
 
-def scrape_eventim(days_in_advance=30): # Optional parameter for how many days in advance to scrape events for
+def scrape_eventim(days_in_advance=30, sink=None): # Optional parameter for how many days in advance to scrape events for
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_eventim_events(days_in_advance), sink)
+
+
+def iter_eventim_events(days_in_advance=30):
 
     # Preparing the date time frame to scrape according to days_in_advance parameter (getting current date and date x days in advance)
     today = datetime.today().date()
     today_plus_x = today + timedelta(days=days_in_advance)
 
-    # Preparations for scraping (setting options, defining the url with the chosen timeframe, instantiating the Chrome driver, opening the website, defining waits)
-    options = Options()
-    options.add_argument("--headless")  
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")  # to avoid some rendering issues
-    options.add_argument("--window-size=1920,1080")  # to avoid window size issues
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36") # to avoid being blocked as a headless scraper
+    # Preparations for scraping (defining the url with the chosen timeframe, leasing a Chrome driver from the shared pool, opening the website, defining waits)
     url = f"https://www.eventim.de/events/konzerte-1/?zipcode=24534&distance=100&shownonbookable=true&sort=DateAsc&dateFrom={today.year}-{today.month}-{today.day}&dateTo={today_plus_x.year}-{today_plus_x.month}-{today_plus_x.day}"
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get(url)
-    time.sleep(5)
-    wait = WebDriverWait(driver, 10)
+    driver = acquire_driver(user_agent=DESKTOP_USER_AGENT, site="eventim")
 
-    # Closing the cookie window
+    # The driver is handed back to the pool in any case, also if the page doesn't load or the generator is not consumed until the end
     try:
-        element = driver.find_element(By.ID, "cmpwelcomebtnno")
-        element.click()
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        driver.get(url)
+        wait_for_network_idle(driver, site_timeout("eventim"))
+        wait = WebDriverWait(driver, 10)
 
-    # Creating a list to store events
-    extracted_info = [] 
+        # Closing the cookie window (skipped if the consent stored in the profile of this website was restored, see consent_profiles.py)
+        ensure_consent(driver, "eventim", close_cookie_window)
 
-    # Iterating over all pages of results (the loop is left when there uis no more "next page" to navigate to)
-    while True:
+        # Iterating over all pages of results (the loop is left when there uis no more "next page" to navigate to)
+        while True:
         
-        # Trying to find all events per page, the specific web element representing an event is identified via CSS selector, unfortunately process often blocked due to denied access by eventim (see disclaimer)
-        try: 
-            elements = wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, "product-group-item")))
-            print(f"Number of elements found: {len(elements)}")
-        except Exception as e:
-            print(f"Error: {e}")
-            driver.save_screenshot("screenshot.png")  # save screenshot for debugging (showed access denied due to being blocked)
-
-        # Iterating over all found event elements and extracting the required information
-        # As sometimes not all information is available per event, this part was made robust by using try-except statements per event and specifically for error prone description element (element doesn't always exist)
-        for element in elements:
-            try:
-                title_element = element.find_element(By.CSS_SELECTOR, '[id^="listing-headline"]')
-                title = title_element.text
-
-                location_date_time_element = element.find_element(By.CSS_SELECTOR, ".text-overflow-ellipsis.u-text-color.theme-text-color")
-                location_date_time = location_date_time_element.text
+            # Trying to find all events per page, the specific web element representing an event is identified via CSS selector, unfortunately process often blocked due to denied access by eventim (see disclaimer)
+            try: 
+                elements = wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, "product-group-item")))
+                print(f"Number of elements found: {len(elements)}")
+            except Exception as e:
+                print(f"Error: {e}")
+                driver.save_screenshot("screenshot.png")  # save screenshot for debugging (showed access denied due to being blocked)
 
+            # Iterating over all found event elements and extracting the required information
+            # As sometimes not all information is available per event, this part was made robust by using try-except statements per event and specifically for error prone description element (element doesn't always exist)
+            for element in elements:
                 try:
-                    description_element = element.find_element(By.CSS_SELECTOR, ".listing-description.theme-text-color.text-overflow-ellipsis.hidden-xs")
-                    description = description_element.text
-                except Exception as e:
-                    description = None
+                    title_element = element.find_element(By.CSS_SELECTOR, '[id^="listing-headline"]')
+                    title = title_element.text
+
+                    location_date_time_element = element.find_element(By.CSS_SELECTOR, ".text-overflow-ellipsis.u-text-color.theme-text-color")
+                    location_date_time = location_date_time_element.text
+
+                    try:
+                        description_element = element.find_element(By.CSS_SELECTOR, ".listing-description.theme-text-color.text-overflow-ellipsis.hidden-xs")
+                        description = description_element.text
+                    except Exception as e:
+                        description = None
+
+                    source_element = element.find_element(By.CSS_SELECTOR, "a.btn.btn-sm.btn-block.btn-primary")
+                    source = source_element.get_attribute("href")
+
+                    # All information per event is stored into a dictionary and the dictionary is handed on
+                    yield {
+                        "Subject": title,
+                        "Location_Date_Time": location_date_time,
+                        "Description": description,
+                        "Source": source,
+                        "Category": "Konzert", # only concerts are scraped from this website
+                        "Music_label": True # all scraped events from this website are music related
+                    }
 
-                source_element = element.find_element(By.CSS_SELECTOR, "a.btn.btn-sm.btn-block.btn-primary")
-                source = source_element.get_attribute("href")
-
-                # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-                extracted_info.append({
-                    "Subject": title,
-                    "Location_Date_Time": location_date_time,
-                    "Description": description,
-                    "Source": source,
-                    "Category": "Konzert", # only concerts are scraped from this website
-                    "Music_label": True # all scraped events from this website are music related
-                })
-
-            except Exception as e:
-                continue
+                except Exception as e:
+                    continue
         
-        # Navigate to the next page of results (by clicking on the next page button) if it exists, if not leave the loop
-        try:
-            pagination_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "pagination-item a[data-qa='nextPage']")))
-            pagination_element.click()
-            time.sleep(5)
-        except Exception as e:
-            print("No more pages")
-            break
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(extracted_info)
-    driver.close()
-
-    return df_raw
+            # Navigate to the next page of results (by clicking on the next page button) if it exists, if not leave the loop
+            try:
+                pagination_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "pagination-item a[data-qa='nextPage']")))
+                pagination_element.click()
+                wait_for_network_idle(driver, site_timeout("eventim"))
+            except Exception as e:
+                print("No more pages")
+                break
+    finally:
+        # Last step: Handing the driver back to the pool
+        release_driver(driver)
 
 
 # Preprocessing function
@@ -134,6 +125,17 @@ def preprocess_eventim(df_raw):
 
 # Helper functions and elements
 
+def close_cookie_window(driver):
+    # Function to reject the cookies in the cookie window, returns whether it worked
+    try:
+        element = driver.find_element(By.ID, "cmpwelcomebtnno")
+        element.click()
+        return True
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return False
+
+
 def split_location_date_time(value):
     # Preprocessing function to split the information on location, date and time given jointly on the website
     parts = value.split(',')
@@ -156,8 +158,9 @@ def convert_date_format(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_eventim(30) 
-df_prep = preprocess_eventim(df_raw)
-df_prep.to_csv("Scraped_Events_Eventim_HH_SH.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_eventim(30) 
+    df_prep = preprocess_eventim(df_raw)
+    df_prep.to_csv("Scraped_Events_Eventim_HH_SH.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -0,0 +1,142 @@
+# Fetching pages without a browser for websites that render their event lists on the server
+# Every scraper declares a fetch strategy in FETCH_STRATEGIES: "http" pages are requested over a pooled keep-alive session
+# (several pages at the same time) and parsed with lxml, "browser" pages are loaded in Chrome from the shared driver pool.
+# If an http page doesn't contain the expected event elements (e.g. because the website needs JavaScript), the page is
+# automatically loaded again in the browser. Both ways return BeautifulSoup objects, so the scrapers parse them the same way.
+# Every request takes a slot of its domain from the shared concurrency controller, so parallel requests adapt to what the
+# website tolerates (see concurrency.py).
+
+# Imports
+
+from bs4 import BeautifulSoup
+from driver_pool import acquire_driver, release_driver, DESKTOP_USER_AGENT
+from replay_cache import http_adapter
+from waiting import site_timeout, wait_for_elements
+from time_accounting import bind_profile, set_page, timed, timed_function
+from concurrency import MAX_LIMIT, classify_response, current_limit, report_outcome, request_slot
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+import os
+import requests
+import threading
+
+
+# Fetch strategy per website ("http" or "browser"), websites not listed are loaded in the browser
+FETCH_STRATEGIES = {
+    "biunsinnorden": "http",
+    "live_gigs": "http",
+    "kiel_magazin": "http",
+    "neumuenster": "http",
+}
+
+# Setting FETCH_STRATEGY=browser forces all websites into the browser (e.g. for debugging)
+FORCED_STRATEGY = os.getenv("FETCH_STRATEGY")
+
+# Maximum number of pages requested at the same time by one call (the adaptive limit of the domain may allow fewer)
+PARALLEL_REQUESTS = int(os.getenv("HTTP_PARALLEL_REQUESTS", str(MAX_LIMIT)))
+
+# Session shared by all scrapers of this process (created when first needed)
+_session = None
+_session_lock = threading.Lock()
+
+
+def fetch_strategy(site):
+    """Returns how the pages of a website are fetched ("http" or "browser")."""
+    return FORCED_STRATEGY or FETCH_STRATEGIES.get(site, "browser")
+
+
+def get_session():
+    """Returns the keep-alive session shared by all scrapers of this process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers["User-Agent"] = DESKTOP_USER_AGENT
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+            adapter = http_adapter(pool_connections=20, pool_maxsize=max(PARALLEL_REQUESTS, MAX_LIMIT) * 2, max_retries=retries)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+@timed_function("extract")
+def parse_html(html):
+    """Parses html with the fast lxml parser."""
+    return BeautifulSoup(html, "lxml")
+
+
+def request_page(url, site, method="get", **kwargs):
+    """Requests url over the shared session in a slot of its domain (see concurrency.py) and returns the response."""
+    set_page(url)
+    with request_slot(url) as slot:
+        with timed("load"):
+            response = get_session().request(method, url, timeout=site_timeout(site), **kwargs)
+        slot.report(*classify_response(response))
+    return response
+
+
+def fetch_html(url, site):
+    """Requests one page over http and returns its html."""
+    response = request_page(url, site)
+    response.raise_for_status()
+    return response.text
+
+
+def fetch_with_browser(url, site, ready_selector=None):
+    """Loads one page in a pooled Chrome, waits for the event elements and returns the parsed page."""
+    driver = acquire_driver(site=site)
+    try:
+        driver.get(url)
+        if ready_selector:
+            wait_for_elements(driver, ready_selector, site_timeout(site))
+        return parse_html(driver.page_source)
+    finally:
+        release_driver(driver)
+
+
+def fetch_page(url, site, ready_selector=None):
+    """
+    Fetches one page with the strategy of the website and returns it parsed.
+
+    Args:
+        url (str): Url of the page.
+        site (str): Name of the website (see FETCH_STRATEGIES and waiting.SITE_TIMEOUTS).
+        ready_selector (str): CSS selector of the event elements, if the http page doesn't contain any, the browser is used.
+    """
+    if fetch_strategy(site) == "http":
+        try:
+            soup = parse_html(fetch_html(url, site))
+            if ready_selector is None or soup.select_one(ready_selector) is not None:
+                return soup
+            report_outcome(url, "empty")
+            print(f"No events in the http response of {url}, loading it in the browser.")
+        except requests.RequestException as e:
+            print(f"Requesting {url} failed ({e}), loading it in the browser.")
+    return fetch_with_browser(url, site, ready_selector)
+
+
+def fetch_pages(urls, site, ready_selector=None, max_workers=PARALLEL_REQUESTS):
+    """Fetches several pages at the same time (in the order of urls) and returns them parsed."""
+    if fetch_strategy(site) != "http":
+        max_workers = 1  # pages in the browser are loaded one after another from the shared pool
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(bind_profile(lambda url: fetch_page(url, site, ready_selector)), urls))
+
+
+def iter_pages(urls, site, ready_selector=None, max_workers=PARALLEL_REQUESTS):
+    """
+    Yields (url, page) for several pages in the order of urls, fetching up to max_workers pages at the same time (as many as
+    the website currently allows, see concurrency.py). The next batch is only requested when the previous one was consumed,
+    so a scraper can stop early without fetching all pages.
+    """
+    if fetch_strategy(site) != "http":
+        max_workers = 1  # pages in the browser are loaded one after another from the shared pool
+    urls = list(urls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        start = 0
+        while start < len(urls):
+            # Every batch is as large as the website currently allows
+            batch = urls[start:start + min(max_workers, current_limit(urls[start]))]
+            yield from zip(batch, executor.map(bind_profile(lambda url: fetch_page(url, site, ready_selector)), batch))
+            start += len(batch)
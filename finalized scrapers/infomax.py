@@ -0,0 +1,320 @@
+# Shared engine for event calendars embedded from infomaxnet.de (used by hamburg_de.py and sh-tourismus.py)
+# Both websites embed the same Infomax event widget, which shows a first page of results and loads further pages with a
+# "load more" button. Instead of clicking that button hundreds of times in Chrome, this engine requests the result pages of
+# the widget directly over HTTP (several pages in parallel) and parses them with BeautifulSoup. If the widget doesn't deliver
+# events without JavaScript, it falls back to the browser and clicks through the list like before.
+# A website is described by a small configuration dictionary:
+#
+#     {"name": "hamburg_de", "url": "https://hamburgwhl.infomaxnet.de/veranstaltungen/", "widget_token": "0kPi6WAFtDs.",
+#      "default_city": "Hamburg", "search_without_date": True}
+
+# Imports
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from bs4 import BeautifulSoup
+from driver_pool import acquire_driver, release_driver
+from dom_extraction import IncrementalHarvester
+from http_fetch import request_page
+from waiting import site_timeout, wait_for_count_growth, wait_for_network_idle
+from event_sink import collect_events
+from pagination import PaginationController
+from concurrency import MAX_LIMIT, current_limit
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse, parse_qsl, urlencode, urlunparse
+import requests
+
+
+# Maximum number of result pages requested at the same time (the adaptive limit of the domain may allow fewer, see concurrency.py)
+PARALLEL_PAGES = MAX_LIMIT
+
+# CSS selectors of the widget
+ARTICLE_SELECTOR = 'article.-IMXEVNT-listElement'
+LAZY_LOAD_SELECTOR = '.-IMXEVENT-lazyLoadButton'
+DATE_WITHOUT_INPUT_ID = 'search_dateWithout_1'
+
+# Fields read from each event article (CSS selector and attribute per field, see dom_extraction.py)
+ARTICLE_FIELDS = {
+    'Category': ('p.-IMXEVNT-listElement__text__subline', 'text'),
+    'Title': ('span.-IMXEVNT-title', 'data-uppertitle'),
+    'Info': ('p.-IMXEVNT-listElement__text__info', 'text'),
+    'Source': ('h2 a', 'href'),
+}
+
+
+# Scraping function
+
+def scrape_infomax(widget, days_in_advance=10, sink=None):
+    """
+    Scrapes all events of an Infomax event widget and returns the raw data as dataframe.
+
+    Args:
+        widget (dict): Configuration of the widget (see top of this file).
+        days_in_advance (int): Number of days in advance to scrape events for.
+        sink (EventSink): Where the events are streamed to while scraping (in memory if None, see event_sink.py).
+    """
+    return collect_events(iter_infomax_events(widget, days_in_advance), sink)
+
+
+def iter_infomax_events(widget, days_in_advance=10):
+    """Yields the events of an Infomax event widget page by page (see scrape_infomax())."""
+    # Heuristic of how many result pages to load at most to minimally cover the chosen number of days in advance (one page per former click)
+    # The list is sorted by date, so loading stops as soon as a page reaches beyond the days in advance (see pagination.py)
+    max_pages = days_in_advance*30 + 100
+
+    received = 0
+    with PaginationController(widget['name'], max_pages=max_pages, horizon_days=days_in_advance) as pager:
+        try:
+            for articles in iter_article_pages_over_http(widget, max_pages):
+                received += len(articles)
+                for article in articles:
+                    yield shape_article(article, widget)
+                if not pager.add_page([article['Info'] for article in articles]):
+                    break
+        except requests.RequestException as e:
+            print(f"Requesting the widget over HTTP failed after {received} events: {e}")
+
+    # Events already handed on are kept, the browser is only used if HTTP delivered nothing
+    if not received:
+        print("No events received over HTTP, falling back to the browser.")
+        with PaginationController(widget['name'], max_pages=max_pages, horizon_days=days_in_advance) as pager:
+            for article in iter_articles_with_browser(widget, pager):
+                yield shape_article(article, widget)
+
+
+# Fetching over HTTP
+
+def widget_url(widget):
+    # Url of the widget with its token
+    return f"{widget['url']}?{urlencode({'widgetToken': widget['widget_token']})}"
+
+
+def iter_article_pages_over_http(widget, max_pages):
+    # Requesting the first result page (with the "without date" search if configured), then all further pages in parallel batches
+    # The articles are yielded as one list per page (the next batch is only requested when the previous one was consumed)
+    response = request_page(widget_url(widget), widget['name'])
+    response.raise_for_status()
+    soup = BeautifulSoup(response_html(response), 'lxml')
+    page_url = response.url
+    if widget.get('search_without_date'):
+        soup, page_url = submit_search_without_date(soup, page_url, widget)
+
+    articles = parse_articles(soup, page_url)
+    yield articles
+    next_url = lazy_load_url(soup, page_url)
+    if not articles or next_url is None:
+        return
+
+    def fetch(url):
+        response = request_page(url, widget['name'])
+        response.raise_for_status()
+        return parse_articles(BeautifulSoup(response_html(response), 'lxml'), url)
+
+    # If the page number can't be recognized in the url of the "load more" button, the pages are followed one by one
+    template = page_url_template(next_url)
+    if template is None:
+        for i in range(max_pages - 1):
+            response = request_page(next_url, widget['name'])
+            soup = BeautifulSoup(response_html(response), 'lxml')
+            new_articles = parse_articles(soup, next_url)
+            next_url = lazy_load_url(soup, next_url)
+            if new_articles:
+                yield new_articles
+            if not new_articles or next_url is None:
+                break
+        return
+
+    # Fetching the following pages in parallel batches (as large as the website currently allows) until a page without events is reached
+    first_page, make_url = template
+    last_page = first_page + max_pages - 2
+    with ThreadPoolExecutor(max_workers=PARALLEL_PAGES) as executor:
+        page = first_page
+        while page <= last_page:
+            batch_size = min(PARALLEL_PAGES, current_limit(page_url))
+            batch = [make_url(number) for number in range(page, min(page + batch_size, last_page + 1))]
+            finished = False
+            for page_articles in executor.map(fetch, batch):
+                if not page_articles:
+                    finished = True
+                    break
+                yield page_articles
+            if finished:
+                break
+            page += batch_size
+
+
+def submit_search_without_date(soup, page_url, widget):
+    # Submitting the search form of the widget with the option "without date" checked (more stable than a specific timeframe)
+    checkbox = soup.find('input', id=DATE_WITHOUT_INPUT_ID)
+    form = checkbox.find_parent('form') if checkbox is not None else None
+    if form is None:
+        return soup, page_url
+
+    data = {}
+    for field in form.find_all(['input', 'select']):
+        name = field.get('name')
+        if not name:
+            continue
+        if field.name == 'select':
+            option = field.find('option', selected=True) or field.find('option')
+            data[name] = option.get('value', option.get_text()) if option is not None else ''
+        elif field.get('type') in ('checkbox', 'radio'):
+            if field.has_attr('checked'):
+                data[name] = field.get('value', 'on')
+        elif field.get('type') != 'submit':
+            data[name] = field.get('value', '')
+    data[checkbox['name']] = checkbox.get('value', 'on')
+
+    action = urljoin(page_url, form.get('action') or page_url)
+    if form.get('method', 'get').lower() == 'post':
+        response = request_page(action, widget['name'], method='post', data=data)
+    else:
+        response = request_page(action, widget['name'], params=data)
+    response.raise_for_status()
+    return BeautifulSoup(response_html(response), 'lxml'), response.url
+
+
+def response_html(response):
+    # Result pages are either plain html or JSON containing the html fragment of the new events
+    if 'json' not in response.headers.get('Content-Type', ''):
+        return response.text
+    fragments = []
+
+    def collect(value):
+        if isinstance(value, str) and '<' in value:
+            fragments.append(value)
+        elif isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item)
+
+    collect(response.json())
+    return '\n'.join(fragments)
+
+
+def lazy_load_url(soup, page_url):
+    # Url behind the "load more" button of the widget (if it has one)
+    button = soup.select_one(LAZY_LOAD_SELECTOR)
+    if button is None:
+        return None
+    for attribute in ('href', 'data-href', 'data-url', 'data-ajax-url', 'data-next'):
+        if button.get(attribute) and not button.get(attribute).startswith(('#', 'javascript')):
+            return urljoin(page_url, button.get(attribute))
+    return None
+
+
+def page_url_template(url):
+    # Recognizing the page number in the query of a url, returns the page number and a function creating the url of another page
+    parts = urlparse(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for index, (key, value) in enumerate(query):
+        if value.isdigit() and 'page' in key.lower():
+            def make_url(number, index=index, key=key):
+                new_query = list(query)
+                new_query[index] = (key, str(number))
+                return urlunparse(parts._replace(query=urlencode(new_query)))
+            return int(value), make_url
+    return None
+
+
+def parse_articles(soup, page_url):
+    # Reading the same fields from the html as the browser extraction (see ARTICLE_FIELDS)
+    articles = []
+    for article in soup.select(ARTICLE_SELECTOR):
+        record = {}
+        for name, (selector, attribute) in ARTICLE_FIELDS.items():
+            element = article.select_one(selector)
+            if element is None:
+                record[name] = None
+            elif attribute == 'text':
+                record[name] = element.get_text(' ', strip=True)
+            elif attribute == 'href':
+                record[name] = urljoin(page_url, element.get('href')) if element.get('href') else None
+            else:
+                record[name] = element.get(attribute)
+        articles.append(record)
+    return articles
+
+
+# Fallback: Clicking through the widget in the browser
+
+def iter_articles_with_browser(widget, pager):
+    # Opening the widget, optionally searching without date, clicking the "load more" button as often as needed and extracting all events
+    # The events are read step by step: after each click only the newly appended events are extracted and the events read before are
+    # removed from the page (see dom_extraction.py), the pagination controller decides whether they still lie within the days in advance
+    driver = acquire_driver(site=widget['name'])
+    try:
+        wait = WebDriverWait(driver, 10)
+        driver.get(widget_url(widget))
+        wait_for_network_idle(driver, site_timeout(widget['name']))
+
+        if widget.get('search_without_date'):
+            try:
+                ohne_datum_label = wait.until(EC.element_to_be_clickable((By.XPATH, f"//label[@for='{DATE_WITHOUT_INPUT_ID}']")))
+                ohne_datum_label.click()
+                wait_for_network_idle(driver, site_timeout(widget['name']))
+                submit_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and contains(text(), 'Jetzt Veranstaltungen suchen')]")))
+                submit_button.click()
+                wait_for_network_idle(driver, site_timeout(widget['name']))  # the first events are read right away
+            except Exception as e:
+                print(f"Search without date not possible: {e}")
+
+        # After each click it is only waited until new events were appended to the list (instead of a fixed waiting time)
+        harvester = IncrementalHarvester(driver, ARTICLE_SELECTOR, ARTICLE_FIELDS)
+        articles = harvester.harvest()
+        yield from articles
+        pager.add_page(article['Info'] for article in articles)
+        while pager.should_continue():
+            try:
+                button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, LAZY_LOAD_SELECTOR)))
+                button.click()
+            except StaleElementReferenceException:
+                pager.add_page([])  # counts as attempt, so that the loop stays bounded by the maximum number of pages
+                continue
+            except TimeoutException:
+                print("Button not found or not clickable within the timeout period.")
+                break
+            wait_for_count_growth(driver, harvester.pending_selector, 0, site_timeout(widget['name']))
+            articles = harvester.harvest()
+            yield from articles
+            pager.add_page(article['Info'] for article in articles)
+    finally:
+        release_driver(driver)
+
+
+# Shaping the events
+
+def shape_article(article, widget):
+    # Splitting the info line ("date / time / location, city") and filling missing information with ' ' (or the default city of the widget)
+    event_date_location = article['Info'] or ' '
+    if event_date_location != ' ':
+        parts = [x.strip() for x in event_date_location.split('/')]
+    else:
+        parts = []
+
+    if len(parts) >= 3:
+        date, time_x, location = parts[0], parts[1], ' / '.join(parts[2:])
+    elif len(parts) == 2:
+        date, time_x, location = parts[0], parts[1], ''
+    else:
+        date, time_x, location = ' ', ' ', ' '
+
+    if ',' in location:
+        location, city = [x.strip() for x in location.rsplit(',', 1)]
+    else:
+        location, city = location, widget.get('default_city', ' ')
+
+    return {
+        'Category': article['Category'] or ' ',
+        'Title': article['Title'] or ' ',
+        'Date': date,
+        'Time': time_x,
+        'Location': location,
+        'City': city,
+        'Source': article['Source'] or ' '
+    }
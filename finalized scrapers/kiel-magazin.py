@@ -4,79 +4,56 @@
 
 # Imports
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-
-import pandas as pd
-import time
+from http_fetch import fetch_page, fetch_pages
+from dom_extraction import extract_records_from_soup
+from event_sink import collect_events
+
+import re
 from datetime import datetime, timedelta
 
 
 # Scraping function
 
-def scrape_kiel_magazin(days_in_advance=30): # Optional parameter for how many days in advance to scrape events for
+def scrape_kiel_magazin(days_in_advance=30, sink=None): # Optional parameter for how many days in advance to scrape events for
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_kiel_magazin_events(days_in_advance), sink)
+
+
+def iter_kiel_magazin_events(days_in_advance=30):
 
     # Preparing the date time frame to scrape according to days_in_advance parameter
     days_in_advance = days_in_advance
     today = datetime.today().date()
     today_plus_x = today + timedelta(days=days_in_advance)
-    i = 1
-
-    # Preparations for scraping (setting options, instantiating the Chrome driver, preparing the url with the specified time frame, opening the website, defining waits)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    url = f"https://www.kiel-magazin.de/veranstaltungssuche/konzerte/0/{today.year}-{today.month:02d}-{today.day:02d}/{today_plus_x.year}-{today_plus_x.month:02d}-{today_plus_x.day:02d}/0/{i}"
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get(url)
-    time.sleep(5)
-    wait = WebDriverWait(driver, 10)
-
-    # Creating a list to store events
-    events = []
-
-    # Closing the cookie window if it appears when opening the website
-    try:
-        button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button.button.ccm--save-settings.ccm--button-primary.ccm--ctrl-init[data-full-consent="true"]')))
-        button.click()
-    except Exception as e:
-        print(f"An error occurred: {e}")
+
+    # Preparations for scraping (preparing the url with the specified time frame per page number, opening the website without a browser as the events are rendered on the server, see http_fetch.py)
+    def page_url(i):
+        return f"https://www.kiel-magazin.de/veranstaltungssuche/konzerte/0/{today.year}-{today.month:02d}-{today.day:02d}/{today_plus_x.year}-{today_plus_x.month:02d}-{today_plus_x.day:02d}/0/{i}"
+    first_page = fetch_page(page_url(1), "kiel_magazin", ready_selector='article.card.card__event')
 
     # Finding out how many pages of events exist to navigate through (if the element is not found a default of 5 pages is set (heuristic))
     try:
-        h1_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'h1.color-blue.section__hl.event__search--hl'))
-        )
-        x = int(h1_element.text.split("/")[-1])
+        h1_element = first_page.select_one('h1.color-blue.section__hl.event__search--hl')
+        x = int(h1_element.get_text().split("/")[-1])
     except Exception as e:
         print("Page element not found")
         x = 5
 
-    # Iterating over the number of pages to navigate through, Navigation is done by using the url as an api where the page number (i) is modified 
-    for i in range(1,x+1):
+    # Requesting all further pages at the same time, Navigation is done by using the url as an api where the page number (i) is modified 
+    pages = [first_page] + fetch_pages([page_url(i) for i in range(2,x+1)], "kiel_magazin", ready_selector='article.card.card__event')
+    for i, page in enumerate(pages, start=1):
 
-        url = f"https://www.kiel-magazin.de/veranstaltungssuche/konzerte/0/{today.year}-{today.month:02d}-{today.day:02d}/{today_plus_x.year}-{today_plus_x.month:02d}-{today_plus_x.day:02d}/0/{i}"
-        driver.get(url)
-        time.sleep(5)
+        # Finding all events per page and extracting the required information, the specific web element representing an event is identified via CSS selector
+        articles = extract_records_from_soup(page, 'article.card.card__event', article_fields, base_url=page_url(i))
 
-        # Finding all events per page, the specific web element representing an event is identified via CSS selector
-        articles = wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'article.card.card__event')))
-
-        # Iterating over all found event elements and extracting the required information
+        # Iterating over all found events and bringing the extracted information into shape
         # Special handling of different date formats, if contains "from" only the first date of the event is kept
         for article in articles:
             try:
-                title_element = article.find_element(By.CSS_SELECTOR, 'a.card-link')
-                title = title_element.get_attribute('title')[19:-1]
-                source_url = title_element.get_attribute('href')
+                title = article['Title'][19:-1]
+                source_url = article['Source']
 
-                date_and_location_element = article.find_element(By.CSS_SELECTOR, 'p.card-date')
-                date_and_location = date_and_location_element.get_attribute('innerHTML').split('<br>')
+                date_and_location = re.split(r'<br\s*/?>', article['Date_Location'])
 
                 date = date_and_location[0].strip()
                 date = date.split(',')[1]
@@ -89,10 +66,9 @@ def scrape_kiel_magazin(days_in_advance=30): # Optional parameter for how many d
 
                 location = date_and_location[1].strip() if len(date_and_location) > 1 else ""
 
-                category_element = article.find_element(By.CSS_SELECTOR, 'p.card-category')
-                category = category_element.text.strip()
+                category = article['Category'].strip()
 
-                # All information per event is stored into a dictionary and the dictionary is appended to the list of events
+                # All information per event is stored into a dictionary and the dictionary is handed on
                 event = {
                     "Subject": title,
                     "Description": source_url,
@@ -105,16 +81,10 @@ def scrape_kiel_magazin(days_in_advance=30): # Optional parameter for how many d
                     "Category": category,
                     "Music_label": True
                 }
-                events.append(event)
             except Exception as e:
                 print(f"An error occurred while processing an article: {e}")
                 continue
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(events)
-    driver.close()
-
-    return df_raw
+            yield event
 
 
 # Preprocessing function
@@ -133,6 +103,14 @@ def preprocess_kiel_magazin(df_raw):
 
 # Helper functions and elements
 
+# Fields read from each event article (CSS selector and attribute per field, see dom_extraction.py)
+article_fields = {
+    'Title': ('a.card-link', 'title'),
+    'Source': ('a.card-link', 'href'),
+    'Date_Location': ('p.card-date', 'html'),
+    'Category': ('p.card-category', 'text'),
+}
+
 def add_leading_zero_to_day(date_str):
     # Adds a zero in front of single digit days (e.g. from 1. Dezember to 01. Dezember)
     parts = date_str.split('. ')
@@ -167,8 +145,9 @@ month_mapping = {
 
 # Recommended usage of the above functions
 
-df_raw = scrape_kiel_magazin(30)
-df_prep = preprocess_kiel_magazin(df_raw)
-df_prep.to_csv("Scraped_Events_Kiel_Magazin.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_kiel_magazin(30)
+    df_prep = preprocess_kiel_magazin(df_raw)
+    df_prep.to_csv("Scraped_Events_Kiel_Magazin.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -4,44 +4,65 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver
+from dom_extraction import extract_records
+from waiting import site_timeout, wait_for_network_idle
+from event_sink import collect_events
+from consent_profiles import ensure_consent
+from network_capture import SPA_CAPTURE, NetworkCapture, iter_event_records, normalize_record
 
 import pandas as pd
 from datetime import datetime, timedelta
-import time
 
 
 # Scraping function
 
-def scrape_kiel_sailing_city(days_in_advance=10): # Optional parameter for how many days in advance to scrape events for
+def scrape_kiel_sailing_city(days_in_advance=10, sink=None): # Optional parameter for how many days in advance to scrape events for
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_kiel_sailing_city_events(days_in_advance), sink)
+
+
+def iter_kiel_sailing_city_events(days_in_advance=10):
     
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(), options=options)
+    # Preparations for scraping (leasing a Chrome driver from the shared pool, opening the website)
+    # The calendar is rendered from JSON the page fetches, these responses are captured (see network_capture.py)
+    driver = acquire_driver(site="kiel_sailing_city")
+    try:
+        all_data, captured = read_calendar_events(driver, days_in_advance)
+    finally:
+        # All events are read at once, so the driver is handed back to the pool (also if reading failed) before the events are handed on
+        release_driver(driver)
+
+    if captured:
+        print(f"kiel_sailing_city: {len(all_data)} events taken from the captured responses.")
+        yield from all_data
+        return
+
+    # Splitting up date and time details and replacing the string "today" with the current date (with helper function),
+    # the already preprocessed Time Details are dropped
+    current_date = datetime.now().strftime('%d.%m.%Y')
+    for item in all_data:
+        date, time_clock = parse_time_details(item.pop('Time Details'), current_date=current_date)
+        item['Date'] = date
+        item['Time'] = time_clock
+        yield item
+
+
+def read_calendar_events(driver, days_in_advance):
+    """Returns the raw events of the calendar and whether they were taken from the captured responses."""
+    capture = NetworkCapture(driver) if SPA_CAPTURE and driver.capture_network else None
     driver.get('https://kiel-sailing-city.de/veranstaltungen/kalender')
-    time.sleep(5)
+    wait_for_network_idle(driver, site_timeout("kiel_sailing_city"))
 
-    # Closing the cookie window
-    try:
-        decline_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.cm-btn.cm-btn-danger.cn-decline"))
-        )
-        decline_button.click()
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    # Closing the cookie window (skipped if the consent stored in the profile of this website was restored, see consent_profiles.py)
+    ensure_consent(driver, "kiel_sailing_city", close_cookie_window)
 
     # Generating a string of the timeframe to scrape events for (with helper function)
     new_date_string = generate_new_day_string(days_in_advance=days_in_advance)
     print(new_date_string)
-    time.sleep(2)
 
     # Entering the defined timeframe into the filtering input field on the website (showed as stable)
     try:
@@ -54,17 +75,21 @@ def scrape_kiel_sailing_city(days_in_advance=10): # Optional parameter for how m
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    time.sleep(2)
+    wait_for_network_idle(driver, site_timeout("kiel_sailing_city"))
 
-    # Creating a list to store events
-    all_data = []
+    # Taking the events from the captured responses of the filtered calendar, without scrolling through the rendered list
+    all_data = captured_events(capture, days_in_advance) if capture is not None else []
+    if all_data:
+        return all_data, True
+
+    # Fallback if nothing was captured: Reading the rendered list
 
     # Navigation: Scrolling down all the website until it is not further possible to load all events on the website (orientation through scroll position)
     previous_scroll_position = 0
     try:
         while True:
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
+            wait_for_network_idle(driver, site_timeout("kiel_sailing_city"))
             current_scroll_position = driver.execute_script("return window.pageYOffset;")
 
             # Once it is not possible to scroll down further, retrieving all event information (with helper function) and exiting the loop
@@ -76,19 +101,7 @@ def scrape_kiel_sailing_city(days_in_advance=10): # Optional parameter for how m
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    # Splitting up date and time details and replacing the string "today" with the current date (with helper function)
-    current_date = datetime.now().strftime('%d.%m.%Y')
-    for item in all_data:
-        date, time_clock = parse_time_details(item['Time Details'], current_date=current_date)
-        item['Date'] = date
-        item['Time'] = time_clock
-    
-    # Last steps: Creating the dataframe of raw data from the event list, dropping the already preprocessed Time Details column, closing the driver and returning the dataframe
-    df = pd.DataFrame(all_data)
-    df = df.drop(columns=['Time Details'])
-    driver.close()
-
-    return df
+    return all_data, False
 
 
 # Preprocessing function
@@ -114,6 +127,50 @@ def preprocess_kiel_sailing_city(df_raw):
 
 # Helper functions and elements
 
+def close_cookie_window(driver):
+    # Function to decline the cookies in the cookie window, returns whether it worked
+    try:
+        decline_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "button.cm-btn.cm-btn-danger.cn-decline"))
+        )
+        decline_button.click()
+        return True
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return False
+
+
+def captured_events(capture, days_in_advance):
+    # Function to bring the events of the captured JSON responses into the raw data format of the rendered list
+    # (only events of the filtered timeframe, every event once)
+    first_day = datetime.now().strftime('%Y-%m-%d')
+    last_day = (datetime.now() + timedelta(days=days_in_advance)).strftime('%Y-%m-%d')
+    events = {}
+    for url, payload in capture.collect():
+        for record in iter_event_records([payload]):
+            event = normalize_record(record, base_url='https://kiel-sailing-city.de/')
+            if not (first_day <= event['start_date'] <= last_day):
+                continue
+            events[(event['title'], event['start_date'], event['start_time'])] = {
+                'Title': event['title'],
+                'Location': event['location'],
+                'Categories': event['categories'],
+                'Source': event['url'],
+                'Date': datetime.strptime(event['start_date'], '%Y-%m-%d').strftime('%d.%m.%Y'),
+                'Time': format_time(event['start_time'], event['end_time']),
+            }
+    return list(events.values())
+
+
+def format_time(start_time, end_time):
+    # Function to write the times like the website does ("19:00 - 22:00 Uhr" or "19:00 Uhr", see preprocess_time())
+    if start_time is None:
+        return ''
+    if end_time is not None and end_time != start_time:
+        return f"{start_time} - {end_time} Uhr"
+    return f"{start_time} Uhr"
+
+
 def generate_new_day_string(days_in_advance=10):
     # Function to generate a date string to input as timeframe on the website in DD.MM.YYYY - DD.MM.YYYY format
     current_date = datetime.now()
@@ -126,41 +183,35 @@ def generate_new_day_string(days_in_advance=10):
 
 def extract_elements(driver):
 
-    # Finding all loaded events on the whole page, the specific web element representing an event is identified via CSS selector
-    elements = driver.find_elements(By.CSS_SELECTOR, "li.flex.flex-nowrap.bg-gray-200.min-h-\\[430px\\].flex-col")
+    # Finding all loaded events on the whole page and extracting the required information with one call to the browser, the specific web element representing an event is identified via CSS selector
+    elements = extract_records(driver, "li.flex.flex-nowrap.bg-gray-200.min-h-\\[430px\\].flex-col", element_fields)
 
     # Creating a list to store events
     extracted_data = []
     
-    # Iterating over all found event elements and extracting the required information
-    # To make this process robust a try-except statement is used, so that missing information an one event doesn't lead to a failure of the whole process but just to leaving out that event
+    # Iterating over all found events, events with missing information are left out so that they don't lead to a failure of the whole process
     for element in elements:
-        try:
-            title = element.find_element(By.CSS_SELECTOR, "h4.c-headline.c-rich-text.truncate").text
-            
-            location = element.find_element(By.CSS_SELECTOR, "span.text-base p").text
-            
-            categories = [span.text for span in element.find_elements(By.CSS_SELECTOR, "div.my-3.flex.flex-wrap span")]
-            
-            time_details = element.find_element(By.CSS_SELECTOR, "div.text-xs").text
-
-            source_link = element.find_element(By.CSS_SELECTOR, "a").get_attribute("href")
-            
-            # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-            extracted_data.append({
-                "Title": title,
-                "Location": location,
-                "Categories": categories,
-                "Time Details": time_details,
-                "Source": source_link
-            })
-        except Exception as e:
-            print(f"An error occurred while extracting element data: {e}")
+        if None in element.values():
+            print(f"An error occurred while extracting element data: missing information in {element}")
+            continue
+
+        # All information per event is stored into a dictionary and the dictionary is appended to the list of events
+        extracted_data.append(element)
     
     # Handing back the list of dictionaries of events to the scraping function defined above
     return extracted_data
 
 
+# Fields read from each event element (CSS selector and attribute per field, see dom_extraction.py)
+element_fields = {
+    "Title": ("h4.c-headline.c-rich-text.truncate", "text"),
+    "Location": ("span.text-base p", "text"),
+    "Categories": ("div.my-3.flex.flex-wrap span", "text", "all"),
+    "Time Details": ("div.text-xs", "text"),
+    "Source": ("a", "href"),
+}
+
+
 def parse_time_details(time_details, current_date):
     # Function to seperate date and time and to replace "today" with the current date
     date_time = time_details.split('\n')[0]
@@ -203,8 +254,9 @@ music = ['Nachtleben', 'Konzert', 'konzert', 'Musik', 'musik', 'Party', 'party',
 
 # Recommended usage of the above functions
 
-df_raw = scrape_kiel_sailing_city(10)
-df_prep = preprocess_kiel_sailing_city(df_raw)
-df_prep.to_csv("Scraped_Events_Kiel_Sailing_City.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_kiel_sailing_city(10)
+    df_prep = preprocess_kiel_sailing_city(df_raw)
+    df_prep.to_csv("Scraped_Events_Kiel_Sailing_City.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -4,93 +4,59 @@
 
 # Imports
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from http_fetch import fetch_page, fetch_pages
+from dom_extraction import extract_records_from_soup
+from event_sink import collect_events
 
+from datetime import datetime, timedelta
+from urllib.parse import urljoin
 import pandas as pd
-import time
 
 
 # Scraping function
 
-def scrape_live_gigs_hh_sh():
+def scrape_live_gigs_hh_sh(days_in_advance=1, sink=None): # Optional parameter for how many following days are scraped in addition to today
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_live_gigs_events(days_in_advance), sink)
 
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website, defining waits)
-    options = Options()
-    options.add_argument("--headless")  
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    url = "https://www.livegigs.de/neumuenster/umkreis-100#Termine"
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get(url)
-    wait = WebDriverWait(driver, 10)
 
-    # Closing the cookie window
-    try:
-        button = wait.until(EC.element_to_be_clickable((By.ID, 'cookie-accept-required')))
-        button.click()
-    except Exception as e:
-        print(f"An error occurred: {e}")
+def iter_live_gigs_events(days_in_advance=1):
+
+    # Preparations for scraping (opening the website without a browser, as the events are rendered on the server, see http_fetch.py)
+    url = "https://www.livegigs.de/neumuenster/umkreis-100#Termine"
+    page = fetch_page(url, "live_gigs", ready_selector='.box-eventline')
 
-    # Creating a list to store events
-    events_data = []
+    # Getting the pages of the following days (1 day was chosen as a heuristic for covering an appropriate timeframe, as the page
+    # of a day lists the events from that day on, this generally covers at minimum the events of the next month)
+    # Navigation choice: The urls of all days are generated from the link of the "next day" button and requested at the same time
+    pages = [(url, page)] + following_day_pages(page, url, days_in_advance)
 
-    # Navigating through the first two pages of results (2 was chosen as a heuristic for covering an appropriate timeframe)
-    # Navigation choice: Clicking on the "next" button proved as a stable navigation option
-    for i in range(2):
+    for url, page in pages:
 
-        # Finding all events per page, the specific web element representing an event is identified via class name 
-        elements = driver.find_elements(By.CLASS_NAME, 'box-eventline')
+        # Finding all events per page and extracting the required information, the specific web element representing an event is identified via class name 
+        elements = extract_records_from_soup(page, '.box-eventline', element_fields, base_url=url)
 
-        # Iterating over all found event elements and extracting the required information
-        # As sometimes not all information is available per event, this part was made robust by using try-except statements
+        # Iterating over all found events and bringing the extracted information into shape
+        # As sometimes not all information is available per event, missing fields are handled here
         # Elements that have no title are skipped right away, if other information is missing, the fields are left empty at first
         for element in elements:
-            try:
-                title = element.find_element(By.CLASS_NAME, 'summary').get_attribute('title')
-                title = title.split(" - ")[0]
-            except:
+            if element['Title'] is None:
                 continue
+            title = element['Title'].split(" - ")[0]
+            source = element['Source']
+            time_standard = element['Time'][:6].strip() if element['Time'] is not None else None
 
-            try:
-                source = element.find_element(By.CLASS_NAME, 'summary').get_attribute('href')
-            except:
-                source = None
-
-            try:
-                time_standard = element.find_element(By.CLASS_NAME, 'time').text[:6].strip()
-            except:
-                time_standard = None
-            
-            try:
-                day = element.find_element(By.CLASS_NAME, 'day').text
-                month = element.find_element(By.CLASS_NAME, 'month').get_attribute('title').split('-')[1]
-                year = element.find_element(By.CLASS_NAME, 'year').text
-                formatted_date = f"{day}.{month}.{year}"
-            except:
+            if None not in (element['Day'], element['Month'], element['Year']) and '-' in element['Month']:
+                formatted_date = f"{element['Day']}.{element['Month'].split('-')[1]}.{element['Year']}"
+            else:
                 formatted_date = None
 
-            try:
-                category = element.find_element(By.CLASS_NAME, 'category').text
-            except:
-                category = None
-
-            try:
-                location = element.find_element(By.CLASS_NAME, 'venue').get_attribute('title')
-            except:
-                location = None
+            category = element['Category']
+            location = element['Location']
+            city = element['City']
 
-            try:
-                city = element.find_element(By.CLASS_NAME, 'city').text
-            except:
-                city = None
-
-            # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-            events_data.append({
+            # All information per event is stored into a dictionary and the dictionary is handed on
+            yield {
                 'Subject': title,
                 'Description': source,
                 'Start_time': time_standard,
@@ -101,23 +67,7 @@ def scrape_live_gigs_hh_sh():
                 'Location': location,
                 'City': city,
                 'Music_label': True # All events on this website are music related
-            })
-
-        # Navigating to page 2 (this generally covers at minimum the events of the next month)
-        if i < 1:
-            try:
-                next_day_link = driver.find_element(By.XPATH, '//div[@class="standard link-text"]/a[contains(text(), "nächster Tag")]')
-                next_day_link.click()
-                time.sleep(5)
-            except Exception as e:
-                print("No second page exists.")
-                break
-    
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(events_data)
-    driver.close()
-
-    return df_raw
+            }
 
 
 # Preprocessing function
@@ -135,6 +85,53 @@ def preprocess_live_gigs(df_raw):
 
 # Helper functions and elements
 
+# Fields read from each event element (CSS selector and attribute per field, see dom_extraction.py)
+element_fields = {
+    'Title': ('.summary', 'title'),
+    'Source': ('.summary', 'href'),
+    'Time': ('.time', 'text'),
+    'Day': ('.day', 'text'),
+    'Month': ('.month', 'title'),
+    'Year': ('.year', 'text'),
+    'Category': ('.category', 'text'),
+    'Location': ('.venue', 'title'),
+    'City': ('.city', 'text'),
+}
+
+# Date formats the url of the "next day" button may contain the date in
+URL_DATE_FORMATS = ['%Y-%m-%d', '%d.%m.%Y', '%Y/%m/%d', '%d-%m-%Y', '%Y%m%d']
+
+def next_day_url(page, url):
+    # Function to read the url behind the "next day" button of a page (None if there is no such button)
+    next_day_links = [link for link in page.select('div.standard.link-text > a') if "nächster Tag" in link.get_text()]
+    if not next_day_links:
+        return None
+    return urljoin(url, next_day_links[0].get('href'))
+
+def following_day_pages(page, url, days_in_advance):
+    # Function to get the pages of the following days as (url, page): the url of the "next day" button contains tomorrow's date,
+    # which is replaced by the dates of the other days and all pages are requested at the same time. If the date can't be found
+    # in the url, the button is followed page by page instead, keeping the pages fetched on the way.
+    next_url = next_day_url(page, url)
+    if next_url is None or days_in_advance < 1:
+        if next_url is None:
+            print("No page of the next day exists.")
+        return []
+
+    tomorrow = datetime.today().date() + timedelta(days=1)
+    for date_format in URL_DATE_FORMATS:
+        if tomorrow.strftime(date_format) in next_url:
+            day_urls = [next_url.replace(tomorrow.strftime(date_format), (tomorrow + timedelta(days=offset)).strftime(date_format))
+                        for offset in range(days_in_advance)]
+            return list(zip(day_urls, fetch_pages(day_urls, "live_gigs", ready_selector='.box-eventline')))
+
+    pages = []
+    while next_url is not None and len(pages) < days_in_advance:
+        next_page = fetch_page(next_url, "live_gigs", ready_selector='.box-eventline')
+        pages.append((next_url, next_page))
+        next_url = next_day_url(next_page, next_url)
+    return pages
+
 def convert_date_format(date_str):
     # Function for converting date format from DD.MM.YYYY to YYYY-MM-DD 
     # Date format changed over the course of the project, so this function was added to older scrapers
@@ -147,8 +144,9 @@ def convert_date_format(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_live_gigs_hh_sh()
-df_prep = preprocess_live_gigs(df_raw)
-df_prep.to_csv("Scraped_Events_Live_Gigs_HH_SH.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_live_gigs_hh_sh()
+    df_prep = preprocess_live_gigs(df_raw)
+    df_prep.to_csv("Scraped_Events_Live_Gigs_HH_SH.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
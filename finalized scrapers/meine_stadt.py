@@ -4,21 +4,30 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver, replace_driver, DESKTOP_USER_AGENT
+from dom_extraction import IncrementalHarvester
+from waiting import page_ready, site_timeout, wait_for_count_growth, wait_for_network_idle
+from event_sink import collect_events
+from consent_profiles import ensure_consent
+from checkpoints import CheckpointStore, cities_key, iter_checkpointed_batch
+from pagination import PaginationController
 
 import pandas as pd
 from datetime import datetime
-import time
 
 
 # Scraping function
 
-def scrape_meine_stadt(): # Small warning: one execution takes >30 minutes, as there are many suitable events and locations on this website
+def scrape_meine_stadt(cities=None, sink=None): # Optional parameter to only scrape some of the cities below. Small warning: one execution takes >30 minutes, as there are many suitable events and locations on this website
+    # Streaming the events into the sink while scraping (kept in memory by default, see event_sink.py), so that with a file sink
+    # the events of all finished urls are on disk if the browser crashes, and returning the dataframe of raw data
+    return collect_events(iter_meine_stadt_events(cities), sink)
+
+
+def iter_meine_stadt_events(cities=None):
 
     # Defining the urls to scrape, varying location and category to use the url as an api to the website
     urls = [
@@ -47,94 +56,71 @@ def scrape_meine_stadt(): # Small warning: one execution takes >30 minutes, as t
         "https://veranstaltungen.meinestadt.de/itzehoe/partys-feiern/alle",
         "https://veranstaltungen.meinestadt.de/itzehoe/festivals/alle"
     ] 
+    if cities is not None:
+        urls = [url for url in urls if any(url.split('/')[-3].startswith(city_slug(city)) for city in cities)]
     
-    # Preparations for scraping (setting options (more than before due to prior difficulties with headless mode on this website), instantiating the Chrome driver, defining waits)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")  # to avoid some rendering issues
-    options.add_argument("--window-size=1920,1080")  # to avoid window size issues
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36") # to avoid being blocked as a headless scraper
-    options.add_argument("--log-level=3")  # to suppress most logs, as many unimportant ones appear here
-    driver = webdriver.Chrome(service=Service(), options=options)
-    wait = WebDriverWait(driver, 10) 
-
-    # Creating a list to store events
-    events = []
-
-    # Iterating over the different urls to scrape and opening each of them
-    for url in urls:
-        driver.get(url)
-
-        # Closing the cookie window, if it appears
-        try:
-            iframe = wait.until(EC.presence_of_element_located((By.ID, "sp_message_iframe_1220563")))
-            driver.switch_to.frame(iframe)
-            buttons = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, "button-responsive-primary")))
-            buttons[1].click()
-        except Exception as e:
-            print("Cookie rejection in iframe didn't work. No problem for scraping.")
-
-        # Moving back from cookie iframe to actual website
-        driver.switch_to.default_content()
-
-        # Heuristic of how often to click on load more events button in order to minimally cover the proper timeframe also for location and category combinations with many events
-        # If not more events can be loaded the loop is left 
-        for i in range(30): 
-            time.sleep(10) # This website takes especially long to load properly
-            try: 
-                wait = WebDriverWait(driver, 10)
-                load_more_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//button[@data-component="CsSecondaryButton"]')))
-                load_more_button.click()
-            except Exception as e:
-                print("No further events to load.")
-                break
-
-        # Finding all events per page, the specific web element representing an event is identified via CSS selector
-        elements = driver.find_elements(By.CSS_SELECTOR, 'div.flex.flex-col.w-full.p-16.screen-m\\:pl-0')
-        print("Found events:", str(len(elements)))
-
-        # Iterating over all found event elements and extracting the required information
-        # As sometimes not all information is available per event, this part was made robust by using try-except statements
-        for element in elements:
-            
-            try:
-                title = element.find_element(By.CSS_SELECTOR, 'h3.text-h3.font-bold-headline.mb-8.line-clamp-2').text
-            except:
-                title = ' '
-            
-            try:
-                source = element.find_element(By.CSS_SELECTOR, 'a.ms-clickArea').get_attribute('href')
-            except:
-                source = ' '
-            
-            try:
-                date_time = element.find_element(By.CSS_SELECTOR, 'div.flex.mb-4.text-h4').text
-            except:
-                date_time = ' '
-            
-            try:
-                city_location = element.find_element(By.CSS_SELECTOR, 'div.flex.mb-8.text-h4').text
-            except:
-                city_location = ' '
-            
-            # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-            event = {
-                "Subject": title,
-                "Description": source, 
-                "Date_Time": date_time,
-                "City_Location": city_location,
-                "Category": url.split(('/'))[-2],
-                "Music_label": True # all scraped events from this website are music related
-            }
-            events.append(event)
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(events)
-    driver.close()
-
-    return df_raw
+    # Preparations for scraping (leasing a Chrome driver from the shared pool with a desktop user agent due to prior difficulties with headless mode on this website)
+    driver = acquire_driver(user_agent=DESKTOP_USER_AGENT, site="meine_stadt")
+
+    def scrape_url(url):
+        # Loading all events of the url opened in the current tab and handing them on
+
+        # Heuristic of how often to click on load more events button at most in order to minimally cover the proper timeframe also for location and category combinations with many events
+        # If not more events can be loaded or the newly loaded events reach beyond the scraping horizon (see pagination.py) the loop is left
+        # This website takes especially long to load properly, so instead of a fixed waiting time it is waited until new events were appended after each click (up to the timeout of this website)
+        # The events are extracted step by step with one call to the browser after each click: only the newly appended events are read and the
+        # events read before are removed from the page, so the page doesn't get slower with every click (see dom_extraction.py)
+        wait_for_network_idle(driver, site_timeout("meine_stadt"))
+        harvester = IncrementalHarvester(driver, event_selector, event_fields)
+        with PaginationController("meine_stadt", max_pages=31) as pager:
+            elements = harvester.harvest()
+            yield from (shape_element(element, url) for element in elements)
+            pager.add_page(element["Date_Time"] for element in elements)
+            while pager.should_continue():
+                try: 
+                    wait = WebDriverWait(driver, site_timeout("meine_stadt"))
+                    load_more_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//button[@data-component="CsSecondaryButton"]')))
+                    load_more_button.click()
+                except Exception as e:
+                    print("No further events to load.")
+                    break
+                if not wait_for_count_growth(driver, harvester.pending_selector, 0, site_timeout("meine_stadt")):
+                    print("No further events to load.")
+                    break
+                elements = harvester.harvest()
+                yield from (shape_element(element, url) for element in elements)
+                pager.add_page(element["Date_Time"] for element in elements)
+
+        print("Found events:", str(harvester.harvested))
+
+    # Every url is a unit of work: urls completed in an earlier (crashed) run of today are not scraped again (see checkpoints.py)
+    def scrape_pending(pending):
+        # Closing the cookie window on the first url, if it appears (only once per browser and skipped if the consent stored in the
+        # profile of this website was restored, see consent_profiles.py), the tabs opened afterwards share the cookies
+        if "meine_stadt" not in driver.consent_sites:
+            url = pending.pop(0)
+            driver.get(url)
+            ensure_consent(driver, "meine_stadt", close_cookie_window)
+
+            # The first url is already loaded, so it is scraped right here instead of being loaded again in a tab
+            yield url, list(scrape_url(url))
+
+        # The urls are loaded at the same time in several tabs of the browser and each url is scraped as soon as its first
+        # events are there (see driver_pool.py), so the slow loading of this website overlaps instead of adding up
+        for url, _ in driver.iter_ready_tabs(pending, page_ready(event_selector), timeout=site_timeout("meine_stadt")):
+            yield url, list(scrape_url(url))
+
+    def restart():
+        # Replacing a crashed driver by a fresh one from the pool (the interrupted urls are scraped again)
+        nonlocal driver
+        driver = replace_driver(driver, user_agent=DESKTOP_USER_AGENT, site="meine_stadt")
+
+    # The driver is handed back to the pool in any case, also if the generator is not consumed until the end
+    try:
+        yield from iter_checkpointed_batch(CheckpointStore("meine_stadt", key=cities_key(cities)), urls, scrape_pending, restart=restart)
+    finally:
+        # Last step: Handing the driver back to the pool
+        release_driver(driver)
 
 
 # Preprocessing function
@@ -158,6 +144,45 @@ def preprocess_meine_stadt(df_raw):
 
 # Helper functions and elements
 
+def close_cookie_window(driver):
+    # Function to reject the cookies in the cookie window (shown in an iframe), returns whether it worked
+    wait = WebDriverWait(driver, 10)
+    try:
+        iframe = wait.until(EC.presence_of_element_located((By.ID, "sp_message_iframe_1220563")))
+        driver.switch_to.frame(iframe)
+        buttons = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, "button-responsive-primary")))
+        buttons[1].click()
+        return True
+    except Exception as e:
+        print("Cookie rejection in iframe didn't work. No problem for scraping.")
+        return False
+    finally:
+        # Moving back from cookie iframe to actual website
+        driver.switch_to.default_content()
+
+
+# CSS selector of the web element representing an event
+event_selector = 'div.flex.flex-col.w-full.p-16.screen-m\\:pl-0'
+
+# Fields read from each event element (CSS selector and attribute per field, see dom_extraction.py)
+event_fields = {
+    "Subject": ('h3.text-h3.font-bold-headline.mb-8.line-clamp-2', 'text'),
+    "Description": ('a.ms-clickArea', 'href'),
+    "Date_Time": ('div.flex.mb-4.text-h4', 'text'),
+    "City_Location": ('div.flex.mb-8.text-h4', 'text'),
+}
+
+def shape_element(element, url):
+    # All information per event is stored into a dictionary (missing fields are filled with " ")
+    return {
+        "Subject": element["Subject"] or ' ',
+        "Description": element["Description"] or ' ', 
+        "Date_Time": element["Date_Time"] or ' ',
+        "City_Location": element["City_Location"] or ' ',
+        "Category": url.split(('/'))[-2],
+        "Music_label": True # all scraped events from this website are music related
+    }
+
 def preprocess_date(date_time_string):
     # Extracting date information if given in regular format
     if len(date_time_string.split(" ")) > 1:
@@ -183,6 +208,13 @@ def convert_date_format(date_str):
     else:
         return " "
 
+def city_slug(city):
+    # Converting a city name into the form used in the urls of this website (e.g. Lübeck to luebeck)
+    city = city.lower()
+    for umlaut, replacement in [('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')]:
+        city = city.replace(umlaut, replacement)
+    return city
+
 def preprocess_city(citlocstr):
     # Extracting city information if given in regular format
     city = citlocstr.split(", ", 1)[0]
@@ -199,8 +231,9 @@ def preprocess_location(citlocstr):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_meine_stadt()
-df_prep = preprocess_meine_stadt(df_raw)
-df_prep.to_csv("Scraped_Events_Meine_Stadt.csv")
-print(df_prep.head())
-print(df_prep.info())
+if __name__ == "__main__":
+    df_raw = scrape_meine_stadt()
+    df_prep = preprocess_meine_stadt(df_raw)
+    df_prep.to_csv("Scraped_Events_Meine_Stadt.csv")
+    print(df_prep.head())
+    print(df_prep.info())
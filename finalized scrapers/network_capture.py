@@ -0,0 +1,225 @@
+# Reading events from the JSON responses of single page applications
+# Websites like kiel-sailing-city.de and eventbrite.de render their event lists in the browser from JSON the page fetches from
+# its own API. Instead of scrolling until all cards are rendered and reading the cards from the DOM, the events can be taken
+# directly from these responses: browsers with a profile with capture_network=True (see browser_profiles.py) write all network
+# events to the performance log, NetworkCapture reads the finished JSON responses from it and fetches their bodies via the
+# Chrome DevTools Protocol. JSON embedded in the page itself (window.__NEXT_DATA__, window.__NUXT__, ...) is read as well.
+#
+#     capture = NetworkCapture(driver, url_pattern=r"/api/")
+#     driver.get(url)
+#     wait_for_network_idle(driver, timeout)
+#     for record in iter_event_records(payload for url, payload in capture.collect()):
+#         event = normalize_record(record, base_url=url)
+#
+# iter_event_records() finds event-like objects anywhere in the payloads and normalize_record() maps the common field names
+# of such APIs (name/title, startDate/start_date/start.local, venue/location, ...) to one shape, so a new website usually
+# only needs a url pattern and a function bringing the normalized events into its raw data format. If nothing usable was
+# captured (e.g. the website changed its API, or in replay mode, where only the DOM of the pages is stored), the scrapers fall
+# back to reading the DOM. Setting SPA_CAPTURE=off always uses the DOM.
+
+# Imports
+
+from structured_data import split_date_time
+from time_accounting import timed_function
+
+from datetime import datetime
+from urllib.parse import urljoin
+import json
+import os
+import re
+
+
+# Setting SPA_CAPTURE=off makes the scrapers read the rendered DOM instead of the captured responses
+SPA_CAPTURE = os.getenv("SPA_CAPTURE", "on") != "off"
+
+# JavaScript reading the state objects frameworks embed into the page (cyclic or unserializable objects are skipped)
+PAGE_STATE_SCRIPT = """
+var states = {};
+arguments[0].forEach(function (name) {
+    try {
+        if (window[name] !== undefined) { states[name] = JSON.parse(JSON.stringify(window[name])); }
+    } catch (error) {}
+});
+return JSON.stringify(states);
+"""
+
+# Global variables of common frameworks containing the data of the page
+PAGE_STATE_NAMES = ["__NEXT_DATA__", "__NUXT__", "__SERVER_DATA__", "__INITIAL_STATE__", "__APOLLO_STATE__"]
+
+# Field names used by event APIs (the first one found is used)
+TITLE_KEYS = ["name", "title", "headline", "eventName"]
+START_KEYS = ["startDate", "start_date", "startTime", "start_time", "start", "dateFrom", "date_from", "begin", "date", "startsAt"]
+END_KEYS = ["endDate", "end_date", "endTime", "end_time", "end", "dateTo", "date_to", "endsAt"]
+LOCATION_KEYS = ["primary_venue", "venue", "location", "place", "locationName", "venueName"]
+CITY_KEYS = ["city", "addressLocality", "locality"]
+CATEGORY_KEYS = ["categories", "category", "tags", "genres", "genre", "eventType", "type"]
+URL_KEYS = ["url", "link", "permalink", "href", "path", "slug"]
+
+
+class NetworkCapture:
+    """Collects the JSON responses a page fetches (the browser needs a profile with capture_network=True)."""
+
+    def __init__(self, driver, url_pattern=None):
+        """
+        Args:
+            driver: PooledChrome started with capture_network=True.
+            url_pattern (str): Regular expression the url of a response has to match (all JSON responses if None).
+        """
+        self.driver = driver
+        self.url_pattern = re.compile(url_pattern) if url_pattern else None
+        self._responses = {}  # request id -> url of JSON responses not finished yet
+        self._finished = set()
+        self.clear()
+
+    def clear(self):
+        """Forgets all network events so far (e.g. of the page opened before)."""
+        self.driver.get_log("performance")
+        self._responses.clear()
+
+    @timed_function("extract")
+    def collect(self):
+        """Returns (url, payload) of all JSON responses finished since the last call."""
+        finished = []
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            params = message.get("params", {})
+            if message.get("method") == "Network.responseReceived":
+                response = params.get("response", {})
+                if "json" in response.get("mimeType", "") and self._matches(response.get("url", "")):
+                    self._responses[params["requestId"]] = response["url"]
+            elif message.get("method") == "Network.loadingFinished" and params.get("requestId") in self._responses:
+                finished.append(params["requestId"])
+
+        payloads = []
+        for request_id in finished:
+            url = self._responses.pop(request_id)
+            if request_id in self._finished:
+                continue
+            self._finished.add(request_id)
+            try:
+                body = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                payloads.append((url, json.loads(body["body"])))
+            except Exception as e:
+                print(f"Response of {url} could not be read: {e}")
+        return payloads
+
+    def page_state(self, names=PAGE_STATE_NAMES):
+        """Returns (name, payload) of the data objects the framework of the page embedded into it."""
+        states = json.loads(self.driver.execute_script(PAGE_STATE_SCRIPT, names))
+        return list(states.items())
+
+    def _matches(self, url):
+        return self.url_pattern is None or self.url_pattern.search(url) is not None
+
+
+def iter_event_records(payloads):
+    """Yields every object in the payloads that looks like an event (a title and a start date), not looking into events themselves."""
+    def walk(value):
+        if isinstance(value, dict):
+            if is_event_record(value):
+                yield value
+                return
+            for item in value.values():
+                yield from walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                yield from walk(item)
+
+    for payload in payloads:
+        yield from walk(payload)
+
+
+def is_event_record(value):
+    return first_text(value, TITLE_KEYS) is not None and split_date_time(date_value(first_value(value, START_KEYS)))[0] is not None
+
+
+def find_values(payload, key):
+    """Returns all values of a key anywhere in a payload (e.g. the number of result pages)."""
+    values = []
+    if isinstance(payload, dict):
+        for name, value in payload.items():
+            if name == key:
+                values.append(value)
+            values.extend(find_values(value, key))
+    elif isinstance(payload, list):
+        for item in payload:
+            values.extend(find_values(item, key))
+    return values
+
+
+def normalize_record(record, base_url=None):
+    """
+    Maps an event object of an API to a dictionary with title, start_date (YYYY-MM-DD), start_time and end_time (HH:MM or
+    None), location, city, categories (list) and url.
+    """
+    start_date, start_time = split_date_time(date_value(first_value(record, START_KEYS)))
+    end_date, end_time = split_date_time(date_value(first_value(record, END_KEYS)))
+    if start_time is None:
+        start_time = time_value(record.get("start_time") or record.get("startTime"))
+    if end_time is None:
+        end_time = time_value(record.get("end_time") or record.get("endTime"))
+
+    location = first_value(record, LOCATION_KEYS)
+    city = first_text(location, CITY_KEYS) or first_text(location.get("address"), CITY_KEYS) if isinstance(location, dict) else None
+    city = city or first_text(record, CITY_KEYS)
+
+    url = first_text(record, URL_KEYS)
+    return {
+        "title": first_text(record, TITLE_KEYS),
+        "start_date": start_date,
+        "start_time": start_time,
+        "end_date": end_date or start_date,
+        "end_time": end_time,
+        "location": text_of(location),
+        "city": city,
+        "categories": [text for text in (text_of(item) for item in as_list(first_value(record, CATEGORY_KEYS))) if text],
+        "url": urljoin(base_url, url) if url and base_url else url,
+    }
+
+
+# Helper functions
+
+def first_value(record, keys):
+    # First value of the keys that is not empty
+    if not isinstance(record, dict):
+        return None
+    for key in keys:
+        if record.get(key) not in (None, "", [], {}):
+            return record[key]
+    return None
+
+
+def first_text(record, keys):
+    return text_of(first_value(record, keys))
+
+
+def text_of(value):
+    # Text of a value (objects like {"text": ...} or {"name": ...} are reduced to their text)
+    if isinstance(value, dict):
+        for key in ("text", "name", "title", "display_name", "label", "value"):
+            if isinstance(value.get(key), (str, dict)):
+                return text_of(value[key])
+        return None
+    if isinstance(value, str):
+        return " ".join(value.split()) or None
+    return None
+
+
+def date_value(value):
+    # Dates are given as text, as object like {"local": "...", "utc": "..."} or as timestamp in milliseconds
+    if isinstance(value, dict):
+        value = value.get("local") or value.get("dateTime") or value.get("date") or value.get("utc")
+    if isinstance(value, (int, float)) and value > 10**11:
+        value = datetime.fromtimestamp(value / 1000).isoformat()
+    return value
+
+
+def time_value(value):
+    match = re.search(r"(\d{1,2}):(\d{2})", value) if isinstance(value, str) else None
+    return f"{int(match.group(1)):02d}:{match.group(2)}" if match else None
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
@@ -1,136 +1,82 @@
 # Scraper built by: Ilia Semenok
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from http_fetch import fetch_page
+from structured_data import extract_events
+from event_sink import collect_events
+from pagination import PaginationController
+
+from datetime import datetime
 import pytz         # to set the German time zone.
-import time as tm   # be careful, I specifically gave an alias as 'tm', cause I have a variable called 'time' already in my code.
-import re
+from urllib.parse import urljoin
 
 # pip install selenium
 # pip install pytz
 # or maybe this is needed: locale.setlocale(locale.LC_TIME, 'de_DE.UTF-8')
 
-def scraping_neumuenster():
-    driver = webdriver.Chrome()
-    driver.get("https://www.neumuenster.de/kultur-freizeit/veranstaltungskalender") 
+def scraping_neumuenster(sink=None):
+    # The events are streamed into the sink while scraping (kept in memory by default, see event_sink.py)
+    return collect_events(iter_neumuenster_events(), sink)
+
+def iter_neumuenster_events():
+    url = "https://www.neumuenster.de/kultur-freizeit/veranstaltungskalender"
 
     germany_tz = pytz.timezone('Europe/Berlin')
     current_date = datetime.now(germany_tz).date() # Get the current date and time in the German time zone
 
-    ten_days_from_today = current_date + timedelta(days=10)
-
-    event_list = []  # to store all the events.
-
-    is_true = True
-    while is_true:  
-        
-        # Wait until the event containers are loaded
-        WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'div.col-xs-10.col-sm-9.col-md-10')))
-        WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'meta[itemprop="startDate"]')))
-        WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'span[itemprop="address"]')))  
-        WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'h5.dfx-titel-liste-dreizeilig'))) 
-        # After loading, get the page source and parse it with BeautifulSoup
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        
-        # Now use BeautifulSoup to extract the events
-        events = soup.select('div.col-xs-10.col-sm-9.col-md-10')  # Adjust selector to match event containers
-
-        # Function to extract element's text or attribute using BeautifulSoup
-        def get_element_or_none(soup, selector, attribute=None):
-            try:
-                element = soup.select_one(selector)
-                if element:
-                    if attribute:
-                        return element.get(attribute).strip()  
-                    else:
-                        return element.text.strip() 
-                return np.nan
-            except:
-                return np.nan
-
-        # Loop through each event and extract details
-        for event in events:
-
-            # Check if the event date is within the next 10 days
-            temp_date = event.select_one('meta[itemprop="startDate"]').get('content')
-            check_date = datetime.fromisoformat(temp_date).date()
-
-            if ten_days_from_today < check_date:
-                is_true = False
-                break  # Exit the loop if the event is more than 10 days away
-
-            # Extracting event details
-            title = get_element_or_none(event, 'h5.dfx-titel-liste-dreizeilig')
-            date = get_element_or_none(event, 'meta[itemprop="startDate"]', attribute='content')
-            time = get_element_or_none(event, 'span.dfx-zeit-liste-dreizeilig')
-            address = get_element_or_none(event, 'span[itemprop="address"]')
-            
-            place_name = get_element_or_none(event, 'span[itemprop="name"]')
-            full_address = f"{place_name} | {address}"
-            source = get_element_or_none(event, 'h5.dfx-titel-liste-dreizeilig a', attribute='href')
-
-            # Creating the event dictionary
-            our_event = {
-                'Subject': title,
-                'Start_date': date,
-                'time': time,
-                'Location': full_address,
-                'Description': source
-            }
-
-            event_list.append(our_event)
-
-        if not is_true:
-            break
-
-        pagination_block = WebDriverWait(driver, 10).until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'ul.pagination li')))
-        page_link = WebDriverWait(driver, 10).until(EC.element_to_be_clickable(pagination_block[-1].find_element(By.TAG_NAME, 'a')))
-        page_link.click()
-        tm.sleep(1)
-
-    driver.close()  # Close the Selenium driver
-    return pd.DataFrame(event_list)
-
-df = scraping_neumuenster()
+    # The calendar is sorted by date, paging stops at the first event more than 10 days away (see pagination.py)
+    with PaginationController("neumuenster", horizon_days=10, today=current_date) as pager:
+        while True:
+
+            # The calendar is rendered on the server, so the page is requested without a browser and parsed with BeautifulSoup
+            # (falls back to the browser if the event containers are missing, see http_fetch.py)
+            soup = fetch_page(url, "neumuenster", ready_selector='div.col-xs-10.col-sm-9.col-md-10')
+
+            # The events carry schema.org microdata (itemprop="startDate", ...), so they are read in the final data format in one pass (see structured_data.py)
+            events = extract_events(soup, base_url=url, item_selector='div.col-xs-10.col-sm-9.col-md-10', overrides=event_fields,
+                                    defaults={'City': 'Neumünster', 'Category': ' ', 'Music_label': False})
+
+            # Hand on the events within the next 10 days, events without date count as today's events
+            for event in events:
+                if pager.is_beyond_horizon(event['Start_date']):
+                    break
+                yield event
+
+            if not pager.add_page([event['Start_date'] for event in events]):
+                break
+
+            # Follow the link of the last pagination item (next page), stop if there is none
+            pagination_block = soup.select('ul.pagination li')
+            page_link = pagination_block[-1].select_one('a[href]') if pagination_block else None
+            if page_link is None:
+                break
+            url = urljoin(url, page_link['href'])
 
 def cleaning_neumuenster(df):
-    df['Start_date'] = df['Start_date'].apply(lambda x: pd.to_datetime(x).strftime('%Y-%m-%d') if 'T' in x else x)
-
-    def func(x):
-        if pd.isna(x):  # Check if x is NaN.
-            return x    # Return NaN without processing.
-        else:
-            if 'bis' in x:
-                x = x.replace('bis', '-')       # Replace 'bis' with a '-' hyphen sign 
-            x = re.sub(r'[^0-9:-]', '', x)      # Keep only digits, colons, and hyphens. Remove the rest
-        return x
-
-    df['time'] = df['time'].apply(func)         # Apply the function to the 'time' column
-
-    def split_time(time_str):
-        if pd.isna(time_str):
-            return np.nan, np.nan               # Return NaN if the input is NaN.
-        elif '-' in time_str:
-            start, end = time_str.split('-')
-            return start.strip(), end.strip()   # Return start and end times.
-        else:
-            return time_str.strip(), np.nan     # Single time: end_time as NaN.
-
-    df[['Start_time', 'End_time']] = df['time'].apply(split_time).apply(pd.Series)  # Apply the function to create two new columns
-
-    df.drop(columns=['time'], inplace=True)
-    df['End_date'] = df['Start_date']           # adding End_date.
-    df['City'] = 'Neumünster'                   # adding city column.
-    df['Category'] = ' '                        # adding category column.
-    df['Music_label'] = False
-
-    return df
-
-cleaned_neumuenster = cleaning_neumuenster(df)
\ No newline at end of file
+    # Dates and times are already in the final format (YYYY-MM-DD, HH:MM), the place is joined with its address,
+    # empty fields are filled and the columns sorted
+    if 'Address' in df.columns:
+        df['Location'] = [location_with_address(place, address) for place, address in zip(df['Location'], df['Address'])]
+    df = df.fillna(' ')
+    return df[['Subject', 'Start_date', 'End_date', 'Start_time', 'End_time', 'Location', 'City', 'Description', 'Category', 'Music_label']]
+
+def location_with_address(place, address):
+    # "place | address", or only the part that is given
+    parts = [part for part in (place, address) if isinstance(part, str) and part.strip()]
+    return ' | '.join(parts) or None
+
+# Fields read from each event instead of the microdata (CSS selector and attribute per column, see dom_extraction.py)
+# The itemprop "name" of an event is the name of its place, so the title is read from the heading
+# The time is given as text like "19:00 bis 21:00 Uhr", start and end time are taken from it
+# The address of the place is read as extra column and joined with the place in cleaning_neumuenster()
+event_fields = {
+    'Subject': ('h5.dfx-titel-liste-dreizeilig', 'text'),
+    'Start_time': ('span.dfx-zeit-liste-dreizeilig', 'text'),
+    'Location': ('span[itemprop="name"]', 'text'),
+    'Address': ('span[itemprop="address"]', 'text'),
+    'Description': ('h5.dfx-titel-liste-dreizeilig a', 'href'),
+}
+
+if __name__ == "__main__":
+    df = scraping_neumuenster()
+    cleaned_neumuenster = cleaning_neumuenster(df)
+    cleaned_neumuenster.to_csv("Scraped_Events_Neumuenster.csv")
\ No newline at end of file
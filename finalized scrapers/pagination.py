@@ -0,0 +1,152 @@
+# Stopping pagination at the scraping horizon
+# Event lists are sorted by date, but the scrapers used to load a fixed number of pages per website (8 pages, 30 clicks on
+# "load more", days_in_advance*30+100 result pages, ...) and most of the events on the last pages were thrown away later by
+# the 30 day filter of the upload (see Database/bigquery_final.py). Instead, a scraper hands the dates of the events of every
+# page it loaded to a PaginationController, which tells it to stop as soon as a page reaches beyond the horizon (the following
+# pages of a sorted list only contain later events). The old page counts are kept as upper limit.
+#
+#     with PaginationController("biunsinnorden", max_pages=8) as pager:
+#         for page in pages:
+#             ...
+#             if not pager.add_page(dates_on_page):
+#                 break
+#
+# Every controller records how many pages its website needed and how many it saved compared to the upper limit
+# (see get_stats(), benchmark_scrapers.py prints them).
+
+# Imports
+
+from datetime import date, datetime, timedelta
+
+import os
+import re
+import threading
+
+
+# Number of days in advance events are needed for (the upload keeps the events of the next 30 days)
+HORIZON_DAYS = int(os.getenv("SCRAPE_HORIZON_DAYS", "30"))
+
+# Dates as written on the websites: "2024-05-17", "17.05.2024", "17.05." or "Sa, 17. Mai" (missing years see complete_year())
+ISO_DATE_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+NUMERIC_DATE_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4}|\d{2}(?!\d))?')
+NAMED_DATE_PATTERN = re.compile(r'(\d{1,2})\.?\s*([A-Za-zÄÖÜäöü]{3,})\.?\s*(\d{4})?')
+
+# German (and English) month names, only their first three letters are compared
+MONTHS = {'jan': 1, 'feb': 2, 'mär': 3, 'mar': 3, 'mrz': 3, 'apr': 4, 'mai': 5, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8,
+          'sep': 9, 'okt': 10, 'oct': 10, 'nov': 11, 'dez': 12, 'dec': 12}
+
+
+def parse_event_date(value, today=None):
+    """Returns the date of an event as date object (None if no date is found in the value)."""
+    today = today or date.today()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        return None
+
+    try:
+        match = ISO_DATE_PATTERN.search(value)
+        if match:
+            year, month, day = map(int, match.groups())
+            return date(year, month, day)
+
+        match = NUMERIC_DATE_PATTERN.search(value)
+        if match:
+            day, month, year = match.groups()
+            return complete_year(int(day), int(month), year, today)
+
+        match = NAMED_DATE_PATTERN.search(value)
+        if match and match.group(2)[:3].lower() in MONTHS:
+            day, month, year = match.groups()
+            return complete_year(int(day), MONTHS[month[:3].lower()], year, today)
+    except ValueError:
+        return None
+    return None
+
+
+def complete_year(day, month, year, today):
+    # Dates without year lie in the coming months, except for dates of the last half year (events that started already),
+    # which are taken as past dates, so that they don't look like events of next year and stop the pagination too early
+    if year:
+        year = int(year)
+        return date(year + 2000 if year < 100 else year, month, day)
+    candidate = date(today.year, month, day)
+    if candidate < today - timedelta(days=182):
+        return date(today.year + 1, month, day)
+    if candidate > today + timedelta(days=182):
+        return date(today.year - 1, month, day)
+    return candidate
+
+
+# Statistics of the current run (read by benchmark_scrapers.py)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_stats():
+    """Returns per website the pages loaded, the upper limit of pages and the pages saved by stopping at the horizon."""
+    with _stats_lock:
+        return {source: dict(stats) for source, stats in _stats.items()}
+
+
+class PaginationController:
+    """Decides page by page whether a scraper has to load the next page of an event list sorted by date."""
+
+    def __init__(self, source, max_pages=None, horizon_days=None, today=None):
+        """
+        Args:
+            source (str): Name of the website (key of the statistics, several lists of a website are added up).
+            max_pages (int): Upper limit of pages (the former fixed page count), None if the list ends by itself.
+            horizon_days (int): Number of days in advance events are needed for (HORIZON_DAYS if None).
+            today (date): First day of the horizon (today if None).
+        """
+        self.source = source
+        self.max_pages = max_pages
+        self.today = today or date.today()
+        self.horizon = self.today + timedelta(days=HORIZON_DAYS if horizon_days is None else horizon_days)
+        self.pages = 0
+        self.beyond_horizon = False
+
+    def add_page(self, dates):
+        """Counts a loaded page with the dates of its events and returns whether the next page is needed."""
+        self.pages += 1
+        parsed = [day for day in (parse_event_date(value, self.today) for value in dates) if day is not None]
+        if parsed and max(parsed) > self.horizon:
+            self.beyond_horizon = True
+        return self.should_continue()
+
+    def should_continue(self):
+        if self.beyond_horizon:
+            return False
+        return self.max_pages is None or self.pages < self.max_pages
+
+    def is_beyond_horizon(self, value):
+        """Returns whether the date of one event lies beyond the horizon (events without date are kept)."""
+        day = parse_event_date(value, self.today)
+        return day is not None and day > self.horizon
+
+    def finish(self):
+        """Records the statistics of this list."""
+        saved = max(self.max_pages - self.pages, 0) if self.max_pages is not None and self.beyond_horizon else 0
+        with _stats_lock:
+            stats = _stats.setdefault(self.source, {"pages": 0, "max_pages": 0, "pages_saved": 0})
+            stats["pages"] += self.pages
+            stats["max_pages"] += self.max_pages if self.max_pages is not None else self.pages
+            stats["pages_saved"] += saved
+        if saved:
+            print(f"{self.source}: horizon {self.horizon.isoformat()} reached after {self.pages} of {self.max_pages} pages ({saved} pages saved).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+        return False
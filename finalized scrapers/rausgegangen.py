@@ -4,21 +4,27 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver
+from dom_extraction import extract_records
+from waiting import page_ready, site_timeout, wait_for_network_idle
+from event_sink import collect_events
+from consent_profiles import ensure_consent
+from pagination import PaginationController
 
-import pandas as pd
 from datetime import datetime
-import time
 
 
 # Scraping function
 
-def scrape_rausgegangen_hh_ki_hl_fl():
+def scrape_rausgegangen_hh_ki_hl_fl(cities=None, sink=None): # Optional parameter to only scrape some of the cities below
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_rausgegangen_events(cities), sink)
+
+
+def iter_rausgegangen_events(cities=None):
 
     # Defining the urls to scrape, varying location and category to use the url as an api to the website
     # For each url specifying city and category and pages to loop through explicitly
@@ -36,99 +42,88 @@ def scrape_rausgegangen_hh_ki_hl_fl():
         ("https://rausgegangen.de/flensburg/kategorie/party/", 'Flensburg', 'Party', 1),
         ("https://rausgegangen.de/flensburg/kategorie/feste-und-festival/", 'Flensburg', 'Feste & Festival', 1)
     ]
+    if cities is not None:
+        scraping = [part for part in scraping if part[1] in cities]
 
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website)
-    options = Options()
-    options.add_argument("--headless")  # Run Chromium in headless mode
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get("https://rausgegangen.de/hamburg/kategorie/konzerte-und-musik/")
-
-    # Closing the cookie window, if it appears
-    try:
-        wait = WebDriverWait(driver, 10)
-        reject_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, 'iubenda-cs-reject-btn')))
-        reject_button.click()
-    except Exception as e:
-        print("No cookie window to reject, but no problem.")
+    # Preparations for scraping (leasing a Chrome driver from the shared pool, opening the website)
+    driver = acquire_driver(site="rausgegangen")
 
-    # Changing website language settings to German (if necessary, depends on used driver)
+    # The driver is handed back to the pool in any case, also if the page doesn't load or the generator is not consumed until the end
     try:
-        sidemenu_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//button[@aria-label="Sidemenu"]')))
-        sidemenu_button.click()
-        submit_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//form[@action="/i18n/setlang/"]//button[@type="submit"]')))
-        submit_button.click() 
-    except Exception as e:
-        print("No language switch needed here.")
-
-    time.sleep(4)
-
-    # Creating a list to store events
-    data = []
-
-    # Iterating over the different urls to scrape and opening each of them
-    for part in scraping:
-
-        driver.get(part[0])
-        time.sleep(4)
-
-        # Navigating through the webpage by clicking on the "next" button as many times as heuristically defined for each url in the beginning
-        for i in range(part[3]):
-
-            # Finding all events per page, the specific web element representing an event is identified via class name
-            # As some category and city combinations sometimes don't yield any results, a try-except statement is used, so that this doesn't make the overall process fail
-            try:
-                tiles = wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'tile-medium')))
-
-                # Iterating over all found event elements and extracting the required information
-                # Some initial preprocessing is already applied to date and time information
-                for tile in tiles:
-                    source = tile.find_element(By.TAG_NAME, 'a').get_attribute('href')
-                    
-                    date_time_element = tile.find_element(By.CLASS_NAME, 'text-sm')
-                    date_time_text = date_time_element.text.split('|')
-                    date = date_time_text[0].strip() if len(date_time_text) > 0 else ''
-                    times = date_time_text[1].strip() if len(date_time_text) > 1 else ''
+        driver.get("https://rausgegangen.de/hamburg/kategorie/konzerte-und-musik/")
 
-                    event_name = tile.find_element(By.CLASS_NAME, 'text-truncate--2').text
-
-                    location = tile.find_element(By.CLASS_NAME, 'opacity-70').text
-
-                    price = tile.find_element(By.CLASS_NAME, 'text-primary').text
-
-                    # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-                    data.append({
-                        "Source": source,
-                        "Date": date,
-                        "Time": times,
-                        "Subject": event_name,
-                        "Location": location,
-                        "Price": price,
-                        "City": part[1], # using the information specified explicitly related to each url
-                        "Category": part[2], # using the information specified explicitly related to each url
-                        "Music label": True # all scraped events from this website are music related
-                    })
-
-            except Exception as e:
-                print(f"No events in this category and city combination")
-                continue
-
-            # Navigating by clicking on the "next" button, if possible and if more than one page of results is supposed to be scraped for the respective url
-            if part[3] > 1:
-                try:
-                    next_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//li[@class="list-none"]/a[span[text()="Nächste"]]')))
-                    next_button.click()
-                    time.sleep(4)
-                except Exception as e:
-                    continue
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df_raw = pd.DataFrame(data)
-    df_raw = df_raw[['Subject', 'Date', 'Time', 'Location', 'Price', 'Source', 'City', 'Category', 'Music label']]
-    driver.close()
-
-    return df_raw
+        # Closing the cookie window, if it appears (skipped if the consent stored in the profile of this website was restored, see consent_profiles.py)
+        wait = WebDriverWait(driver, 10)
+        ensure_consent(driver, "rausgegangen", close_cookie_window)
+
+        # Changing website language settings to German (if necessary, depends on used driver)
+        try:
+            sidemenu_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//button[@aria-label="Sidemenu"]')))
+            sidemenu_button.click()
+            submit_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//form[@action="/i18n/setlang/"]//button[@type="submit"]')))
+            submit_button.click() 
+        except Exception as e:
+            print("No language switch needed here.")
+
+        wait_for_network_idle(driver, site_timeout("rausgegangen"))
+
+        # Iterating over the different urls to scrape: the urls are loaded at the same time in several tabs of the browser (which share
+        # the cookie and language settings) and each url is scraped as soon as its event tiles are there (see driver_pool.py)
+        parts = {part[0]: part for part in scraping}
+        for url, _ in driver.iter_ready_tabs(list(parts), page_ready('.tile-medium'), timeout=site_timeout("rausgegangen")):
+            part = parts[url]
+
+            # Navigating through the webpage by clicking on the "next" button at most as many times as heuristically defined for each url in the beginning,
+            # the events are sorted by date, so no further page is loaded once a page reaches beyond the scraping horizon (see pagination.py)
+            with PaginationController("rausgegangen", max_pages=part[3]) as pager:
+                for i in range(part[3]):
+
+                    # Finding all events per page, the specific web element representing an event is identified via class name
+                    # As some category and city combinations sometimes don't yield any results, a try-except statement is used, so that this doesn't make the overall process fail
+                    dates = []
+                    try:
+                        wait.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'tile-medium')))
+
+                        # Extracting the required information of all found event elements with one call to the browser (see tile_fields below)
+                        # Some initial preprocessing is already applied to date and time information, tiles with missing information are skipped
+                        for tile in extract_records(driver, '.tile-medium', tile_fields):
+                            if None in tile.values():
+                                continue
+
+                            date_time_text = tile["Date_Time"].split('|')
+                            date = date_time_text[0].strip() if len(date_time_text) > 0 else ''
+                            dates.append(date)
+                            times = date_time_text[1].strip() if len(date_time_text) > 1 else ''
+
+                            # All information per event is stored into a dictionary (in the column order of the raw data) and the dictionary is handed on
+                            yield {
+                                "Subject": tile["Subject"],
+                                "Date": date,
+                                "Time": times,
+                                "Location": tile["Location"],
+                                "Price": tile["Price"],
+                                "Source": tile["Source"],
+                                "City": part[1], # using the information specified explicitly related to each url
+                                "Category": part[2], # using the information specified explicitly related to each url
+                                "Music label": True # all scraped events from this website are music related
+                            }
+
+                    except Exception as e:
+                        print(f"No events in this category and city combination")
+                        continue
+
+                    # Navigating by clicking on the "next" button, if possible and if another page of results is needed for the respective url
+                    if not pager.add_page(dates):
+                        break
+                    try:
+                        next_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//li[@class="list-none"]/a[span[text()="Nächste"]]')))
+                        next_button.click()
+                        wait_for_network_idle(driver, site_timeout("rausgegangen"))
+                    except Exception as e:
+                        continue
+    finally:
+        # Last step: Handing the driver back to the pool
+        release_driver(driver)
 
 
 # Preprocessing function
@@ -154,6 +149,26 @@ def preprocess_rausgegangen(df_raw):
 
 # Helper functions and elements
 
+def close_cookie_window(driver):
+    # Function to reject the cookies in the cookie window, returns whether it worked
+    try:
+        reject_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable((By.CLASS_NAME, 'iubenda-cs-reject-btn')))
+        reject_button.click()
+        return True
+    except Exception as e:
+        print("No cookie window to reject, but no problem.")
+        return False
+
+
+# Fields read from each event tile (CSS selector and attribute per field, see dom_extraction.py)
+tile_fields = {
+    "Source": ("a", "href"),
+    "Date_Time": (".text-sm", "text"),
+    "Subject": (".text-truncate--2", "text"),
+    "Location": (".opacity-70", "text"),
+    "Price": (".text-primary", "text"),
+}
+
 # Mapping of German month abbreviations to correct numerical representations
 month_mapping = {
     'Jan': '01',
@@ -202,8 +217,9 @@ def convert_date_patch(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_rausgegangen_hh_ki_hl_fl()
-df_prep = preprocess_rausgegangen(df_raw)
-df_prep.to_csv("Scraped_Events_Rausgegangen_HH_KI_HL_FL.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_rausgegangen_hh_ki_hl_fl()
+    df_prep = preprocess_rausgegangen(df_raw)
+    df_prep.to_csv("Scraped_Events_Rausgegangen_HH_KI_HL_FL.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
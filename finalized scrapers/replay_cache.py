@@ -0,0 +1,300 @@
+# Offline record and replay of all pages the scrapers fetch
+# With REPLAY_MODE=record every page fetched over http (see http_fetch.py) or opened in a pooled Chrome (see driver_pool.py)
+# is stored in a local archive (url, status, headers and the gzip compressed body, one file per page). With REPLAY_MODE=replay
+# the scrapers don't talk to the websites at all: a local stand-in server answers all requests from the archive, Chrome is
+# pointed at it and the http session sends its requests to it. This allows running and timing the scrapers deterministically
+# without network access (see benchmark_scrapers.py).
+#
+# Pages opened in Chrome are stored as the final html snapshot (with all events loaded, scripts except JSON-LD removed) when the scraper leaves
+# the page, as the JavaScript requests of the websites can't be recorded. While recording, the events read from a lazy-load
+# list stay on the page (see dom_extraction.py), so the snapshot contains all of them. Navigating by clicking on links can't
+# be replayed, pages are only found in the archive by the url opened with driver.get().
+#
+# The scrapers build their urls and horizons from the current date, so the archive also stores when it was recorded
+# (recording.json). In replay mode the clock of the scraper modules is frozen at that time (see freeze_clock()), so an
+# archive recorded yesterday requests the same urls today.
+
+# Imports
+
+from requests.adapters import HTTPAdapter
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urljoin, urlparse, parse_qs
+from pathlib import Path
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+
+# "record", "replay" or None (talking to the websites as usual)
+REPLAY_MODE = os.getenv("REPLAY_MODE")
+
+# Folder of the archive
+REPLAY_ARCHIVE = Path(os.getenv("REPLAY_ARCHIVE", "replay_archive"))
+
+# Response headers that are not replayed (the stand-in server sends the body uncompressed and in one piece)
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie"}
+
+
+class ReplayArchive:
+    """Folder with one gzip compressed file per recorded page (a JSON line with url, status and headers, then the body)."""
+
+    def __init__(self, path=REPLAY_ARCHIVE):
+        self.path = Path(path)
+
+    @property
+    def recording_file(self):
+        return self.path / "recording.json"
+
+    def recorded_at(self):
+        """Returns the time the archive was recorded as timestamp (None if it wasn't recorded yet)."""
+        if not self.recording_file.exists():
+            return None
+        return json.loads(self.recording_file.read_text(encoding="utf-8"))["recorded_at"]
+
+    @staticmethod
+    def key(method, url, body=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.sha1(f"{method.upper()} {url}".encode("utf-8") + b"\n" + (body or b""))
+        return digest.hexdigest()
+
+    def save(self, method, url, status, headers, content, body=None):
+        """Stores one page (content is the response body as bytes or str)."""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        meta = {"method": method.upper(), "url": url, "status": status, "headers": dict(headers), "recorded": time.time()}
+        self.path.mkdir(parents=True, exist_ok=True)
+        if not self.recording_file.exists():
+            self.recording_file.write_text(json.dumps({"recorded_at": meta["recorded"]}), encoding="utf-8")
+        target = self.path / f"{self.key(method, url, body)}.gz"
+        temporary = target.with_suffix(f".{threading.get_ident()}.tmp")
+        with gzip.open(temporary, "wb") as file:
+            file.write(json.dumps(meta).encode("utf-8") + b"\n" + content)
+        os.replace(temporary, target)
+
+    def load(self, method, url, body=None):
+        """Returns (meta, content) of a recorded page or None if the page isn't in the archive."""
+        target = self.path / f"{self.key(method, url, body)}.gz"
+        if not target.exists():
+            return None
+        with gzip.open(target, "rb") as file:
+            meta, content = file.read().split(b"\n", 1)
+        return json.loads(meta), content
+
+    def entries(self):
+        """Returns the meta data of all recorded pages."""
+        metas = []
+        for target in sorted(self.path.glob("*.gz")):
+            with gzip.open(target, "rb") as file:
+                metas.append(json.loads(file.readline()))
+        return metas
+
+
+# Statistics of the current run (read by benchmark_scrapers.py)
+
+_stats = {"pages": 0, "load_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def count_page(seconds):
+    """Counts one loaded page and the time it took to load it."""
+    with _stats_lock:
+        _stats["pages"] += 1
+        _stats["load_seconds"] += seconds
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(pages=0, load_seconds=0.0)
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# Archive and stand-in server shared by all scrapers of this process (created when first needed)
+_archive = None
+_server = None
+_lock = threading.Lock()
+
+
+def get_archive():
+    global _archive
+    with _lock:
+        if _archive is None:
+            _archive = ReplayArchive()
+        return _archive
+
+
+def get_replay_server():
+    """Returns the running stand-in server, starting it on a free local port when first needed."""
+    global _server
+    archive = get_archive()
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("127.0.0.1", 0), ReplayRequestHandler)
+            _server.archive = archive
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def local_url(url):
+    """Url under which the stand-in server serves a recorded page."""
+    host, port = get_replay_server().server_address[:2]
+    return f"http://{host}:{port}/?{urlencode({'url': url})}"
+
+
+def original_url(url):
+    """Turns a url of the stand-in server back into the url of the website (other urls are returned unchanged)."""
+    host, port = get_replay_server().server_address[:2]
+    parts = urlparse(url)
+    if parts.netloc != f"{host}:{port}":
+        return url
+    return parse_qs(parts.query).get("url", [url])[0]
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """Answers requests of Chrome and the http session with the recorded pages."""
+
+    def do_GET(self):
+        self.replay(None)
+
+    def do_POST(self):
+        self.replay(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    def replay(self, body):
+        url = parse_qs(urlparse(self.path).query).get("url", [""])[0]
+        recorded = self.server.archive.load(self.command, url, body)
+        if recorded is None:
+            self.send_error(404, f"Not in the replay archive: {self.command} {url}")
+            return
+
+        meta, content = recorded
+        content_type = next((value for name, value in meta["headers"].items() if name.lower() == "content-type"), "")
+        if "html" in content_type:
+            content = add_base_url(content, url)
+
+        self.send_response(meta["status"])
+        for name, value in meta["headers"].items():
+            if name.lower() == "location":
+                value = local_url(urljoin(url, value))  # redirects are followed within the archive
+            if name.lower() not in SKIPPED_HEADERS:
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass  # no log line per replayed page
+
+
+def add_base_url(content, url):
+    # Relative links of a replayed page are resolved against the url of the website (so the scrapers read the same links)
+    if re.search(rb"<base\s", content[:4096], re.IGNORECASE):
+        return content
+    base = b'<base href="' + url.replace('"', "%22").encode("utf-8") + b'">'
+    head = re.search(rb"<head[^>]*>", content, re.IGNORECASE)
+    if head is None:
+        return base + content
+    return content[:head.end()] + base + content[head.end():]
+
+
+# Hooks for the http session (see http_fetch.py)
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that stores every response in the archive."""
+
+    def send(self, request, **kwargs):
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        count_page(time.monotonic() - start)
+        get_archive().save(request.method, request.url, response.status_code, response.headers, response.content, request.body)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Transport adapter that sends every request to the stand-in server instead of the website."""
+
+    def send(self, request, **kwargs):
+        url = request.url
+        request.url = local_url(url)
+        start = time.monotonic()
+        response = super().send(request, **kwargs)
+        count_page(time.monotonic() - start)
+        # The response looks like the one of the website (url and redirect target)
+        request.url = response.url = url
+        if "Location" in response.headers:
+            response.headers["Location"] = original_url(response.headers["Location"])
+        return response
+
+
+def http_adapter(**kwargs):
+    """Returns the transport adapter for the http session of the current replay mode."""
+    if REPLAY_MODE == "record":
+        return RecordingAdapter(**kwargs)
+    if REPLAY_MODE == "replay":
+        return ReplayAdapter(**kwargs)
+    return HTTPAdapter(**kwargs)
+
+
+# Hooks for Chrome (see driver_pool.py)
+
+def browser_url(url):
+    """Url Chrome has to open for a page of a website in the current replay mode."""
+    if REPLAY_MODE == "replay" and url.startswith(("http://", "https://")):
+        return local_url(url)
+    return url
+
+
+def record_snapshot(url, html):
+    """
+    Stores the final html of a page opened in Chrome (without scripts except JSON-LD, so the replayed page doesn't change
+    anymore, and without the marks of events already read, so the replayed events are read again).
+    """
+    html = re.sub(r"<script\b(?![^>]*ld\+json)[^>]*>.*?</script>", "", html, flags=re.IGNORECASE | re.DOTALL)
+    html = re.sub(r"\sdata-harvested(=\"\")?", "", html)
+    get_archive().save("GET", url, 200, {"Content-Type": "text/html; charset=utf-8"}, html)
+
+
+# Clock of the scrapers in replay mode
+
+def frozen_clock(timestamp):
+    """Returns date and datetime classes whose today() and now() return the given time."""
+
+    class FrozenDate(date):
+        @classmethod
+        def today(cls):
+            return cls.fromtimestamp(timestamp)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(timestamp, tz)
+
+        @classmethod
+        def today(cls):
+            return cls.fromtimestamp(timestamp)
+
+    return FrozenDate, FrozenDatetime
+
+
+def freeze_clock(module, archive=None):
+    """In replay mode, freezes date.today() and datetime.now() of a module at the time the archive was recorded."""
+    if REPLAY_MODE != "replay":
+        return
+    timestamp = (archive or get_archive()).recorded_at()
+    if timestamp is None:
+        return
+    frozen_date, frozen_datetime = frozen_clock(timestamp)
+    if getattr(module, "date", None) is date:
+        module.date = frozen_date
+    if getattr(module, "datetime", None) is datetime:
+        module.datetime = frozen_datetime
@@ -0,0 +1,247 @@
+# Registry of all scrapers in this folder
+# Every scraper is described once here (script, scraping and preprocessing function, output file, website), so that the orchestrator
+# can import and run the scrapers within one Python process instead of starting a new interpreter per scraper script.
+# The function run_scraper_plugin() offers the same call signature for all scrapers (source name, cities, days in advance)
+# and streams the events of every scraper into a JSON lines file while it runs (see event_sink.py). The events are read
+# back and preprocessed in chunks (iter_scraper_frames()), run_scraper_plugin_to_csv() writes them to a CSV file chunk by chunk
+# without ever holding all events of a scraper in memory. Where the run time of a
+# scraper went is written to a time profile after every run (see time_accounting.py), and the concurrency limits of the
+# websites the scraper talked to are logged (see concurrency.py).
+
+# Imports
+
+from event_sink import CHUNK_SIZE, iter_event_frames, spool_sink
+from time_accounting import profiled, timed, write_profile
+from concurrency import get_controller
+from replay_cache import freeze_clock
+
+import pagination
+
+import importlib.util
+import inspect
+import logging
+import pandas as pd
+import sys
+from pathlib import Path
+
+
+# Folder of this file, which is also the folder of all scraper scripts
+SCRAPER_DIR = Path(__file__).resolve().parent
+
+# Description of every scraper: the script file, the names of its scraping and preprocessing functions
+# (preprocess is None if the scraping function already returns data in the final format, it has to work on any part of
+# the events, as they are preprocessed in chunks), the csv file written when
+# running the script directly and the website it talks to
+SCRAPER_PLUGINS = {
+    "biunsinnorden": {
+        "script": "biunsinnorden.py",
+        "scrape": "scrape_biunsinnorden_sh_hh",
+        "preprocess": "preprocess_biunsinnorden",
+        "output": "Scraped_Events_BiUnsInNorden_SH_HH.csv",
+        "domain": "biunsinnorden.de",
+    },
+    "eventbrite": {
+        "script": "eventbrite.py",
+        "scrape": "scrape_eventbrite_hh_sh",
+        "preprocess": "preprocess_eventbrite",
+        "output": "Scraped_Events_HH_SH_Eventbrite.csv",
+        "domain": "eventbrite.de",
+    },
+    "eventim": {
+        "script": "eventim.py",
+        "scrape": "scrape_eventim",
+        "preprocess": "preprocess_eventim",
+        "output": "Scraped_Events_Eventim_HH_SH.csv",
+        "domain": "eventim.de",
+    },
+    "hamburg_de": {
+        "script": "hamburg_de.py",
+        "scrape": "scrape_hamburg_de",
+        "preprocess": "preprocess_hamburg_de",
+        "output": "Scraped_Events_Hamburg.csv",
+        "domain": "infomaxnet.de",
+    },
+    "neumuenster": {
+        "script": "our_neumuenster_py.py",
+        "scrape": "scraping_neumuenster",
+        "preprocess": "cleaning_neumuenster",
+        "output": "Scraped_Events_Neumuenster.csv",
+        "domain": "neumuenster.de",
+    },
+    "kiel_sailing_city": {
+        "script": "kiel-sailing-city.py",
+        "scrape": "scrape_kiel_sailing_city",
+        "preprocess": "preprocess_kiel_sailing_city",
+        "output": "Scraped_Events_Kiel_Sailing_City.csv",
+        "domain": "kiel-sailing-city.de",
+    },
+    "live_gigs": {
+        "script": "live_gigs.py",
+        "scrape": "scrape_live_gigs_hh_sh",
+        "preprocess": "preprocess_live_gigs",
+        "output": "Scraped_Events_Live_Gigs_HH_SH.csv",
+        "domain": "livegigs.de",
+    },
+    "sh_tourismus": {
+        "script": "sh-tourismus.py",
+        "scrape": "scrape_sh_tourismus",
+        "preprocess": "preprocess_sh_tourismus",
+        "output": "Scraped_Events_Schleswig_Holstein.csv",
+        "domain": "infomaxnet.de",
+    },
+    "rausgegangen": {
+        "script": "rausgegangen.py",
+        "scrape": "scrape_rausgegangen_hh_ki_hl_fl",
+        "preprocess": "preprocess_rausgegangen",
+        "output": "Scraped_Events_Rausgegangen_HH_KI_HL_FL.csv",
+        "domain": "rausgegangen.de",
+    },
+    "unser_luebeck": {
+        "script": "unser_luebeck.py",
+        "scrape": "scrape_unser_luebeck",
+        "preprocess": "preprocess_unser_luebeck",
+        "output": "Scraped_Events_Unser_Luebeck.csv",
+        "domain": "unser-luebeck.de",
+    },
+    "kiel_magazin": {
+        "script": "kiel-magazin.py",
+        "scrape": "scrape_kiel_magazin",
+        "preprocess": "preprocess_kiel_magazin",
+        "output": "Scraped_Events_Kiel_Magazin.csv",
+        "domain": "kiel-magazin.de",
+    },
+    "meine_stadt": {
+        "script": "meine_stadt.py",
+        "scrape": "scrape_meine_stadt",
+        "preprocess": "preprocess_meine_stadt",
+        "output": "Scraped_Events_Meine_Stadt.csv",
+        "domain": "meinestadt.de",
+    },
+    "wasgeht": {
+        "script": "wasgeht.py",
+        "scrape": "scrape_wasgeht",
+        "preprocess": "preprocess_wasgeht",
+        "output": "Scraped_Events_wasgeht.csv",
+        "domain": "wasgehtapp.de",
+    },
+}
+
+
+def plugin_for_script(script):
+    """Returns the name of the scraper plugin that belongs to a scraper script file name."""
+    for source, plugin in SCRAPER_PLUGINS.items():
+        if plugin["script"] == script:
+            return source
+    raise KeyError(f"No scraper plugin registered for script: {script}")
+
+
+def load_plugin_module(source):
+    """Imports the script of a scraper (only once per process) and returns the module."""
+    plugin = SCRAPER_PLUGINS[source]
+    module_name = f"scraper_{source}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    # The scripts import shared helpers from this folder, so it has to be importable
+    if str(SCRAPER_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRAPER_DIR))
+
+    # Loading by file path, as some script names (e.g. kiel-magazin.py) are no valid module names
+    spec = importlib.util.spec_from_file_location(module_name, SCRAPER_DIR / plugin["script"])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[module_name]
+        raise
+
+    # Replayed runs see the date the pages were recorded at (see replay_cache.py)
+    freeze_clock(module)
+    freeze_clock(pagination)
+    return module
+
+
+def get_entry_points(source):
+    """Returns the scraping and preprocessing function of a scraper (preprocessing may be None)."""
+    plugin = SCRAPER_PLUGINS[source]
+    module = load_plugin_module(source)
+    scrape = getattr(module, plugin["scrape"])
+    preprocess = getattr(module, plugin["preprocess"]) if plugin["preprocess"] else None
+    return scrape, preprocess
+
+
+def iter_scraper_frames(source, cities=None, days_in_advance=None, sink=None, chunk_size=CHUNK_SIZE):
+    """
+    Runs one scraper in this process and yields its events in the agreed final data format, as dataframes of at most
+    chunk_size events.
+
+    Args:
+        source (str): Name of the scraper in SCRAPER_PLUGINS.
+        cities (list): Optional list of cities to restrict the scraping to.
+        days_in_advance (int): Optional number of days in advance to scrape events for.
+        sink (EventSink): Where the raw events are streamed to while scraping, by default a JSON lines file per scraper
+            in event_sink.EVENT_SPOOL_DIR, so the events scraped so far survive a crash.
+        chunk_size (int): Number of events read back from the sink and preprocessed at once.
+    """
+    scrape, preprocess = get_entry_points(source)
+
+    # Only handing over the parameters that the scraping function of this website supports
+    parameters = inspect.signature(scrape).parameters
+    kwargs = {}
+    if cities is not None and "cities" in parameters:
+        kwargs["cities"] = cities
+    if days_in_advance is not None and "days_in_advance" in parameters:
+        kwargs["days_in_advance"] = days_in_advance
+    if "sink" in parameters:
+        kwargs["sink"] = sink or spool_sink(source)
+
+    controller = get_controller()
+    requests_before = controller.request_counts()
+    # The profile and the limits are also written if the scraper fails or the frames are not consumed until the end
+    profile = None
+    try:
+        with profiled(source) as profile:
+            result = scrape(**kwargs)
+            for df in iter_event_frames(result, chunk_size):
+                if preprocess is not None:
+                    with timed("preprocess"):
+                        df = preprocess(df)
+
+                # Websites without city selection are filtered afterwards
+                if cities is not None and "cities" not in parameters and "City" in df.columns:
+                    df = df[df["City"].isin(cities)]
+                yield df
+    finally:
+        if profile is not None:
+            write_profile(profile)
+
+        # The controller is shared by all scrapers of the process, only the domains of this scraper are logged
+        touched = [domain for domain, count in controller.request_counts().items() if count != requests_before.get(domain, 0)]
+        if touched:
+            logging.info(f"Concurrency limits after {source}:\n{controller.summary(touched)}")
+
+
+def run_scraper_plugin(source, cities=None, days_in_advance=None, sink=None):
+    """Runs one scraper in this process and returns all its events in the agreed final data format (see iter_scraper_frames())."""
+    frames = list(iter_scraper_frames(source, cities, days_in_advance, sink))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_scraper_plugin_to_csv(source, output_file, cities=None, days_in_advance=None, sink=None):
+    """
+    Runs one scraper in this process and writes its events in the agreed final data format to output_file (without index,
+    like the scraper scripts), chunk by chunk. Returns the number of events written.
+    """
+    rows = 0
+    columns = None
+    with open(output_file, "w", encoding="utf-8", newline="") as file:
+        for df in iter_scraper_frames(source, cities, days_in_advance, sink):
+            header = columns is None
+            if header:
+                columns = list(df.columns)
+            df.reindex(columns=columns).to_csv(file, index=False, header=header)
+            rows += len(df)
+    return rows
@@ -4,115 +4,18 @@
 
 # Imports
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, NoSuchElementException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from infomax import scrape_infomax
 
 import pandas as pd
-import time
 
 
 # Scraping function
 
-def scrape_sh_tourismus(days_in_advance=10): # Optional parameter for how many days in advance to scrape events for
-    
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website, defining waits)
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get('https://www.sh-tourismus.de/veranstaltungskalender')
-    wait = WebDriverWait(driver, 10)
-
-    # Open the embedded website from the iframe on the website that contains the calendar content
-    driver.get('https://tashwhl.infomaxnet.de/event_sh-tourismus/?widgetToken=zOpiJSoCowQ.&amp;')
-    time.sleep(5)
-    #iframe = WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, 'iframe[src*="tashwhl.infomaxnet.de"]'))) #not working in headless mode
-    #driver.switch_to.frame(iframe)
-
-    # Defining how far to scroll down and load more events according to a heuristic to minimally cover the chosen number of days in advance 
-    clicks = days_in_advance*30 + 100
-
-    # Iterating over the number of clicks defined above and clicking on the "load more events" button that often (if possible)
-    for i in range(clicks):
-        time.sleep(2)
-        try:
-            button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, '-IMXEVENT-lazyLoadButton')))
-            button.click()
-        except StaleElementReferenceException:
-            continue
-        except TimeoutException:
-            print("Button not found or not clickable within the timeout period.")
-            break
-
-    # Finding all loaded events on the whole page, the specific web element representing an event is identified via CSS selector
-    articles = driver.find_elements(By.CSS_SELECTOR, 'article.-IMXEVNT-listElement')
-
-    # Creating a list to store events
-    events_data = []
-
-    # Iterating over all found event elements and extracting the required information
-    # As sometimes not all information is available per event, this part was made robust by using try-except statements
-    # This website has (almost) the same html structure as Hamburg.de event calendar, so also the information is retrieved the same way
-    for article in articles:
-        try:
-            event_category = article.find_element(By.CSS_SELECTOR, 'p.-IMXEVNT-listElement__text__subline').text
-        except NoSuchElementException:
-            event_category = ' '
-
-        try:
-            event_title = article.find_element(By.CSS_SELECTOR, 'span.-IMXEVNT-title').get_attribute('data-uppertitle')
-        except NoSuchElementException:
-            event_title = ' '
-
-        try:
-            event_date_location = article.find_element(By.CSS_SELECTOR, 'p.-IMXEVNT-listElement__text__info').text
-        except NoSuchElementException:
-            event_date_location = ' '
-
-        if event_date_location != ' ':
-            parts = [x.strip() for x in event_date_location.split('/')]
-        else:
-            parts = []
-
-        if len(parts) >= 3:
-            date, time_x, location = parts[0], parts[1], ' / '.join(parts[2:])
-        elif len(parts) == 2:
-            date, time_x, location = parts[0], parts[1], ''
-        else:
-            date, time_x, location = ' ', ' ', ' '
-
-        if ',' in location:
-            location, city = [x.strip() for x in location.rsplit(',', 1)]
-        else:
-            location, city = location, ' '
-
-        try:
-            event_source = article.find_element(By.CSS_SELECTOR, 'h2 a').get_attribute('href')
-        except NoSuchElementException:
-            event_source = ' '
-
-        # All information per event is stored into a dictionary and the dictionary is appended to the list of events
-        events_data.append({
-            'Category': event_category,
-            'Title': event_title,
-            'Date': date,
-            'Time': time_x,
-            'Location': location,
-            'City': city,
-            'Source': event_source
-        })
-
-    # Last steps: Creating the dataframe of raw data from the event list, closing the driver and returning the dataframe
-    df = pd.DataFrame(events_data)
-    driver.close()
-
-    return df
+def scrape_sh_tourismus(days_in_advance=10, sink=None): # Optional parameter for how many days in advance to scrape events for
+
+    # The event calendar is an embedded Infomax widget (the same as on Hamburg.de), so the shared engine in infomax.py is used,
+    # which requests the result pages of the widget directly and only falls back to clicking through the list in the browser if necessary
+    return scrape_infomax(widget, days_in_advance, sink)
 
 
 # Preprocessing function
@@ -135,6 +38,14 @@ def preprocess_sh_tourismus(df_raw):
 
 # Helper functions and elements
 
+# Configuration of the embedded Infomax widget containing the calendar content (see infomax.py)
+widget = {
+    'name': 'sh_tourismus',
+    'url': 'https://tashwhl.infomaxnet.de/event_sh-tourismus/',
+    'widget_token': 'zOpiJSoCowQ.',
+    'default_city': ' '
+}
+
 def preprocess_time(time_str):
     # Helper function to process start time and, if stated, end time into correct format
     if '-' in time_str:
@@ -167,9 +78,10 @@ def convert_date_format(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_sh_tourismus(10)
-df_prep = preprocess_sh_tourismus(df_raw)
-df_prep.to_csv("Scraped_Events_Schleswig_Holstein.csv")
-print(df_prep.head())
-print(df_prep.info())
+if __name__ == "__main__":
+    df_raw = scrape_sh_tourismus(10)
+    df_prep = preprocess_sh_tourismus(df_raw)
+    df_prep.to_csv("Scraped_Events_Schleswig_Holstein.csv")
+    print(df_prep.head())
+    print(df_prep.info())
 
@@ -0,0 +1,214 @@
+# Fast path for websites publishing their events as schema.org structured data
+# Many event calendars describe every event a second time in machine readable form, either as microdata in the html
+# (itemscope/itemtype="http://schema.org/Event" with itemprop="startDate", ...) or as JSON-LD
+# (<script type="application/ld+json">{"@type": "Event", ...}</script>). extract_events() reads both kinds from a parsed page
+# in a single pass over the document and maps them straight to the agreed final data format (EVENT_COLUMNS), so a scraper
+# doesn't need CSS selectors per field. Information the website doesn't publish as structured data can still be read with
+# field selectors (see dom_extraction.py), these only fill the gaps (or replace ambiguous microdata with overrides).
+
+# Imports
+
+from dom_extraction import read_fields
+
+from urllib.parse import urljoin
+import json
+import re
+
+
+# Columns of the agreed final data format
+EVENT_COLUMNS = ['Subject', 'Start_date', 'End_date', 'Start_time', 'End_time', 'Location', 'City', 'Description', 'Category', 'Music_label']
+
+# Structured data selector: JSON-LD scripts and microdata items
+STRUCTURED_DATA_SELECTOR = 'script[type="application/ld+json"], [itemscope][itemtype]'
+
+# Dates and times as written in structured data ("2024-05-17T20:00:00+02:00") or on the website ("17.05.2024", "20:00 Uhr")
+ISO_DATE_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{1,2}):(\d{2}))?')
+GERMAN_DATE_PATTERN = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+TIME_PATTERN = re.compile(r'(\d{1,2})[:.](\d{2})')
+
+
+def extract_events(soup, base_url=None, item_selector=None, fields=None, overrides=None, defaults=None):
+    """
+    Extracts all schema.org events (microdata and JSON-LD) of a page in the agreed final data format.
+
+    Args:
+        soup: BeautifulSoup object of the page.
+        base_url (str): Url of the page, used to turn relative links into absolute ones.
+        item_selector (str): Optional CSS selector of event elements that carry itemprop markup without declaring an itemscope.
+        fields (dict): Optional column -> (selector, attribute) read from each microdata event element to fill missing columns.
+        overrides (dict): Like fields, but replacing the structured data (for websites whose microdata is ambiguous).
+        defaults (dict): Optional column -> value for columns that are still empty (e.g. {"Music_label": True}).
+
+    Returns:
+        list: One dictionary per event with the columns of EVENT_COLUMNS (missing information is None).
+    """
+    selector = STRUCTURED_DATA_SELECTOR + (f', {item_selector}' if item_selector else '')
+    events = []
+    seen = set()
+
+    # select() returns the JSON-LD scripts and event elements together in document order, so the page is only walked once
+    for element in soup.select(selector):
+        if element.name == 'script':
+            items = [(data, None) for data in json_ld_events(element.string or element.get_text())]
+        elif is_event_type(element.get('itemtype')) or (item_selector and not element.has_attr('itemscope')):
+            if has_event_ancestor(element):
+                continue  # e.g. sub events, they are part of the outer event
+            items = [(read_microdata(element, base_url), element)]
+        else:
+            continue
+
+        for data, element in items:
+            event = map_event(data, base_url)
+            if overrides and element is not None:
+                fill_missing(event, read_fields(element, overrides, base_url), replace=True)
+            if fields and element is not None:
+                fill_missing(event, read_fields(element, fields, base_url))
+            for column, value in (defaults or {}).items():
+                if event.get(column) is None:
+                    event[column] = value
+
+            # Websites publishing microdata and JSON-LD describe the same event twice
+            key = (event['Subject'], event['Start_date'], event['Start_time'], event['Location'])
+            if event['Subject'] is None or key in seen:
+                continue
+            seen.add(key)
+            events.append(event)
+
+    return events
+
+
+# Reading the structured data
+
+def json_ld_events(text):
+    # All event objects of a JSON-LD script (which can contain a single object, a list or a "@graph")
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return []
+
+    events = []
+
+    def collect(value):
+        if isinstance(value, list):
+            for item in value:
+                collect(item)
+        elif isinstance(value, dict):
+            if is_event_type(value.get('@type')):
+                events.append(value)
+            else:
+                collect(value.get('@graph'))
+                collect(value.get('itemListElement'))
+                collect(value.get('item'))
+
+    collect(data)
+    return events
+
+
+def read_microdata(scope, base_url=None):
+    # Properties of one microdata item as dictionary (nested items like the location become nested dictionaries)
+    data = {'@type': scope.get('itemtype')}
+    for element in scope.find_all(attrs={'itemprop': True}):
+        # Properties of nested items belong to the nested item, not to this one
+        owner = element.find_parent(attrs={'itemscope': True})
+        if owner is not None and owner is not scope and any(parent is scope for parent in owner.parents):
+            continue
+        value = read_microdata(element, base_url) if element.has_attr('itemscope') else microdata_value(element, base_url)
+        for name in element['itemprop'] if isinstance(element['itemprop'], list) else element['itemprop'].split():
+            data.setdefault(name, value)
+    return data
+
+
+def microdata_value(element, base_url=None):
+    # Value of a microdata property depending on the html element it is written on
+    if element.name == 'meta':
+        return element.get('content')
+    if element.name in ('a', 'link', 'area') and element.get('href'):
+        return urljoin(base_url, element['href']) if base_url else element['href']
+    if element.name in ('img', 'audio', 'video', 'source', 'iframe', 'embed') and element.get('src'):
+        return urljoin(base_url, element['src']) if base_url else element['src']
+    if element.name == 'time' and element.get('datetime'):
+        return element['datetime']
+    if element.has_attr('content'):
+        return element['content']
+    return ' '.join(element.get_text(' ').split()) or None
+
+
+def is_event_type(item_type):
+    # schema.org Event or one of its sub types (MusicEvent, TheaterEvent, ...)
+    types = item_type if isinstance(item_type, list) else [item_type]
+    return any(isinstance(t, str) and t.rstrip('/').rsplit('/', 1)[-1].endswith('Event') for t in types)
+
+
+def has_event_ancestor(element):
+    return any(is_event_type(parent.get('itemtype')) for parent in element.find_parents(attrs={'itemscope': True}))
+
+
+# Mapping to the agreed final data format
+
+def map_event(data, base_url=None):
+    # schema.org properties -> columns of the final data format (Description holds the link to the event like in the other scrapers)
+    start_date, start_time = split_date_time(first(data.get('startDate')))
+    end_date, end_time = split_date_time(first(data.get('endDate')))
+    location = first(data.get('location'))
+    address = first(location.get('address')) if isinstance(location, dict) else None
+    url = first(data.get('url'))
+    types = data.get('@type') if isinstance(data.get('@type'), list) else [data.get('@type')]
+
+    return {
+        'Subject': text_value(data.get('name')),
+        'Start_date': start_date,
+        'End_date': end_date or start_date,
+        'Start_time': start_time,
+        'End_time': end_time,
+        'Location': text_value(location.get('name')) if isinstance(location, dict) else text_value(location),
+        'City': text_value(address.get('addressLocality')) if isinstance(address, dict) else None,
+        'Description': urljoin(base_url, url) if isinstance(url, str) and base_url else text_value(url) or text_value(data.get('description')),
+        'Category': text_value(data.get('genre')) or text_value(data.get('keywords')),
+        'Music_label': True if any(isinstance(t, str) and t.endswith('MusicEvent') for t in types) else None,
+    }
+
+
+def fill_missing(event, record, replace=False):
+    # Columns read with field selectors only fill what the structured data didn't contain (unless replace is set)
+    for column, value in record.items():
+        if value is None or (event.get(column) is not None and not replace):
+            continue
+        if column in ('Start_date', 'End_date'):
+            value = split_date_time(value)[0]
+        elif column in ('Start_time', 'End_time'):
+            times = TIME_PATTERN.findall(value)
+            if column == 'Start_time' and len(times) > 1 and (event.get('End_time') is None or replace):
+                event['End_time'] = '%02d:%s' % (int(times[1][0]), times[1][1])  # time ranges like "19:00 bis 21:00 Uhr"
+            value = '%02d:%s' % (int(times[0][0]), times[0][1]) if times else None
+        event[column] = value
+    if event.get('End_date') is None:
+        event['End_date'] = event.get('Start_date')
+
+
+def split_date_time(value):
+    # Date (YYYY-MM-DD) and time (HH:MM, None if the value has no time) of a date value
+    if not isinstance(value, str):
+        return None, None
+    match = ISO_DATE_PATTERN.search(value)
+    if match:
+        year, month, day, hour, minute = match.groups()
+        return f"{year}-{month}-{day}", f"{int(hour):02d}:{minute}" if hour else None
+    match = GERMAN_DATE_PATTERN.search(value)
+    if match:
+        day, month, year = match.groups()
+        return f"{year}-{int(month):02d}-{int(day):02d}", None
+    return None, None
+
+
+def first(value):
+    # Properties may be given several times, the first one is used
+    return value[0] if isinstance(value, list) and value else value
+
+
+def text_value(value):
+    value = first(value)
+    if isinstance(value, dict):
+        value = value.get('name')
+    if not isinstance(value, str):
+        return None
+    return ' '.join(value.split()) or None
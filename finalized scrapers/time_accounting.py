@@ -0,0 +1,237 @@
+# Time accounting: where the run time of a scraper goes
+# Every scraper run through the registry (see scraper_registry.py) gets a time profile that splits its run time into:
+#
+#     load        loading pages (driver.get() and http requests, see driver_pool.py and http_fetch.py)
+#     wait        waiting for the page (WebDriverWait.until() and the helpers in waiting.py, including their polling sleeps)
+#     driver      all other round trips to the browser (find_element(), click(), execute_script(), switching tabs, ...)
+#     sleep       fixed time.sleep() calls outside of waiting helpers
+#     extract     reading the events from the page (dom_extraction.py, parsing html)
+#     preprocess  the preprocessing function of the scraper (pandas)
+#     other       the rest of the run time (Python code of the scraper, writing the events to the sink, ...)
+#
+# The time is also split per page (the url last loaded in the thread, or the tab switched to), so the slowest pages of a
+# scraper can be found. Timed calls inside other timed calls count for the outer category only (the find_element() calls
+# WebDriverWait.until() makes count as waiting time). Threads a scraper starts itself have to take the profile of the
+# scraper along (see bind_profile()); their time is added up, so with parallel threads the categories can sum up to more
+# than the run time (other is then 0).
+#
+# WebDriverWait.until() and time.sleep() are only wrapped while a profile is active, so the rest of the process (e.g. the
+# delays of the orchestrator and the lease keepers of the work queue) keeps the plain functions.
+#
+# After every run the profile is written to TIME_PROFILE_DIR/<source>.json and printed as table. Setting TIME_ACCOUNTING=off
+# turns the accounting off.
+
+# Imports
+
+from selenium.webdriver.support.ui import WebDriverWait
+
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+import json
+import os
+import threading
+import time
+
+
+# Folder of the time profiles
+TIME_PROFILE_DIR = Path(os.getenv("TIME_PROFILE_DIR", "time_profiles"))
+
+# Setting TIME_ACCOUNTING=off neither measures nor writes profiles
+ACCOUNTING_ENABLED = os.getenv("TIME_ACCOUNTING", "on") != "off"
+
+# Categories in the order of the table
+CATEGORIES = ["load", "wait", "driver", "sleep", "extract", "preprocess", "other"]
+
+# Number of slowest pages listed in the table
+SLOWEST_PAGES = 5
+
+
+class TimeProfile:
+    """Time per category and per page of one scraper run."""
+
+    def __init__(self, source):
+        self.source = source
+        self.started_at = datetime.now()
+        self.seconds = {category: 0.0 for category in CATEGORIES}
+        self.calls = {category: 0 for category in CATEGORIES}
+        self.pages = {}  # url -> seconds per category
+        self.total = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, category, seconds, page=None):
+        with self._lock:
+            self.seconds[category] += seconds
+            self.calls[category] += 1
+            if page is not None:
+                page_seconds = self.pages.setdefault(page, {})
+                page_seconds[category] = page_seconds.get(category, 0.0) + seconds
+
+    def finish(self):
+        """Ends the profile, the time not spent in any category counts as other."""
+        self.total = time.perf_counter() - self._start
+        measured = sum(seconds for category, seconds in self.seconds.items() if category != "other")
+        self.seconds["other"] = max(self.total - measured, 0.0)
+        return self
+
+    def slowest_pages(self, count=SLOWEST_PAGES):
+        return sorted(self.pages.items(), key=lambda page: sum(page[1].values()), reverse=True)[:count]
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(self.total or 0.0, 3),
+            "seconds": {category: round(seconds, 3) for category, seconds in self.seconds.items()},
+            "calls": dict(self.calls),
+            "pages": [
+                {"url": url, "seconds": round(sum(page.values()), 3), "categories": {category: round(seconds, 3) for category, seconds in page.items()}}
+                for url, page in sorted(self.pages.items(), key=lambda page: sum(page[1].values()), reverse=True)
+            ],
+        }
+
+    def table(self):
+        """Returns the profile as human readable table."""
+        total = self.total or 0.0
+        lines = [f"Time profile of {self.source} ({total:.2f} s, {len(self.pages)} pages)",
+                 f"{'category':<12} {'seconds':>9} {'share':>7} {'calls':>7}"]
+        for category in CATEGORIES:
+            share = self.seconds[category] / total * 100 if total else 0.0
+            lines.append(f"{category:<12} {self.seconds[category]:>9.2f} {share:>6.1f}% {self.calls[category]:>7}")
+        if self.pages:
+            lines.append("slowest pages:")
+            for url, page in self.slowest_pages():
+                largest = max(page, key=page.get)
+                lines.append(f"  {sum(page.values()):>7.2f} s  ({largest} {page[largest]:.2f} s)  {url}")
+        return "\n".join(lines)
+
+    def write(self, directory=TIME_PROFILE_DIR):
+        """Writes the profile as JSON file and returns its path."""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.source}.json"
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=1), encoding="utf-8")
+        return path
+
+
+# Profile, current page and timed call of the running thread
+
+_local = threading.local()
+
+
+def current_profile():
+    return getattr(_local, "profile", None)
+
+
+@contextmanager
+def profiled(source):
+    """Measures everything the current thread does inside the block for the profile of a scraper (yields the profile)."""
+    previous = current_profile()
+    profile = TimeProfile(source)
+    _local.profile, _local.page = (profile if ACCOUNTING_ENABLED else None), None
+    if ACCOUNTING_ENABLED:
+        _instrument()
+    try:
+        yield profile
+    finally:
+        if ACCOUNTING_ENABLED:
+            _restore()
+        profile.finish()
+        _local.profile, _local.page = previous, None
+
+
+def bind_profile(function):
+    """Returns a version of function that counts for the profile of the current thread when run in another thread."""
+    profile = current_profile()
+
+    @wraps(function)
+    def bound(*args, **kwargs):
+        previous = current_profile()
+        _local.profile = profile
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.profile = previous
+    return bound
+
+
+def set_page(url):
+    """Makes url the page the following time of this thread is counted for."""
+    _local.page = url
+
+
+@contextmanager
+def timed(category):
+    """Counts the time of the block for a category (if no outer block of this thread is timed already)."""
+    profile = current_profile()
+    if profile is None or getattr(_local, "timing", False):
+        yield
+        return
+    _local.timing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.timing = False
+        profile.add(category, time.perf_counter() - start, getattr(_local, "page", None))
+
+
+def timed_function(category):
+    """Decorator counting the time of every call of a function for a category."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_profile(profile):
+    """Writes a finished profile to TIME_PROFILE_DIR and prints its table."""
+    if not ACCOUNTING_ENABLED:
+        return
+    try:
+        profile.write()
+    except OSError as e:
+        print(f"Time profile of {profile.source} could not be written: {e}")
+    print(profile.table())
+
+
+# The scrapers call WebDriverWait.until() and time.sleep() directly, so both are wrapped as long as any profile is active
+
+# (owner, name, category) of the wrapped functions
+_TIMED_FUNCTIONS = [(WebDriverWait, "until", "wait"), (WebDriverWait, "until_not", "wait"), (time, "sleep", "sleep")]
+
+_active_profiles = 0
+_wrapped = []  # (owner, name, original, wrapper) while profiles are active
+_instrument_lock = threading.Lock()
+
+
+def _instrument():
+    # Wrapping the functions when the first profile starts
+    global _active_profiles
+    with _instrument_lock:
+        _active_profiles += 1
+        if _active_profiles > 1:
+            return
+        for owner, name, category in _TIMED_FUNCTIONS:
+            original = getattr(owner, name)
+            wrapper = timed_function(category)(original)
+            setattr(owner, name, wrapper)
+            _wrapped.append((owner, name, original, wrapper))
+
+
+def _restore():
+    # Restoring the plain functions when the last profile ends (unless something else replaced them in the meantime)
+    global _active_profiles
+    with _instrument_lock:
+        _active_profiles -= 1
+        if _active_profiles:
+            return
+        while _wrapped:
+            owner, name, original, wrapper = _wrapped.pop()
+            if getattr(owner, name) is wrapper:
+                setattr(owner, name, original)
@@ -4,70 +4,51 @@
 
 # Imports
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from driver_pool import acquire_driver, release_driver
+from waiting import site_timeout, wait_for_elements, wait_for_network_idle
+from event_sink import collect_events
+from consent_profiles import ensure_consent
 
 import pandas as pd
-import locale
-from datetime import datetime
-import time
+from datetime import datetime, timedelta
 
 
 # Scraping function
 
-def scrape_unser_luebeck(days_in_advance=10): # Optional parameter for how many days in advance to scrape events for
+def scrape_unser_luebeck(days_in_advance=10, sink=None): # Optional parameter for how many days in advance to scrape events for
+    # Streaming the events into the sink (kept in memory by default, see event_sink.py) and returning the dataframe of raw data
+    return collect_events(iter_unser_luebeck_events(days_in_advance), sink)
 
-    # Preparations for scraping (setting options, instantiating the Chrome driver, opening the website)
-    options = Options()
-    options.add_argument("--headless") 
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(), options=options)
-    driver.get("https://www.unser-luebeck.de/veranstaltungskalender")
-    time.sleep(3) 
 
-    # Closing the cookie window
-    try:
-        accept_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, 'div.jb-accept.btn.blue'))
-        )
-        accept_button.click()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-    # Getting the currently processed date (with helper function)
-    currently_processed_date = get_current_date(driver)
-
-    # Getting all events on that date (with helper function)
-    events_df = get_events_on_date(driver, currently_processed_date)
-    
-    # Iterating over the number of days to scrape by navigating through the dates (one page per date)
-    # Navigation choice: Clicking on the "following day" button proved as a stable navigation option
-    for day in range(days_in_advance):
+def iter_unser_luebeck_events(days_in_advance=10):
 
-        try:
-            next_day_link = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, 'a[title="Folgetag"]'))
-            )
-            next_day_link.click()
-        except Exception as e:
-            print(f"An error occurred: {e}")
+    # Preparations for scraping (leasing a Chrome driver from the shared pool, opening the website)
+    driver = acquire_driver(site="unser_luebeck")
 
-        # Getting the new currently processed date (with helper function)
-        currently_processed_date = get_current_date(driver)
+    # The driver is handed back to the pool in any case, also if the page doesn't load or the generator is not consumed until the end
+    try:
+        driver.get("https://www.unser-luebeck.de/veranstaltungskalender")
+        wait_for_network_idle(driver, site_timeout("unser_luebeck"))
 
-        # Getting all events on that date (with helper function) and adding them to the raw dataframe of events
-        events_on_date = get_events_on_date(driver, currently_processed_date)
-        events_df = pd.concat([events_df, events_on_date], axis=0)
+        # Closing the cookie window (the consent is kept in the cookies, which all tabs of the browser share, skipped if the
+        # consent stored in the profile of this website was restored, see consent_profiles.py)
+        ensure_consent(driver, "unser_luebeck", close_cookie_window)
 
-    # Last steps: Closing the driver and returning the dataframe
-    driver.close()
+        # Every date has its own page (/veranstaltungskalender/eventsnachtag/year/month/day), so the pages of all dates
+        # (today and the number of days to scrape) are generated up front and loaded at the same time in several tabs
+        # instead of clicking through the "following day" button one date after the other
+        today = datetime.today().date()
+        dates = {date_url(day): day for day in (today + timedelta(days=offset) for offset in range(days_in_advance + 1))}
 
-    return events_df
+        for url, _ in driver.iter_tabs(list(dates), ready=wait_for_event_list):
+            # Handing on all events on that date (with helper function)
+            yield from get_events_on_date(driver, dates[url])
+    finally:
+        # Last step: Handing the driver back to the pool
+        release_driver(driver)
 
 
 # Preprocessing function
@@ -90,21 +71,27 @@ def preprocess_unser_luebeck(df_raw):
 
 # Helper functions and elements
 
-def get_current_date(driver):
-    # Function to read the date that the current information on the website is related to
-    locale.setlocale(locale.LC_TIME, 'de_DE.UTF-8') # Setting locale to German for correct interpretation of the information
-    
+def close_cookie_window(driver):
+    # Function to accept the cookies in the cookie window, returns whether it worked
     try:
-        date_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'div.currentmonth'))
+        accept_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, 'div.jb-accept.btn.blue'))
         )
-        
-        date_text = date_element.text.strip()
+        accept_button.click()
+        return True
     except Exception as e:
         print(f"An error occurred: {e}")
+        return False
+
+
+def date_url(day):
+    # Function to build the url of the page listing the events on one date
+    return f'https://www.unser-luebeck.de/veranstaltungskalender/eventsnachtag/{day.year}/{day.month}/{day.day}'
 
-    date_obj = datetime.strptime(date_text, "%A, %d. %B %Y").date()
-    return date_obj
+
+def wait_for_event_list(driver):
+    # Function to wait until the event list of a date page has loaded
+    wait_for_elements(driver, 'ul.ev_ul', site_timeout("unser_luebeck"))
 
 
 def get_events_on_date(driver, currently_processed_date):
@@ -149,19 +136,25 @@ def get_events_on_date(driver, currently_processed_date):
     for event in films_prep:
         category_dict["Film"].append((event[-1], event[0], event[1]))
 
-    # Creating dataframe of raw event data from the retrieved information, adding columns with city, date and source information
-    data_list = []
+    # Creating the raw event data from the retrieved information, adding city, date and source information (incomplete events are filled up with None)
+    date = f'{currently_processed_date.day}.{currently_processed_date.month}.{currently_processed_date.year}'
+    source = date_url(currently_processed_date)
+    events_on_date = []
     for category, events in category_dict.items():
         for event in events:
-            data_list.append((category, *event))
-    df = pd.DataFrame(data_list, columns=['Category', 'Time', 'Event', 'Location'])
-    df['City'] = 'Lübeck'
-    df["Date"] = f'{currently_processed_date.day}.{currently_processed_date.month}.{currently_processed_date.year}'
-    df['Source'] = f'https://www.unser-luebeck.de/veranstaltungskalender/eventsnachtag/{currently_processed_date.year}/{currently_processed_date.month}/{currently_processed_date.day}'
-    df = df[['Date', 'Event', 'Time', 'Location', 'City', 'Category', 'Source']]
-
-    # Handing back the dataframe of events found on this page to the scraping function defined above
-    return df
+            time_x, title, location = (tuple(event) + (None, None, None))[:3]
+            events_on_date.append({
+                'Date': date,
+                'Event': title,
+                'Time': time_x,
+                'Location': location,
+                'City': 'Lübeck',
+                'Category': category,
+                'Source': source
+            })
+
+    # Handing back the events found on this page to the scraping function defined above
+    return events_on_date
 
 def check_music(category):
     # Function to check if an event is music related or not according to its category and provide the correct label
@@ -181,8 +174,9 @@ def convert_date_format(date_str):
 
 # Recommended usage of the above functions
 
-df_raw = scrape_unser_luebeck(10)
-df_prep = preprocess_unser_luebeck(df_raw)
-df_prep.to_csv("Scraped_Events_Unser_Luebeck.csv")
-print(df_prep.head())
-print(df_prep.info())
\ No newline at end of file
+if __name__ == "__main__":
+    df_raw = scrape_unser_luebeck(10)
+    df_prep = preprocess_unser_luebeck(df_raw)
+    df_prep.to_csv("Scraped_Events_Unser_Luebeck.csv")
+    print(df_prep.head())
+    print(df_prep.info())
\ No newline at end of file
@@ -0,0 +1,103 @@
+# Waiting for concrete readiness signals of a website instead of fixed time.sleep() calls
+# Every step waits only as long as the page actually needs: until more events were appended, until the page stopped loading
+# resources (network idle) or until a loading spinner disappeared. The maximum time to wait is configured per website.
+
+# Imports
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from time_accounting import timed_function
+
+import time
+
+
+# Maximum waiting time per website in seconds (meine_stadt is especially slow to load)
+SITE_TIMEOUTS = {
+    "default": 10,
+    "biunsinnorden": 10,
+    "eventbrite": 15,
+    "eventim": 10,
+    "hamburg_de": 10,
+    "neumuenster": 10,
+    "kiel_sailing_city": 10,
+    "live_gigs": 10,
+    "sh_tourismus": 10,
+    "rausgegangen": 10,
+    "unser_luebeck": 10,
+    "kiel_magazin": 10,
+    "meine_stadt": 20,
+    "wasgeht": 10,
+}
+
+# How often the conditions are checked (in seconds)
+POLL_INTERVAL = 0.25
+
+# Time without new network requests after which a page counts as loaded (in seconds)
+NETWORK_IDLE_TIME = 0.5
+
+# JavaScript returning the loading state of the page and the number of resources requested so far
+LOADING_STATE_SCRIPT = """
+return [document.readyState, performance.getEntriesByType('resource').length, window.jQuery ? window.jQuery.active : 0];
+"""
+
+
+def site_timeout(site):
+    """Returns the maximum waiting time configured for a website."""
+    return SITE_TIMEOUTS.get(site, SITE_TIMEOUTS["default"])
+
+
+@timed_function("wait")
+def wait_until(driver, condition, timeout):
+    """Waits until condition(driver) returns a truthy value and returns it, or returns None after the timeout."""
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL).until(condition)
+    except TimeoutException:
+        return None
+
+
+def wait_for_elements(driver, selector, timeout):
+    """Waits until at least one element matches the CSS selector, returns whether it appeared in time."""
+    return wait_until(driver, EC.presence_of_element_located((By.CSS_SELECTOR, selector)), timeout) is not None
+
+
+def wait_for_count_growth(driver, selector, previous_count, timeout):
+    """Waits until more elements than previous_count match the CSS selector and returns the new count."""
+    def grown(driver):
+        count = driver.execute_script("return document.querySelectorAll(arguments[0]).length;", selector)
+        return count if count > previous_count else False
+
+    count = wait_until(driver, grown, timeout)
+    return count if count is not None else previous_count
+
+
+def wait_for_absence(driver, selector, timeout):
+    """Waits until no visible element matches the CSS selector anymore (e.g. a loading spinner)."""
+    return wait_until(driver, EC.invisibility_of_element_located((By.CSS_SELECTOR, selector)), timeout) is not None
+
+
+def page_ready(selector):
+    """Returns a check for PooledChrome.iter_ready_tabs(): whether a page finished loading and an element matches the CSS selector."""
+    def is_ready(driver):
+        return driver.execute_script(
+            "return document.readyState === 'complete' && document.querySelector(arguments[0]) !== null;", selector
+        )
+    return is_ready
+
+
+@timed_function("wait")
+def wait_for_network_idle(driver, timeout, idle_time=NETWORK_IDLE_TIME):
+    """Waits until the page finished loading and requested no new resources for idle_time seconds."""
+    deadline = time.monotonic() + timeout
+    last_count = None
+    idle_since = time.monotonic()
+    while time.monotonic() < deadline:
+        ready_state, resource_count, active_requests = driver.execute_script(LOADING_STATE_SCRIPT)
+        if resource_count != last_count or active_requests:
+            last_count = resource_count
+            idle_since = time.monotonic()
+        elif ready_state == "complete" and time.monotonic() - idle_since >= idle_time:
+            return True
+        time.sleep(POLL_INTERVAL)
+    return False
@@ -1,14 +1,29 @@
 # Scraper built by: Heansuh Lee
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from datetime import datetime, timedelta
 import pandas as pd
-import time
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import WebDriverException
+from concurrent.futures import ThreadPoolExecutor
+from driver_pool import PARALLEL_TABS, acquire_driver, release_driver, replace_driver
+from waiting import site_timeout, wait_for_network_idle
+from event_sink import collect_events
+from checkpoints import MAX_RESTARTS, CheckpointStore, cities_key, iter_checkpointed, log_resumed
+from time_accounting import bind_profile
+import os
+
+# Website opened first, the city is then selected on it (and stored in the cookies of the browser)
+START_URL = "https://www.wasgehtapp.de/index.php?geo_id=22995&ort=Rendsburg&x=9.66986&y=54.3038&select_ort=1&radius=20&region=10"
+
+# Number of cities scraped at the same time, each in its own browser with its own cookies (1 scrapes the cities one after the other)
+PARALLEL_CITIES = int(os.getenv("WASGEHT_PARALLEL_CITIES", "2"))
+
+# Number of days loaded at the same time in tabs of the browser of a city
+PARALLEL_DAYS = int(os.getenv("WASGEHT_PARALLEL_DAYS", str(PARALLEL_TABS)))
+
+DEFAULT_CITIES = ['Kiel', 'Lübeck', 'Flensburg', 'Neumünster', 'Rendsburg', 'Husum', 'Heide', 'Eckernförde', 'Schleswig', 'Itzehoe']
     
 def format_time(time_str):
 
@@ -46,142 +61,244 @@ def preprocessing(df):
 
     return df
 
-def wasgeht_scraper():
-    # Initialize WebDriver
-    
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
+def scrape_wasgeht(cities=None, days_in_advance=10, sink=None, parallel_cities=PARALLEL_CITIES):
+    # Stream the events into the sink while scraping (kept in memory by default, see event_sink.py)
+    if parallel_cities > 1:
+        events = iter_wasgeht_events_parallel(cities, days_in_advance, parallel_cities)
+    else:
+        events = iter_wasgeht_events(cities, days_in_advance)
+    return collect_events(events, sink)
+
+def preprocess_wasgeht(df):
+    preprocessing(df)
+
+    desired_columns = ['Subject', 'Start_date', 'Start_time', 'End_date', 'End_time', 'Location', 'City', 'Category', 'Description', 'Music_label']
+    df = df.reindex(columns=desired_columns)
+    df['Music_label'] = df['Category'].apply(lambda x: True if x in ['konzert', 'theater'] else False)
+    return df
+
+def wasgeht_scraper(cities=None, days_in_advance=10, sink=None, parallel_cities=PARALLEL_CITIES):
+    df = scrape_wasgeht(cities, days_in_advance, sink, parallel_cities)
+    if not isinstance(df, pd.DataFrame):
+        df = df.frame()  # streamed into a file
+    if df.empty:
+        return pd.DataFrame()
+
+    # The events of all cities are preprocessed and returned in one dataframe
+    return preprocess_wasgeht(df)
+
+def day_url(date_str):
+    return f"https://www.wasgehtapp.de/index.php?date={date_str}"
 
-    driver = webdriver.Chrome(service=Service(), options=options)    
+def wait_for_page(driver):
+    wait_for_network_idle(driver, site_timeout("wasgeht"))
 
+def clear_city_selection(driver):
+    # Only the cookies of wasgeht are deleted: the pooled browser also holds the consent cookies of other websites (see consent_profiles.py)
+    cookies = driver.execute_cdp_cmd("Network.getCookies", {"urls": [START_URL]})["cookies"]
+    for cookie in cookies:
+        driver.execute_cdp_cmd("Network.deleteCookies", {"name": cookie["name"], "domain": cookie["domain"], "path": cookie["path"]})
+
+def open_start_page(driver):
     # Open the target website
-    url = "https://www.wasgehtapp.de/index.php?geo_id=22995&ort=Rendsburg&x=9.66986&y=54.3038&select_ort=1&radius=20&region=10"
-    driver.get(url)
+    driver.get(START_URL)
+    wait_for_page(driver)
+
+def select_city(driver, city):
+    # Select city input field and search for city
+    city_input_button = driver.find_element(By.CSS_SELECTOR, "#select_ort")
+    city_input_button.click()
+
+    search_input = driver.find_element(By.CSS_SELECTOR, "#select_ort_input")
+    search_input.send_keys(city)
+    search_input.send_keys(Keys.RETURN)
+    wait_for_page(driver)  # Wait for the page to reload
+
+def extract_day_events(driver, city, date_str):
+    """Returns the events on the currently loaded day page of a city."""
+    # Locate all "katcontainer" containers
+    try:
+        containers = driver.find_elements(By.CSS_SELECTOR, ".katcontainer")
+        # Exclude containers with the class "vorschau" or kat="kino"
+        filtered_containers = [
+            container for container in containers
+            if "vorschau" not in container.get_attribute("class") and container.get_attribute("kat") != "kino"
+            ]       
+    except Exception as e:
+        print(f"Error fetching containers for city {city} on {date_str}: {e}")
+        return []
+
+    # Extract events data
+    day_events = []
+    for container in filtered_containers:
+        try:
+            category = container.get_attribute("kat")  # Get the "kat" attribute directly
+        except:
+            category = 'Other'
 
-    time.sleep(5)
+        # Set Date as Target Date
+        date = date_str
+
+        # Find all events (termin) within this container
+        events = container.find_elements(By.CSS_SELECTOR, ".termin")
+        for event in events:
+            try:
+                title_element = event.find_element(By.CSS_SELECTOR, "h3.titel > a")
+                title = title_element.text.strip()
+                event_details_link = title_element.get_attribute("href")
+            except:
+                title = None
+                event_details_link = None
+
+            try:
+                subtitle = event.find_element(By.CSS_SELECTOR, ".subtitel").text.strip()
+            except:
+                subtitle = None
+
+            try:
+                time_start = event.find_element(By.CSS_SELECTOR, ".zeitloc > span.zeit").text.strip()
+            except:
+                time_start = None
+            try:
+                location_element = event.find_elements(By.CSS_SELECTOR, ".zeitloc > a")
+                if len(location_element) > 0:
+                    location = location_element[0].text.strip()
+                else:
+                    location = None
+
+                if len(location_element) > 1:
+                    location_link = location_element[1].get_attribute("href")
+                else:
+                    location_link = None
+            except:
+                location = None
+                location_link = None
+
+            # Add the event data
+            day_events.append({
+                "Date": date,
+                "City": city,
+                "Category": category,
+                "Title": title,
+                "Subtitle": subtitle,
+                "Time": time_start,
+                "Location": location,
+                "Location Link": location_link,
+                "Event Details Link": event_details_link
+            })
+
+    return day_events
+
+def iter_wasgeht_events(cities=None, days_in_advance=10):
+    # Checkpoints of these cities, apart from the ones of runs for other cities at the same time (see checkpoints.py)
+    store = CheckpointStore("wasgeht", key=cities_key(cities))
+
+    # Lease a WebDriver from the shared pool
+    driver = acquire_driver(site="wasgeht")
 
     # List of cities to scrape
-    cities = ['Kiel', 'Lübeck', 'Flensburg', 'Neumünster', 'Rendsburg', 'Husum', 'Heide', 'Eckernförde', 'Schleswig', 'Itzehoe']
+    if cities is None:
+        cities = DEFAULT_CITIES
 
     # Today's date
     today = datetime.today()
 
-    # Initialize data storage
-    all_data = {}
+    # Every city on every day is a unit of work: units completed in an earlier (crashed) run of today are not scraped again (see checkpoints.py)
+    units = [(city, (today + timedelta(days=day_offset)).strftime("%Y-%m-%d")) for city in cities for day_offset in range(days_in_advance)]
+
+    # The city is selected on the website (stored in the browser session), so it is only selected again when the city changes
+    selected_city = None
+    failed_cities = set()
+
+    def restart():
+        # Replace a crashed browser by a fresh one, which has to select the city again
+        nonlocal driver, selected_city
+        driver = replace_driver(driver, site="wasgeht")
+        selected_city = None
+        open_start_page(driver)
+
+    def scrape_day(unit):
+        # Scrape the events of the selected city on one day
+        nonlocal selected_city
+        city, date_str = unit
+        if city in failed_cities:
+            return []
+        if selected_city != city:
+            try:
+                select_city(driver, city)
+                selected_city = city
+            except WebDriverException as e:
+                print(f"Error setting city {city}: {e}")
+                failed_cities.add(city)
+                return []
+
+        driver.get(day_url(date_str))
+        wait_for_page(driver)
+        return extract_day_events(driver, city, date_str)
+
+    # The browser is handed back to the pool in any case, also if the generator is not consumed until the end
+    try:
+        open_start_page(driver)
+        yield from iter_checkpointed(store, units, scrape_day, restart=restart)
+    finally:
+        # Hand the browser back to the pool
+        release_driver(driver)
+
+def scrape_city_days(city, dates, store, parallel_days=PARALLEL_DAYS):
+    """
+    Scrapes all days of one city in a browser of its own and returns the events in the order of the days.
+    The wasgeht cookies of the browser are cleared first, so the city selected in it is not mixed up with the one of another city,
+    then the pages of the days are loaded in parallel tabs (which share the city selection).
+    """
+    pending = [date_str for date_str in dates if not store.is_done((city, date_str))]
+    driver = acquire_driver(site="wasgeht")
+    try:
+        for attempt in range(MAX_RESTARTS + 1):
+            try:
+                if pending:
+                    clear_city_selection(driver)
+                    open_start_page(driver)
+                    select_city(driver, city)
+                urls = {day_url(date_str): date_str for date_str in pending}
+                for url, _ in driver.iter_tabs(list(urls), ready=wait_for_page, max_tabs=parallel_days):
+                    date_str = urls[url]
+                    store.complete((city, date_str), extract_day_events(driver, city, date_str))
+                    pending.remove(date_str)
+                break
+            except WebDriverException as e:
+                if attempt == MAX_RESTARTS:
+                    print(f"Error scraping city {city}: {e}")
+                    break
+                print(f"Browser failed on {city} ({e.__class__.__name__}), restarting it and retrying.")
+                driver = replace_driver(driver, site="wasgeht")
+    finally:
+        # Hand the browser back to the pool
+        release_driver(driver)
+
+    return [event for date_str in dates if store.is_done((city, date_str)) for event in store.events((city, date_str))]
+
+def iter_wasgeht_events_parallel(cities=None, days_in_advance=10, parallel_cities=PARALLEL_CITIES, parallel_days=PARALLEL_DAYS):
+    # Fan-out version of iter_wasgeht_events(): up to parallel_cities cities at the same time, each with its days in parallel tabs
+    # Same checkpoints as the serial version, so a crashed run can be resumed in either mode
+    store = CheckpointStore("wasgeht", key=cities_key(cities))
+    if cities is None:
+        cities = DEFAULT_CITIES
 
-    # Loop through each city
-    for city in cities:
-        city_data = []  # List to store data for this city
+    today = datetime.today()
+    dates = [(today + timedelta(days=day_offset)).strftime("%Y-%m-%d") for day_offset in range(days_in_advance)]
 
-        # Select city input field and search for city
-        try:
-            city_input_button = driver.find_element(By.CSS_SELECTOR, "#select_ort")
-            city_input_button.click()
-
-            search_input = driver.find_element(By.CSS_SELECTOR, "#select_ort_input")
-            search_input.send_keys(city)
-            search_input.send_keys(Keys.RETURN)
-            time.sleep(3)  # Wait for the page to reload
-        except Exception as e:
-            print(f"Error setting city {city} on {date_str}: {e}")
-            continue
-
-        # Loop through the next 10 days
-        for day_offset in range(10):
-            # Generate the URL for the specific day
-            target_date = today + timedelta(days=day_offset)
-            date_str = target_date.strftime("%Y-%m-%d")
-            url = f"https://www.wasgehtapp.de/index.php?date={date_str}"
-            driver.get(url)
-
-            # Wait for the page to load
-            time.sleep(5)
-
-            # Locate all "katcontainer" containers
-            try:
-                containers = driver.find_elements(By.CSS_SELECTOR, ".katcontainer")
-                # Exclude containers with the class "vorschau" or kat="kino"
-                filtered_containers = [
-                    container for container in containers
-                    if "vorschau" not in container.get_attribute("class") and container.get_attribute("kat") != "kino"
-                    ]       
-            except Exception as e:
-                print(f"Error fetching containers for city {city} on {date_str}: {e}")
-                continue
-
-            # Extract events data
-            for container in filtered_containers:
-                try:
-                    category = container.get_attribute("kat")  # Get the "kat" attribute directly
-                except:
-                    category = 'Other'
-
-                # Set Date as Target Date
-                date = date_str
-
-                # Find all events (termin) within this container
-                events = container.find_elements(By.CSS_SELECTOR, ".termin")
-                for event in events:
-                    try:
-                        title_element = event.find_element(By.CSS_SELECTOR, "h3.titel > a")
-                        title = title_element.text.strip()
-                        event_details_link = title_element.get_attribute("href")
-                    except:
-                        title = None
-                        event_details_link = None
-
-                    try:
-                        subtitle = event.find_element(By.CSS_SELECTOR, ".subtitel").text.strip()
-                    except:
-                        subtitle = None
-
-                    try:
-                        time_start = event.find_element(By.CSS_SELECTOR, ".zeitloc > span.zeit").text.strip()
-                    except:
-                        time_start = None
-                    try:
-                        location_element = event.find_elements(By.CSS_SELECTOR, ".zeitloc > a")
-                        if len(location_element) > 0:
-                            location = location_element[0].text.strip()
-                        else:
-                            location = None
-
-                        if len(location_element) > 1:
-                            location_link = location_element[1].get_attribute("href")
-                        else:
-                            location_link = None
-                    except:
-                        location = None
-                        location_link = None
-
-                    # Append event data to city_data
-                    city_data.append({
-                        "Date": date,
-                        "City": city,
-                        "Category": category,
-                        "Title": title,
-                        "Subtitle": subtitle,
-                        "Time": time_start,
-                        "Location": location,
-                        "Location Link": location_link,
-                        "Event Details Link": event_details_link
-                    })
-
-        # Save data for this city to a CSV file
-        city_df = pd.DataFrame(city_data)
-
-        preprocessing(city_df)
-        
-        desired_columns = ['Subject', 'Start_date', 'Start_time', 'End_date', 'End_time', 'Location', 'City', 'Category', 'Description', 'Music_label']
-        city_df = city_df.reindex(columns=desired_columns)
-        city_df['Music_label'] = city_df['Category'].apply(lambda x: True if x in ['konzert', 'theater'] else False)
-
-        city_df.to_csv(f"Scraped_Events_wasgeht_{city}.csv", index=False, encoding="utf-8")
-        print(f"Data for {city} saved to Scraped_Events_wasgeht_{city}.csv")
-
-    # Close the browser
-    driver.quit()
-
-wasgeht_scraper()
+    log_resumed(store, [(city, date_str) for city in cities for date_str in dates])
+
+    # The events are handed on city by city in the given order, while the following cities are still being scraped
+    with ThreadPoolExecutor(max_workers=parallel_cities) as executor:
+        for city_events in executor.map(bind_profile(lambda city: scrape_city_days(city, dates, store, parallel_days)), cities):
+            yield from city_events
+
+    # Days of a city that failed for good stay pending, so only a complete run deletes the checkpoint
+    if all(store.is_done((city, date_str)) for city in cities for date_str in dates):
+        store.finish()
+
+if __name__ == "__main__":
+    df = wasgeht_scraper()
+    df.to_csv("Scraped_Events_wasgeht.csv", index=False, encoding="utf-8")
+    print("Data saved to Scraped_Events_wasgeht.csv")
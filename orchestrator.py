@@ -3,7 +3,10 @@ import time
 import logging
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import json
 import os
+import sys
 
 # Setup logging to log to both file and terminal
 logging.basicConfig(
@@ -17,6 +20,18 @@ logging.basicConfig(
 
 # Directory containing the scraper scripts
 SCRAPER_DIR = Path("./finalized_scrapers")
+if not (SCRAPER_DIR / "scraper_registry.py").exists():
+    SCRAPER_DIR = Path("./finalized scrapers")
+
+# Making the scraper registry importable
+sys.path.insert(0, str(SCRAPER_DIR.resolve()))
+from scraper_registry import SCRAPER_PLUGINS, plugin_for_script, run_scraper_plugin_to_csv
+from event_sink import EVENT_SPOOL_DIR
+from staging import StagingPipeline, concat_csv_files, iter_csv_chunks, merge_staged_chunks
+from run_history import RunHistory, log_schedule_report, lpt_order, plan_schedule
+from time_accounting import TIME_PROFILE_DIR
+from sharding import SHARD_COUNT, SHARD_INDEX, SHARD_RUN_ID, finalize_shards, is_sharded, mark_shard_done, new_run_id, partial_output, shard_units
+from work_queue import WorkQueue, merge_results, run_worker
 
 # Update the OUTPUT_DIR path to the finalized_scrapers directory
 OUTPUT_DIR = Path("./finalized_scrapers")
@@ -42,13 +57,49 @@ SCRAPERS = [
 # Delay between scrapers (in seconds)
 DELAY = 5
 
+# Number of scrapers that may run at the same time (1 keeps the sequential behaviour with DELAY in between)
+MAX_WORKERS = int(os.getenv("SCRAPER_WORKERS", "1"))
+
+# How scrapers are executed: "subprocess" runs every script in its own Python interpreter and merges the written CSVs,
+# "inprocess" imports the scrapers through the registry and writes their results chunk by chunk, "queue" puts work units into
+# a durable queue that local (and remote) worker processes take them from (see work_queue.py)
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "subprocess")
+
+# Website each scraper talks to, scrapers sharing a domain are never run at the same time
+SCRAPER_DOMAINS = {plugin["script"]: plugin["domain"] for plugin in SCRAPER_PLUGINS.values()}
+
+# Maximum number of scrapers running against the same domain at once (domains not listed default to 1)
+DOMAIN_LIMITS = {}
+
+# A limit below 1 would never let the scrapers of that domain start
+if any(limit < 1 for limit in DOMAIN_LIMITS.values()):
+    raise ValueError(f"DOMAIN_LIMITS must be at least 1 per domain: {DOMAIN_LIMITS}")
+
+# "on" stages the result of every scraper as soon as it finished (normalized and validated by background workers, see
+# staging.py), so the final merge only concatenates the staged chunks
+PIPELINE = os.getenv("SCRAPER_PIPELINE", "off") == "on"
+
+# Order of the scrapers in parallel runs: "lpt" starts the scrapers with the longest predicted duration first (predicted from
+# the run history, see run_history.py), "list" keeps the order of SCRAPERS
+SCHEDULING = os.getenv("SCRAPER_SCHEDULING", "lpt")
+
+# Cities of the scrapers that can be restricted to cities: in sharded in-process runs these scrapers run on every shard with
+# the shard's part of the cities instead of running on one shard only (see sharding.py), in queue mode every city is a work unit
+SHARDED_CITIES = {
+    "rausgegangen.py": ["Hamburg", "Kiel", "Lübeck", "Flensburg"],
+    "meine_stadt.py": ["Hamburg", "Kiel", "Lübeck", "Flensburg", "Husum", "Heide", "Schleswig", "Itzehoe"],
+    "wasgeht.py": ["Kiel", "Lübeck", "Flensburg", "Neumünster", "Rendsburg", "Husum", "Heide", "Eckernförde", "Schleswig", "Itzehoe"],
+}
+
 def run_scraper(scraper):
-    """Runs a scraper script using subprocess."""
+    """Runs a scraper script using subprocess and returns its exit status."""
     scraper_path = SCRAPER_DIR / scraper
+    status = {"scraper": scraper, "status": "not found", "returncode": None, "duration": 0.0}
     if not scraper_path.exists():
         logging.error(f"Scraper script not found: {scraper_path}")
-        return
+        return status
 
+    start = time.monotonic()
     try:
         logging.info(f"Starting scraper: {scraper}")
         result = subprocess.run(
@@ -59,11 +110,137 @@ def run_scraper(scraper):
         )
         logging.info(f"Scraper finished successfully: {scraper}")
         logging.info(f"Scraper output:\n{result.stdout}")
+        status.update(status="success", returncode=result.returncode)
     except subprocess.CalledProcessError as e:
         logging.error(f"Scraper failed: {scraper}")
         logging.error(f"Error output:\n{e.stderr}")
+        status.update(status="failed", returncode=e.returncode)
     except Exception as ex:
         logging.error(f"Unexpected error running scraper {scraper}: {ex}")
+        status.update(status="error")
+    status["duration"] = time.monotonic() - start
+    return status
+
+def inprocess_output(scraper):
+    """CSV file the result of a scraper run in process is written to."""
+    return EVENT_SPOOL_DIR / f"{plugin_for_script(scraper)}.csv"
+
+def run_scraper_in_process(scraper):
+    """Runs a scraper through the registry in this process and returns its exit status and the CSV file of its result."""
+    status = {"scraper": scraper, "status": "error", "returncode": None, "duration": 0.0, "output": None}
+    start = time.monotonic()
+    try:
+        logging.info(f"Starting scraper in process: {scraper}")
+        output = inprocess_output(scraper)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        rows = run_scraper_plugin_to_csv(plugin_for_script(scraper), output, cities=shard_cities(scraper))
+        status.update(status="success", returncode=0, output=str(output), pages=read_page_count(scraper))
+        logging.info(f"Scraper finished successfully: {scraper} ({rows} events)")
+    except Exception as ex:
+        logging.error(f"Scraper failed: {scraper}: {ex}")
+        status["returncode"] = 1
+    status["duration"] = time.monotonic() - start
+    return status
+
+def queue_units(scrapers, history):
+    """Returns the work units of the scrapers as (source, cities, priority), priority is the predicted duration of the unit."""
+    units = []
+    for scraper in scrapers:
+        prediction = history.predict_duration(scraper)
+        if scraper in SHARDED_CITIES:
+            cities = SHARDED_CITIES[scraper]
+            units += [(plugin_for_script(scraper), [city], prediction / len(cities)) for city in cities]
+        else:
+            units.append((plugin_for_script(scraper), None, prediction))
+    return units
+
+def run_queue(scrapers, workers, history, output_file, run_id=None):
+    """Enqueues the work units of the scrapers, works on them with local worker processes and merges their results."""
+    run_id = run_id or SHARD_RUN_ID or new_run_id()
+    queue = WorkQueue()
+    queue.enqueue(run_id, queue_units(scrapers, history))
+    logging.info(f"Work units of run {run_id}: {queue.counts(run_id)}")
+    queue.close()
+
+    # The local workers return once no unit is left, workers started on other hosts take units from the same queue
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        done = list(executor.map(run_worker, [run_id] * max(workers, 1)))
+    logging.info(f"Local workers scraped {sum(done)} units.")
+
+    failed = merge_results(run_id, output_file)
+    if failed:
+        logging.warning(f"Work units failed after all attempts: {failed}")
+
+def shard_scrapers(scrapers, in_process):
+    """Returns the scrapers this shard runs: its part of the scrapers plus the scrapers split by cities (see sharding.py)."""
+    if not is_sharded():
+        return list(scrapers)
+    split = [scraper for scraper in scrapers if in_process and scraper in SHARDED_CITIES]
+    whole = [scraper for scraper in scrapers if scraper not in split]
+    return shard_units(whole) + [scraper for scraper in split if shard_units(SHARDED_CITIES[scraper])]
+
+def shard_cities(scraper):
+    """Returns the cities a scraper split by cities scrapes on this shard (None: all cities)."""
+    if not is_sharded() or scraper not in SHARDED_CITIES:
+        return None
+    return shard_units(SHARDED_CITIES[scraper])
+
+def read_page_count(scraper):
+    """Returns the number of pages loaded in the last run of a scraper (from its time profile, None if there is none)."""
+    try:
+        profile = json.loads((TIME_PROFILE_DIR / f"{plugin_for_script(scraper)}.json").read_text(encoding="utf-8"))
+        return len(profile["pages"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def run_scrapers_parallel(scrapers, workers=MAX_WORKERS, runner=run_scraper, executor_class=ThreadPoolExecutor, on_result=None):
+    """
+    Runs scrapers concurrently in a bounded pool, never exceeding the per-domain limits.
+    on_result(result) is called for every scraper as soon as it finished.
+    """
+    pending = list(scrapers)
+    running = {}
+    domains_in_use = {}
+    results = []
+
+    logging.info(f"Running {len(pending)} scrapers with {workers} workers...")
+    with executor_class(max_workers=workers) as executor:
+        while pending or running:
+            # Start every pending scraper whose domain still has capacity, as long as workers are free
+            for scraper in list(pending):
+                if len(running) >= workers:
+                    break
+                domain = SCRAPER_DOMAINS.get(scraper, scraper)
+                if domains_in_use.get(domain, 0) >= DOMAIN_LIMITS.get(domain, 1):
+                    continue
+                pending.remove(scraper)
+                domains_in_use[domain] = domains_in_use.get(domain, 0) + 1
+                running[executor.submit(runner, scraper)] = (scraper, domain)
+            if not running:
+                raise ValueError(f"None of the pending scrapers can be started (workers: {workers}, domain limits: {DOMAIN_LIMITS}): {pending}")
+
+            # Wait for at least one scraper to finish before scheduling the next ones
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                scraper, domain = running.pop(future)
+                domains_in_use[domain] -= 1
+                results.append(future.result())
+                if on_result is not None:
+                    on_result(results[-1])
+
+    return results
+
+def log_run_summary(results):
+    """Logs the exit status and duration of every scraper of this run."""
+    logging.info("Scraper run summary:")
+    for result in results:
+        logging.info(
+            f"  {result['scraper']:<28} {result['status']:<10} "
+            f"exit code: {result['returncode']}  duration: {result['duration']:.1f}s"
+        )
+    failed = [result["scraper"] for result in results if result["status"] != "success"]
+    if failed:
+        logging.warning(f"{len(failed)} of {len(results)} scrapers did not succeed: {failed}")
 
 def merge_csvs(output_file):
     """Merges all valid and non-empty CSV files in the output directory."""
@@ -109,19 +286,116 @@ def merge_csvs(output_file):
     else:
         logging.warning("No valid CSV files found for merging.")
 
-def orchestrate_scrapers():
-    """Runs all scrapers, merges CSVs, and triggers BigQuery upload."""
-    logging.info("Starting scraper orchestration...")
-    for scraper in SCRAPERS:
-        run_scraper(scraper)
+def merge_outputs(outputs, output_file):
+    """Merges the CSV files written by in-process scrapers chunk by chunk and saves them for the BigQuery upload."""
+    if concat_csv_files([output for output in outputs if output], output_file):
+        logging.info(f"Merged data saved to {output_file}.")
+    else:
+        logging.warning("No scraped events found for merging.")
+
+def run_scrapers(scrapers, workers=MAX_WORKERS, runner=run_scraper, in_process=False, on_result=None):
+    """Runs the scrapers (in parallel if workers > 1) and returns their results, calling on_result(result) for every finished scraper."""
+    if workers > 1:
+        # In-process scrapers get their own worker processes, subprocess scrapers only need threads to wait on them
+        executor_class = ProcessPoolExecutor if in_process else ThreadPoolExecutor
+        return run_scrapers_parallel(scrapers, workers=workers, runner=runner, executor_class=executor_class, on_result=on_result)
+
+    results = []
+    for scraper in scrapers:
+        results.append(runner(scraper))
+        if on_result is not None:
+            on_result(results[-1])
         logging.info(f"Waiting {DELAY} seconds before the next scraper...")
         time.sleep(DELAY)
+    return results
+
+def result_loader(result):
+    """Returns a function reading the result of a finished scraper in chunks (the CSV written in process or by its script)."""
+    if result.get("output"):
+        return lambda: iter_csv_chunks(result["output"])
+    # Most scripts write their CSV with the index ("Unnamed: 0" column, left out by normalize_frame()), wasgeht without it,
+    # so the first column must not be read as index (it would be the subject, dropping every row in validation)
+    output = Path(SCRAPER_PLUGINS[plugin_for_script(result["scraper"])]["output"])
+    return lambda: iter_csv_chunks(output)
 
-    # Merge all CSVs after scrapers are done
+def stage_result(pipeline, result):
+    """Hands the result of a successful scraper to the staging pipeline (waits while the pipeline is busy)."""
+    if result["status"] != "success":
+        return
+    pipeline.submit(plugin_for_script(result["scraper"]), result_loader(result))
+
+def orchestrate_scrapers(workers=MAX_WORKERS, mode=SCRAPER_MODE, pipeline=PIPELINE):
+    """Runs all scrapers, merges their results, and triggers BigQuery upload."""
+    logging.info(f"Starting scraper orchestration ({mode} mode{', pipelined' if pipeline else ''})...")
+    in_process = mode == "inprocess"
+    runner = run_scraper_in_process if in_process else run_scraper
     merged_file = OUTPUT_DIR / "merged_data.csv"
-    merge_csvs(merged_file)
 
-    # Trigger the BigQuery upload script
+    if mode == "queue":
+        run_queue(SCRAPERS, workers, RunHistory(), merged_file)
+        trigger_upload()
+        return
+
+    # A shard only runs its part of the scrapers and writes its events as partial output (see sharding.py)
+    scrapers = shard_scrapers(SCRAPERS, in_process)
+    if is_sharded():
+        logging.info(f"Running shard {SHARD_INDEX} of {SHARD_COUNT}: {scrapers}")
+        merged_file = partial_output()
+        merged_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # Parallel runs start the longest scrapers first, the finish times of the simulated schedule are compared to the actual ones
+    history = RunHistory()
+    predicted = {}
+    if workers > 1 and SCHEDULING == "lpt" and scrapers:  # a shard may have no scrapers at all
+        predictions = {scraper: history.predict_duration(scraper) for scraper in scrapers}
+        scrapers = lpt_order(scrapers, predictions)
+        predicted = plan_schedule(scrapers, predictions, workers, lambda scraper: SCRAPER_DOMAINS.get(scraper, scraper), DOMAIN_LIMITS)
+        logging.info(f"Scraper order (longest predicted duration first): {scrapers}, predicted makespan: {max(predicted.values(), default=0):.1f}s")
+
+    start = time.monotonic()
+    finished = {}
+    staging = StagingPipeline() if pipeline else None
+
+    def on_result(result):
+        finished[result["scraper"]] = time.monotonic() - start
+        history.record(result["scraper"], result["duration"], result["status"], result.get("pages"))
+        if staging is not None:
+            # Every finished scraper is normalized, validated and staged while the others are still running
+            stage_result(staging, result)
+
+    if pipeline:
+        with staging:
+            results = run_scrapers(scrapers, workers, runner, in_process, on_result=on_result)
+    else:
+        results = run_scrapers(scrapers, workers, runner, in_process, on_result=on_result)
+    log_run_summary(results)
+    if predicted:
+        log_schedule_report(predicted, finished)
+
+    # Merge all results after scrapers are done (in the pipeline only the staged chunks are concatenated)
+    if not scrapers:
+        # A shard without scrapers still writes its (empty) partial output, so the last shard finds all shards done
+        logging.info("No scrapers to run, writing an empty output.")
+        merged_file.write_text("")
+    elif pipeline:
+        if staging.failed:
+            logging.warning(f"Staging failed for: {staging.failed}")
+        merge_staged_chunks(merged_file)
+    elif in_process:
+        merge_outputs([result["output"] for result in results], merged_file)
+    else:
+        merge_csvs(merged_file)
+
+    # The shard finishing last merges the partial outputs of all shards and triggers the upload, the other shards are done
+    if is_sharded():
+        mark_shard_done(results)
+        if not finalize_shards(OUTPUT_DIR / "merged_data.csv"):
+            return
+
+    trigger_upload()
+
+def trigger_upload():
+    """Triggers the BigQuery upload script."""
     try:
         logging.info("Triggering push_to_bigquery.py script...")
         subprocess.run(["python", "push_to_bigquery.py"], check=True)
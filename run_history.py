@@ -0,0 +1,132 @@
+"""
+History of scraper runs and longest-processing-time-first scheduling.
+
+The orchestrator records the duration, the number of loaded pages (if known) and the outcome of every scraper run in a small
+JSON file (RUN_HISTORY_FILE, the last HISTORY_LENGTH runs per scraper). From that history the duration of the next run of a
+scraper is predicted (median of its recent successful runs). When scrapers run in parallel, they are started longest
+predicted duration first (LPT): the long scrapers run alongside each other from the beginning and the short ones fill the gaps
+at the end, instead of a long scraper like meine_stadt starting last and keeping the whole run waiting. plan_schedule()
+simulates the run with the worker and domain limits of the orchestrator, so the predicted finish time of every scraper can be
+compared to the actual one after the run.
+"""
+
+import json
+import logging
+import os
+import statistics
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# File of the run history
+RUN_HISTORY_FILE = Path(os.getenv("RUN_HISTORY_FILE", "run_history.json"))
+
+# Number of runs kept per scraper
+HISTORY_LENGTH = int(os.getenv("RUN_HISTORY_LENGTH", "20"))
+
+# Number of recent successful runs the prediction is based on
+PREDICTION_RUNS = 5
+
+# Predicted duration of scrapers without history (in seconds, long enough that new scrapers are started early)
+DEFAULT_DURATION = float(os.getenv("DEFAULT_SCRAPER_DURATION", "600"))
+
+
+class RunHistory:
+    """Recent runs of every scraper, stored as JSON file."""
+
+    def __init__(self, path=RUN_HISTORY_FILE):
+        self.path = Path(path)
+        self._runs = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            try:
+                self._runs = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Run history {self.path} could not be read, starting a new one: {e}")
+
+    def record(self, scraper, duration, status, pages=None):
+        """Adds a run of a scraper and writes the history to disk."""
+        run = {
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "duration": round(duration, 2),
+            "status": status,
+            "pages": pages,
+        }
+        with self._lock:
+            runs = self._runs.setdefault(scraper, [])
+            runs.append(run)
+            del runs[:-HISTORY_LENGTH]
+            self._save()
+
+    def _save(self):
+        # Written to a temporary file first, so a crash doesn't leave a broken history behind
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self._runs, indent=1), encoding="utf-8")
+        temporary.replace(self.path)
+
+    def runs(self, scraper):
+        with self._lock:
+            return list(self._runs.get(scraper, []))
+
+    def predict_duration(self, scraper):
+        """Predicted duration of the next run in seconds (median of the recent successful runs)."""
+        durations = [run["duration"] for run in self.runs(scraper) if run["status"] == "success"][-PREDICTION_RUNS:]
+        return statistics.median(durations) if durations else DEFAULT_DURATION
+
+    def failure_rate(self, scraper):
+        runs = self.runs(scraper)
+        return sum(1 for run in runs if run["status"] != "success") / len(runs) if runs else 0.0
+
+    def average_pages(self, scraper):
+        pages = [run["pages"] for run in self.runs(scraper) if run.get("pages") is not None]
+        return sum(pages) / len(pages) if pages else None
+
+
+def lpt_order(scrapers, predictions):
+    """Orders the scrapers longest predicted duration first (the order of scrapers decides between equal predictions)."""
+    return sorted(scrapers, key=lambda scraper: -predictions[scraper])
+
+
+def plan_schedule(scrapers, predictions, workers, domain_of, domain_limits):
+    """
+    Simulates a parallel run of the scrapers in the given order (like orchestrator.run_scrapers_parallel(): the first
+    pending scraper whose domain has capacity is started as soon as a worker is free).
+
+    Returns:
+        dict: Predicted finish time of every scraper in seconds after the start of the run.
+    """
+    pending = list(scrapers)
+    running = []  # (finish time, scraper, domain)
+    domains_in_use = {}
+    finish_times = {}
+    now = 0.0
+    while pending or running:
+        for scraper in list(pending):
+            if len(running) >= workers:
+                break
+            domain = domain_of(scraper)
+            if domains_in_use.get(domain, 0) >= domain_limits.get(domain, 1):
+                continue
+            pending.remove(scraper)
+            domains_in_use[domain] = domains_in_use.get(domain, 0) + 1
+            running.append((now + predictions[scraper], scraper, domain))
+        if not running:
+            raise ValueError(f"None of the pending scrapers can be started (workers: {workers}, domain limits: {domain_limits}): {pending}")
+
+        running.sort()
+        now, scraper, domain = running.pop(0)
+        domains_in_use[domain] -= 1
+        finish_times[scraper] = now
+    return finish_times
+
+
+def log_schedule_report(predicted, actual):
+    """Logs the predicted and the actual finish time of every scraper and of the whole run."""
+    logging.info("Predicted vs actual finish times (seconds after start):")
+    for scraper in sorted(actual, key=actual.get):
+        expected = predicted.get(scraper)
+        difference = f"{actual[scraper] - expected:+.1f}" if expected is not None else "n/a"
+        expected = f"{expected:.1f}" if expected is not None else "n/a"
+        logging.info(f"  {scraper:<28} predicted: {expected:>8}  actual: {actual[scraper]:>8.1f}  difference: {difference}")
+    if predicted and actual:
+        logging.info(f"  {'makespan':<28} predicted: {max(predicted.values()):>8.1f}  actual: {max(actual.values()):>8.1f}")
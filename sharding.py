@@ -0,0 +1,114 @@
+"""
+Sharding of an orchestrator run over several nodes.
+
+When the container runs as a batch job with several tasks, every task gets its shard index and the shard count from the
+environment (SHARD_INDEX/SHARD_COUNT, or the task index/count the job runtime sets, e.g. CLOUD_RUN_TASK_INDEX/
+CLOUD_RUN_TASK_COUNT). The work is partitioned deterministically, so every node computes the same partition without talking
+to the others:
+
+    scrapers     every SHARD_COUNT-th scraper of the list belongs to a shard (shard_units())
+    cities       scrapers that can be restricted to cities (SHARDED_CITIES in orchestrator.py) run on every shard with
+                 every SHARD_COUNT-th of their cities instead (in process mode only, scripts run as subprocess can't
+                 be given cities)
+
+Every shard writes its events as partial output SHARD_OUTPUT_DIR/<run id>/shard-<index>-of-<count>.csv and marks itself as
+done. The shard finishing last finds all partial outputs, merges them (finalize_shards()) and triggers the upload; a lock file
+makes sure only one shard does that. A shard without any scrapers still writes an empty partial output and its marker.
+SHARD_OUTPUT_DIR has to be storage all nodes share (e.g. a mounted bucket), the run id (SHARD_RUN_ID, or the execution id
+of the job) keeps the outputs of different runs apart. Sharded runs don't start without a run id: a default like the date
+would be the same for a second run on the same day, which would find the markers and the lock of the first one.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+from staging import concat_csv_files
+
+
+def env_int(names, default):
+    # First of the environment variables that is set
+    for name in names:
+        if os.getenv(name):
+            return int(os.getenv(name))
+    return default
+
+
+# Index of this shard (0 based) and number of shards
+SHARD_INDEX = env_int(["SHARD_INDEX", "CLOUD_RUN_TASK_INDEX", "JOB_COMPLETION_INDEX"], 0)
+SHARD_COUNT = env_int(["SHARD_COUNT", "CLOUD_RUN_TASK_COUNT"], 1)
+
+# Id of the run all shards belong to (the same for all tasks of one job execution, None if not given)
+SHARD_RUN_ID = os.getenv("SHARD_RUN_ID") or os.getenv("CLOUD_RUN_EXECUTION")
+
+# Folder of the partial outputs (shared by all nodes)
+SHARD_OUTPUT_DIR = Path(os.getenv("SHARD_OUTPUT_DIR", "./finalized_scrapers/shards"))
+
+
+def is_sharded(shard_count=SHARD_COUNT):
+    return shard_count > 1
+
+
+def shard_units(units, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT):
+    """Returns the units (scrapers, cities, urls) of one shard: every shard_count-th unit, starting at shard_index."""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is not within the shard count {shard_count}")
+    return [unit for position, unit in enumerate(units) if position % shard_count == shard_index]
+
+
+def new_run_id():
+    """Id for a run on a single node started without run id (unique per start)."""
+    return f"{datetime.now():%Y-%m-%dT%H-%M-%S}-{os.getpid()}"
+
+
+def run_dir(run_id=SHARD_RUN_ID):
+    if not run_id:
+        raise ValueError("Sharded runs need a run id shared by all shards: set SHARD_RUN_ID (or run them as tasks of a job execution)")
+    return SHARD_OUTPUT_DIR / run_id
+
+
+def partial_output(shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, run_id=SHARD_RUN_ID):
+    """Path of the partial output of a shard."""
+    return run_dir(run_id) / f"shard-{shard_index}-of-{shard_count}.csv"
+
+
+def mark_shard_done(summary, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, run_id=SHARD_RUN_ID):
+    """Marks a shard as done after its partial output was written (summary: e.g. the status of its scrapers)."""
+    marker = partial_output(shard_index, shard_count, run_id).with_suffix(".done")
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.write_text(json.dumps(summary, indent=1, default=str), encoding="utf-8")
+
+
+def finalize_shards(output_file, shard_count=SHARD_COUNT, run_id=SHARD_RUN_ID):
+    """
+    Merges the partial outputs of all shards into output_file, if all shards are done and no other shard finalized the run
+    yet. Returns whether this shard finalized the run (and has to trigger the upload).
+    """
+    directory = run_dir(run_id)
+    missing = [index for index in range(shard_count) if not partial_output(index, shard_count, run_id).with_suffix(".done").exists()]
+    if missing:
+        logging.info(f"Shards {missing} of run {run_id} are not done yet, the last shard merges the outputs.")
+        return False
+
+    # Only the first shard creating the lock file merges (several shards may find all shards done at the same time)
+    try:
+        os.close(os.open(directory / "finalized.lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        logging.info(f"Run {run_id} was already finalized by another shard.")
+        return False
+
+    paths = []
+    for index in range(shard_count):
+        path = partial_output(index, shard_count, run_id)
+        if not path.exists() or path.stat().st_size == 0:
+            logging.info(f"Shard {index} of run {run_id} has no events.")
+            continue
+        paths.append(path)
+    rows = concat_csv_files(paths, output_file) if paths else 0
+    if rows:
+        logging.info(f"Merged the partial outputs of {shard_count} shards ({rows} rows) into {output_file}.")
+    else:
+        logging.warning(f"No partial outputs found for run {run_id}.")
+    return True
@@ -0,0 +1,191 @@
+"""
+Pipelined staging of scraper results.
+
+Without the pipeline the orchestrator waits for all scrapers, then merges all CSVs and the upload starts with one merged file,
+so normalizing and checking the data only starts after the slowest scraper finished. With SCRAPER_PIPELINE=on the result of
+every scraper is handed to a StagingPipeline as soon as the scraper finished. Consumer workers normalize it (final columns in
+the agreed order, no missing values), validate it (rows without subject or with unreadable dates are dropped, like the upload
+would do) and stage it as one chunk per scraper in STAGING_DIR, while the other scrapers are still running. The queue between
+the scrapers and the workers is bounded: if the workers fall behind, the orchestrator waits before it hands on the next
+result (and starts the next scraper). The final step then only concatenates the staged chunks (merge_staged_chunks()).
+
+Results are read, staged and merged in chunks of READ_CHUNK_SIZE rows, so the memory needed doesn't grow with the number of
+events of a scraper or of the whole run.
+"""
+
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+# Folder of the staged chunks (one CSV file per scraper)
+STAGING_DIR = Path(os.getenv("STAGING_DIR", "./finalized_scrapers/staged"))
+
+# Number of consumer workers normalizing, validating and staging results
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "2"))
+
+# Number of finished results that may wait for a worker before the orchestrator has to wait (backpressure)
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "4"))
+
+# Number of rows read and written at once when staging and merging
+READ_CHUNK_SIZE = int(os.getenv("STAGE_CHUNK_SIZE", "5000"))
+
+# Columns of the agreed final data format (see the preprocessing functions of the scrapers)
+FINAL_COLUMNS = ["Subject", "Start_date", "End_date", "Start_time", "End_time", "Location", "City", "Description", "Category", "Music_label"]
+
+
+def normalize_frame(df):
+    """Brings a scraper result into the final columns (missing columns and values are filled with " ")."""
+    df = df.copy()
+    for column in FINAL_COLUMNS:
+        if column not in df.columns:
+            df[column] = " "
+    df = df[FINAL_COLUMNS].fillna(" ")
+    for column in ["Subject", "Location", "City", "Description", "Category"]:
+        df[column] = df[column].astype(str).str.strip().replace("", " ")
+    return df.reset_index(drop=True)
+
+
+def validate_frame(df, source):
+    """Drops the rows the upload can't use (no subject, start or end date not in YYYY-MM-DD format)."""
+    start_dates = pd.to_datetime(df["Start_date"], format="%Y-%m-%d", errors="coerce")
+    end_dates = pd.to_datetime(df["End_date"], format="%Y-%m-%d", errors="coerce")
+    valid = start_dates.notna() & end_dates.notna() & (df["Subject"].str.strip() != "")
+    dropped = int((~valid).sum())
+    if dropped:
+        logging.warning(f"{source}: {dropped} of {len(df)} rows dropped by validation.")
+    return df[valid].reset_index(drop=True)
+
+
+def stage_frame(frames, source, staging_dir=STAGING_DIR):
+    """
+    Writes a result as chunk of a scraper, normalizing and validating it piece by piece. Returns the path of the chunk and
+    its number of rows.
+
+    Args:
+        frames: Dataframe or iterable of dataframes of the scraper.
+        source (str): Name of the scraper (name of its chunk).
+        staging_dir (Path): Folder of the staged chunks.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    path = staging_dir / f"{source}.csv"
+    # Written to a temporary file first, so the merge never reads a half written chunk
+    temporary = path.with_suffix(".tmp")
+    rows = 0
+    with open(temporary, "w", encoding="utf-8", newline="") as file:
+        pd.DataFrame(columns=FINAL_COLUMNS).to_csv(file, index=False)
+        for df in frames:
+            df = validate_frame(normalize_frame(df), source)
+            df.to_csv(file, index=False, header=False)
+            rows += len(df)
+    temporary.replace(path)
+    return path, rows
+
+
+def iter_csv_chunks(path, chunk_size=READ_CHUNK_SIZE, **read_options):
+    """Yields the rows of a CSV file as dataframes of at most chunk_size rows (nothing for an empty file)."""
+    try:
+        yield from pd.read_csv(path, chunksize=chunk_size, **read_options)
+    except pd.errors.EmptyDataError:
+        logging.warning(f"Skipping empty file: {path}")
+
+
+def concat_csv_files(paths, output_file, chunk_size=READ_CHUNK_SIZE, **read_options):
+    """
+    Concatenates CSV files chunk by chunk into output_file, which gets a running index like a concatenated dataframe
+    saved with to_csv() (read by push_to_bigquery.py with index_col=0). Index columns of the files ("Unnamed: 0") are
+    dropped, the columns are the ones of the first file. Returns the number of rows written.
+    """
+    rows = 0
+    columns = None
+    with open(output_file, "w", encoding="utf-8", newline="") as file:
+        for path in paths:
+            for chunk in iter_csv_chunks(path, chunk_size, **read_options):
+                chunk = chunk.drop(columns=[column for column in chunk.columns if str(column).startswith("Unnamed: ")])
+                header = columns is None
+                if header:
+                    columns = list(chunk.columns)
+                chunk = chunk.reindex(columns=columns)
+                chunk.index = range(rows, rows + len(chunk))
+                chunk.to_csv(file, header=header)
+                rows += len(chunk)
+    return rows
+
+
+def merge_staged_chunks(output_file, staging_dir=STAGING_DIR):
+    """Concatenates all staged chunks into the file read by the BigQuery upload, returns the number of rows."""
+    paths = sorted(staging_dir.glob("*.csv"))
+    rows = concat_csv_files(paths, output_file, keep_default_na=False)
+    if not rows:
+        logging.warning("No staged chunks found for merging.")
+        return 0
+    logging.info(f"Merged {len(paths)} staged chunks ({rows} rows) into {output_file}.")
+    return rows
+
+
+class StagingPipeline:
+    """Bounded queue of finished scraper results, consumed by workers that normalize, validate and stage them."""
+
+    def __init__(self, workers=STAGE_WORKERS, queue_size=STAGE_QUEUE_SIZE, staging_dir=STAGING_DIR):
+        self.staging_dir = Path(staging_dir)
+        self.staged = {}  # source -> number of staged rows
+        self.failed = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._workers = [threading.Thread(target=self._work, name=f"stage-{index}", daemon=True) for index in range(workers)]
+
+    def start(self, clear=True):
+        """Starts the workers (removing the chunks of an earlier run first, unless clear is False)."""
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        if clear:
+            for old in self.staging_dir.glob("*.csv"):
+                old.unlink()
+        for worker in self._workers:
+            worker.start()
+        return self
+
+    def submit(self, source, load_frame):
+        """
+        Hands on the result of a finished scraper, waiting while the queue is full.
+
+        Args:
+            source (str): Name of the scraper (name of its chunk).
+            load_frame (function): Returns the dataframe of the scraper or an iterable of its dataframes in chunks (called
+                by the worker, e.g. reading its CSV file).
+        """
+        self._queue.put((source, load_frame))
+
+    def close(self):
+        """Waits until all submitted results are staged and stops the workers."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            source, load_frame = item
+            try:
+                _, rows = stage_frame(load_frame(), source, self.staging_dir)
+                with self._lock:
+                    self.staged[source] = rows
+                logging.info(f"Staged {rows} rows of {source}.")
+            except Exception as ex:
+                logging.error(f"Staging of {source} failed: {ex}")
+                with self._lock:
+                    self.failed.append(source)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The orchestrator modules live in the repository root, the scrapers and their helpers in "finalized scrapers"
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "finalized scrapers")]
+
+
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    # Checkpoints, spools, profiles and outputs are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
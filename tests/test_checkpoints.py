@@ -0,0 +1,159 @@
+from datetime import date
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+import checkpoints
+from checkpoints import CheckpointStore, cities_key, iter_checkpointed, iter_checkpointed_batch
+
+UNITS = [("Kiel", "2024-05-17"), ("Heide", "2024-05-17"), ("Husum", "2024-05-17")]
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoints, "CHECKPOINT_DIR", tmp_path / "checkpoints")
+
+
+def make_events(count, city="Kiel"):
+    return [{"Subject": f"Konzert {number}", "City": city} for number in range(count)]
+
+
+class Website:
+    """Stands in for a scraper, counts the units it scraped and fails on the unit in fail_on."""
+
+    def __init__(self, fail_on=None, run="morning"):
+        self.fail_on = fail_on
+        self.run = run
+        self.scraped = []
+
+    def scrape_unit(self, unit):
+        if unit == self.fail_on:
+            raise WebDriverException("browser crashed")
+        self.scraped.append(unit)
+        return [{"Subject": f"{self.run} event", "City": unit[0]}]
+
+
+def test_crashed_run_is_resumed_with_the_first_incomplete_unit():
+    crashed = Website(fail_on=UNITS[1])
+    with pytest.raises(WebDriverException):
+        list(iter_checkpointed(CheckpointStore("wasgeht"), UNITS, crashed.scrape_unit))
+    assert crashed.scraped == UNITS[:1]
+
+    resumed = Website(run="noon")
+    events = list(iter_checkpointed(CheckpointStore("wasgeht"), UNITS, resumed.scrape_unit))
+
+    assert resumed.scraped == UNITS[1:]
+    assert [event["Subject"] for event in events] == ["morning event", "noon event", "noon event"]
+
+
+def test_run_after_a_successful_run_starts_from_scratch():
+    store = CheckpointStore("wasgeht")
+    list(iter_checkpointed(store, UNITS, Website().scrape_unit))
+    assert not store.path.exists()
+
+    evening = Website(run="evening")
+    events = list(iter_checkpointed(CheckpointStore("wasgeht"), UNITS, evening.scrape_unit))
+
+    assert evening.scraped == UNITS
+    assert {event["Subject"] for event in events} == {"evening event"}
+
+
+def test_checkpoint_events_are_read_from_the_file():
+    store = CheckpointStore("wasgeht")
+    store.complete(("Kiel", "2024-05-17"), make_events(2))
+    store.complete(("Heide", "2024-05-17"), make_events(1, "Heide"))
+    with open(store.path, "a", encoding="utf-8") as file:
+        file.write('{"unit": "Husum|2024-05-17", "ev')  # cut off by a crash
+
+    resumed = CheckpointStore("wasgeht")
+    assert len(resumed) == 2
+    assert not resumed.is_done(("Husum", "2024-05-17"))
+    assert resumed.events(("Heide", "2024-05-17")) == make_events(1, "Heide")
+
+    resumed.complete(("Husum", "2024-05-17"), [])
+    assert CheckpointStore("wasgeht").events(("Kiel", "2024-05-17")) == make_events(2)
+    assert CheckpointStore("wasgeht").events(("Husum", "2024-05-17")) == []
+
+
+class Tabs:
+    """Stands in for a scraper loading its units in parallel tabs, the browser crashes after the units in crash_after."""
+
+    def __init__(self, crash_after=()):
+        self.crash_after = list(crash_after)
+        self.batches = []
+        self.restarts = 0
+
+    def scrape_pending(self, pending):
+        self.batches.append(pending)
+        for unit in reversed(pending):
+            if self.crash_after and self.crash_after[0] is None:
+                self.crash_after.pop(0)
+                raise WebDriverException("browser crashed")
+            yield unit, [{"Subject": "event", "City": unit[0]}]
+            if self.crash_after and self.crash_after[0] == unit:
+                self.crash_after[0] = None
+
+    def restart(self):
+        self.restarts += 1
+
+
+def test_batch_retries_only_the_units_not_completed_before_the_crash():
+    tabs = Tabs(crash_after=[UNITS[2]])
+    store = CheckpointStore("meine_stadt")
+    events = list(iter_checkpointed_batch(store, UNITS, tabs.scrape_pending, restart=tabs.restart))
+
+    assert tabs.batches == [UNITS, UNITS[:2]]
+    assert tabs.restarts == 1
+    assert sorted(event["City"] for event in events) == sorted(unit[0] for unit in UNITS)
+    assert not store.path.exists()
+
+
+def test_batch_restart_budget_starts_again_after_each_completed_unit():
+    # Three crashes, but every restart completes a unit first, so a budget of one restart per unit is enough
+    tabs = Tabs(crash_after=[UNITS[2], UNITS[1], UNITS[0]])
+    events = list(iter_checkpointed_batch(CheckpointStore("meine_stadt"), UNITS, tabs.scrape_pending,
+                                          restart=tabs.restart, max_restarts=1))
+    assert len(events) == 3
+    assert tabs.restarts == 2
+
+
+def test_batch_gives_up_after_crashes_without_progress():
+    class Crashing(Tabs):
+        def scrape_pending(self, pending):
+            self.batches.append(pending)
+            raise WebDriverException("browser crashed")
+            yield
+
+    tabs = Crashing()
+    with pytest.raises(WebDriverException):
+        list(iter_checkpointed_batch(CheckpointStore("meine_stadt"), UNITS, tabs.scrape_pending,
+                                     restart=tabs.restart, max_restarts=2))
+    assert tabs.restarts == 2
+    assert len(tabs.batches) == 3
+
+
+def test_runs_for_different_cities_keep_their_own_checkpoints():
+    kiel = CheckpointStore("wasgeht", key=cities_key(["Kiel"]))
+    heide = CheckpointStore("wasgeht", key=cities_key(["Heide"]))
+    assert kiel.path != heide.path
+    heide.complete(UNITS[1], make_events(1, "Heide"))
+
+    # The Kiel run finishes first and starts again from scratch, the Heide run keeps its progress
+    list(iter_checkpointed(kiel, UNITS[:1], Website().scrape_unit))
+    CheckpointStore("wasgeht", key=cities_key(["Kiel"]), resume=False)
+
+    assert CheckpointStore("wasgeht", key=cities_key(["Heide"])).events(UNITS[1]) == make_events(1, "Heide")
+
+
+def test_only_checkpoints_of_earlier_days_with_the_same_key_are_deleted():
+    old = CheckpointStore("wasgeht", day=date(2024, 5, 16), key="Kiel")
+    other_key = CheckpointStore("wasgeht", day=date(2024, 5, 16), key="Heide")
+    all_cities = CheckpointStore("wasgeht", day=date(2024, 5, 16))
+    for store in (old, other_key, all_cities):
+        store.complete(UNITS[0], [])
+
+    CheckpointStore("wasgeht", day=date(2024, 5, 17), key="Kiel")
+
+    assert not old.path.exists()
+    assert other_key.path.exists()
+    assert all_cities.path.exists()
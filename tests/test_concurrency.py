@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+import concurrency
+from concurrency import EMPTY_STREAK, MAX_LIMIT, MIN_LIMIT, ConcurrencyController, DomainLimit
+
+
+def started_now():
+    return time.monotonic()
+
+
+def test_ok_responses_increase_the_limit_additively_up_to_the_maximum():
+    limit = DomainLimit("livegigs.de", limit=4)
+    limit.record("ok", 0.5, started_now())
+    assert limit.limit == pytest.approx(4.25)
+
+    for _ in range(500):
+        limit.record("ok", 0.5, started_now())
+    assert limit.limit == MAX_LIMIT
+    assert limit.counts["ok"] == 501
+
+
+def test_slow_response_keeps_the_limit():
+    limit = DomainLimit("meinestadt.de", limit=4)
+    limit.record("ok", 1.0, started_now())
+    before = limit.limit
+    limit.record("ok", 10.0, started_now())
+
+    assert limit.limit == before
+    assert limit.counts["slow"] == 1
+
+
+@pytest.mark.parametrize("outcome", ["error", "blocked"])
+def test_error_and_block_halve_the_limit(outcome):
+    limit = DomainLimit("eventim.de", limit=8)
+    limit.record(outcome, 1.0, started_now())
+
+    assert limit.limit == 4
+    assert (limit.paused_until > time.monotonic()) == (outcome == "blocked")
+
+
+def test_requests_started_before_a_decrease_only_lower_the_limit_once():
+    limit = DomainLimit("rausgegangen.de", limit=8)
+    burst = started_now()
+    for _ in range(5):
+        limit.record("error", 1.0, burst)
+    assert limit.limit == 4
+
+    # A request started after the decrease failing again lowers the limit again
+    limit.record("error", 1.0, started_now())
+    assert limit.limit == 2
+    limit.record("error", 1.0, started_now())
+    limit.record("error", 1.0, started_now())
+    assert limit.limit == MIN_LIMIT
+    assert limit.lowest_limit == MIN_LIMIT and limit.highest_limit == 8
+
+
+def test_empty_pages_in_a_row_count_as_error():
+    limit = DomainLimit("kiel-magazin.de", limit=8)
+    for _ in range(EMPTY_STREAK - 1):
+        limit.record("empty", None, started_now())
+    limit.record("ok", 0.5, started_now())  # breaks the streak
+    for _ in range(EMPTY_STREAK - 1):
+        limit.record("empty", None, started_now())
+    assert limit.limit > 8
+
+    limit.record("empty", None, started_now())
+    assert limit.limit < 5
+    assert limit.counts["error"] == 1 and limit.counts["empty"] == 2 * (EMPTY_STREAK - 1)
+    assert limit.empty_streak == 0
+
+
+def test_blocked_domain_has_no_capacity_until_the_pause_is_over(monkeypatch):
+    monkeypatch.setattr(concurrency, "CONCURRENCY_ENABLED", True)
+    limit = DomainLimit("eventim.de", limit=4)
+    limit.record("blocked", 1.0, started_now(), pause=60)
+
+    assert not limit.has_capacity(time.monotonic())
+    assert limit.has_capacity(time.monotonic() + 61)
+
+
+def test_summary_only_lists_the_given_domains():
+    controller = ConcurrencyController()
+    controller.report("https://www.livegigs.de/events", "ok")
+    controller.report("https://rausgegangen.de/kiel", "error")
+
+    assert controller.request_counts() == {"livegigs.de": 1, "rausgegangen.de": 1}
+    lines = controller.summary(["rausgegangen.de"]).splitlines()
+    assert len(lines) == 2 and lines[1].startswith("rausgegangen.de")
+    assert len(controller.summary().splitlines()) == 3
@@ -0,0 +1,214 @@
+import threading
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+import driver_pool
+from browser_profiles import browser_profile, blocked_url_patterns
+from driver_pool import DriverPool, acquire_driver, release_driver, replace_driver
+from scraper_registry import load_plugin_module
+
+
+class FakeDriver:
+    """Stands in for PooledChrome, records the CDP commands it receives."""
+
+    created = []
+
+    def __init__(self, page_load_strategy="normal", capture_network=False):
+        self.launch_options = (page_load_strategy, capture_network)
+        self.pages_loaded = 0
+        self.consent_sites = set()
+        self.default_user_agent = "fake agent"
+        self.commands = []
+        self.healthy = True
+        self.resets = 0
+        self.quit_called = False
+        FakeDriver.created.append(self)
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+        return {}
+
+    def execute_script(self, script, *args):
+        if not self.healthy:
+            raise RuntimeError("browser crashed")
+        return 1
+
+    def reset(self):
+        self.resets += 1
+
+    def quit(self):
+        self.quit_called = True
+
+    def last(self, command):
+        return [params for name, params in self.commands if name == command][-1]
+
+
+@pytest.fixture(autouse=True)
+def fake_drivers():
+    FakeDriver.created = []
+
+
+def make_pool(size=2, max_pages=300):
+    return DriverPool(size=size, max_pages=max_pages, driver_factory=FakeDriver)
+
+
+def test_released_driver_is_reused_for_another_site_with_the_same_launch_options():
+    pool = make_pool()
+    first = pool.acquire(profile=browser_profile("rausgegangen"))
+    pool.release(first)
+    second = pool.acquire(profile=browser_profile("wasgeht"))
+
+    assert second is first
+    assert first.resets == 1
+    assert len(FakeDriver.created) == 1
+    assert second.last("Network.setBlockedURLs") == {"urls": blocked_url_patterns(browser_profile("wasgeht"))}
+
+
+def test_user_agent_is_set_on_every_lease():
+    pool = make_pool()
+    driver = pool.acquire(user_agent="desktop agent", profile=browser_profile("eventim"))
+    pool.release(driver)
+    driver = pool.acquire(profile=browser_profile("eventim"))
+
+    agents = [params["userAgent"] for name, params in driver.commands if name == "Network.setUserAgentOverride"]
+    assert agents == ["desktop agent", "fake agent"]
+
+
+def test_idle_driver_with_matching_launch_options_is_preferred():
+    pool = make_pool(size=2)
+    lean = pool.acquire(profile=browser_profile("wasgeht"))
+    spa = pool.acquire(profile=browser_profile("eventbrite"))
+    pool.release(spa)
+    pool.release(lean)
+
+    assert pool.acquire(profile=browser_profile("kiel_sailing_city")) is spa
+    assert pool.acquire(profile=browser_profile("meine_stadt")) is lean
+
+
+def test_idle_driver_with_other_launch_options_is_evicted_when_the_pool_is_full():
+    pool = make_pool(size=1)
+    spa = pool.acquire(profile=browser_profile("eventbrite"))
+    pool.release(spa)
+    lean = pool.acquire(profile=browser_profile("wasgeht"))
+
+    assert lean is not spa
+    assert spa.quit_called
+    assert lean.launch_options == ("eager", False)
+    assert pool._created == 1
+
+
+def test_acquire_waits_until_a_driver_is_released():
+    pool = make_pool(size=1)
+    driver = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    waiter.join(timeout=0.2)
+    assert waiter.is_alive() and not acquired
+
+    pool.release(driver)
+    waiter.join(timeout=2)
+    assert acquired == [driver]
+
+
+def test_unhealthy_idle_driver_is_replaced():
+    pool = make_pool(size=1)
+    driver = pool.acquire()
+    pool.release(driver)
+    driver.healthy = False
+
+    fresh = pool.acquire()
+    assert fresh is not driver
+    assert driver.quit_called
+    assert pool._created == 1
+
+
+def test_driver_is_recycled_after_max_pages():
+    pool = make_pool(size=1, max_pages=10)
+    driver = pool.acquire()
+    driver.pages_loaded = 10
+    pool.release(driver)
+
+    assert driver.quit_called
+    assert pool.acquire() is not driver
+
+
+def test_replace_driver_discards_the_crashed_driver(monkeypatch):
+    monkeypatch.setattr(driver_pool, "_pool", make_pool(size=1))
+    crashed = acquire_driver(site="wasgeht")
+    fresh = replace_driver(crashed, site="wasgeht")
+
+    assert fresh is not crashed
+    assert crashed.quit_called
+    assert driver_pool._pool._created == 1
+    release_driver(fresh)
+    assert driver_pool._pool._idle == [fresh]
+
+
+class UnreachableWebsiteDriver(FakeDriver):
+    def get(self, url):
+        raise TimeoutException(f"{url} did not load")
+
+
+@pytest.mark.parametrize("source, iter_events", [
+    ("rausgegangen", "iter_rausgegangen_events"),
+    ("unser_luebeck", "iter_unser_luebeck_events"),
+    ("eventim", "iter_eventim_events"),
+])
+def test_driver_is_released_when_the_first_page_does_not_load(monkeypatch, source, iter_events):
+    pool = DriverPool(size=1, driver_factory=UnreachableWebsiteDriver)
+    monkeypatch.setattr(driver_pool, "_pool", pool)
+    events = getattr(load_plugin_module(source), iter_events)()
+
+    with pytest.raises(TimeoutException):
+        list(events)
+    assert len(pool._idle) == 1
+
+
+class TabbedFakeDriver(FakeDriver):
+    """FakeDriver with tabs, records which tab every CDP command and every loaded url goes to."""
+
+    _open_tab = driver_pool.PooledChrome._open_tab
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.window_handles = ["main"]
+        self.current_window_handle = "main"
+        self.tab_names = {}
+        self.tab_commands = {"main": []}
+        self.loaded = {}
+        self.switch_to = self
+
+    def window(self, handle):
+        self.current_window_handle = handle
+
+    def execute_cdp_cmd(self, command, params):
+        self.tab_commands[self.current_window_handle].append(command)
+        return super().execute_cdp_cmd(command, params)
+
+    def execute_script(self, script, *args):
+        if script.startswith("window.open('about:blank'"):
+            handle = f"tab-{len(self.window_handles)}"
+            self.window_handles.append(handle)
+            self.tab_names[args[0]] = handle
+            self.tab_commands[handle] = []
+        elif script.startswith("window.open("):
+            handle = self.tab_names[args[1]]
+            self.loaded[handle] = (args[0], list(self.tab_commands[handle]))
+        return super().execute_script(script, *args)
+
+
+def test_every_tab_gets_the_user_agent_and_profile_before_its_url_loads():
+    pool = DriverPool(size=1, driver_factory=TabbedFakeDriver)
+    driver = pool.acquire(user_agent="desktop agent", profile=browser_profile("meine_stadt"))
+    urls = ["https://veranstaltungen.meinestadt.de/kiel/konzerte/alle", "https://veranstaltungen.meinestadt.de/heide/konzerte/alle"]
+    handles = [driver._open_tab(url) for url in urls]
+
+    assert driver.current_window_handle == "main"
+    for url, handle in zip(urls, handles):
+        loaded_url, commands_before_load = driver.loaded[handle]
+        assert loaded_url == url
+        assert "Network.setUserAgentOverride" in commands_before_load
+        assert "Network.setBlockedURLs" in commands_before_load
+    assert driver.last("Network.setUserAgentOverride") == {"userAgent": "desktop agent"}
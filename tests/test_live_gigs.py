@@ -0,0 +1,28 @@
+from bs4 import BeautifulSoup
+
+import live_gigs
+
+START_URL = "https://www.livegigs.de/neumuenster/umkreis-100"
+
+
+def day_page(next_path):
+    return BeautifulSoup(f'<div class="standard link-text"><a href="{next_path}">nächster Tag</a></div>', "html.parser")
+
+
+def test_day_pages_without_date_in_url_are_fetched_once(monkeypatch):
+    fetched = []
+
+    def fetch_page(url, site, ready_selector=None):
+        fetched.append(url)
+        return day_page(f"/neumuenster/umkreis-100/tag-{len(fetched) + 1}")
+
+    def fetch_pages(urls, site, ready_selector=None):
+        raise AssertionError("the pages were already fetched while following the button")
+
+    monkeypatch.setattr(live_gigs, "fetch_page", fetch_page)
+    monkeypatch.setattr(live_gigs, "fetch_pages", fetch_pages)
+
+    pages = live_gigs.following_day_pages(day_page("/neumuenster/umkreis-100/tag-1"), START_URL, 3)
+
+    assert [url for url, _ in pages] == [f"https://www.livegigs.de/neumuenster/umkreis-100/tag-{day}" for day in (1, 2, 3)]
+    assert fetched == [url for url, _ in pages]
@@ -0,0 +1,33 @@
+from bs4 import BeautifulSoup
+import pandas as pd
+
+from scraper_registry import load_plugin_module
+from structured_data import extract_events
+
+CALENDAR = """
+<div class="col-xs-10 col-sm-9 col-md-10">
+  <meta itemprop="startDate" content="2024-05-17T19:00:00">
+  <h5 class="dfx-titel-liste-dreizeilig"><a href="/veranstaltung/1">Konzert im Park</a></h5>
+  <span class="dfx-zeit-liste-dreizeilig">19:00 bis 21:00 Uhr</span>
+  <span itemprop="name">Stadthalle</span> <span itemprop="address">Kleinflecken 1, 24534 Neumünster</span>
+</div>
+<div class="col-xs-10 col-sm-9 col-md-10">
+  <meta itemprop="startDate" content="2024-05-18T10:00:00">
+  <h5 class="dfx-titel-liste-dreizeilig"><a href="/veranstaltung/2">Flohmarkt</a></h5>
+  <span class="dfx-zeit-liste-dreizeilig">10:00 Uhr</span>
+  <span itemprop="name">Großflecken</span>
+</div>
+"""
+
+
+def test_location_keeps_the_address_of_the_place():
+    neumuenster = load_plugin_module("neumuenster")
+    url = "https://www.neumuenster.de/kultur-freizeit/veranstaltungskalender"
+    events = extract_events(BeautifulSoup(CALENDAR, "html.parser"), base_url=url, item_selector="div.col-xs-10.col-sm-9.col-md-10",
+                            overrides=neumuenster.event_fields, defaults={"City": "Neumünster", "Category": " ", "Music_label": False})
+
+    df = neumuenster.cleaning_neumuenster(pd.DataFrame(events))
+    assert list(df["Location"]) == ["Stadthalle | Kleinflecken 1, 24534 Neumünster", "Großflecken"]
+    assert list(df["Start_time"]) == ["19:00", "10:00"]
+    assert list(df["End_time"]) == ["21:00", " "]
+    assert "Address" not in df.columns
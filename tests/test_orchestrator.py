@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from staging import FINAL_COLUMNS, StagingPipeline, merge_staged_chunks
+
+# Stands in for wasgeht.py: writes its CSV without index, like the real script
+FAKE_WASGEHT = '''
+import pandas as pd
+pd.DataFrame({
+    "Subject": ["Konzert im Hafen", "Lesung"],
+    "Start_date": ["2024-05-17", "2024-05-18"],
+    "Start_time": ["19:00", "20:00"],
+    "End_date": ["2024-05-17", "2024-05-18"],
+    "End_time": [None, None],
+    "Location": ["Kiellinie", "Stadtbücherei"],
+    "City": ["Kiel", "Kiel"],
+    "Category": ["konzert", "lesung"],
+    "Description": ["", ""],
+    "Music_label": [True, False],
+}).to_csv("Scraped_Events_wasgeht.csv", index=False, encoding="utf-8")
+'''
+
+
+def test_subprocess_csv_is_staged_into_the_merged_data_read_by_the_upload(tmp_path, monkeypatch):
+    import orchestrator
+    scraper_dir = tmp_path / "scripts"
+    scraper_dir.mkdir()
+    (scraper_dir / "wasgeht.py").write_text(FAKE_WASGEHT, encoding="utf-8")
+    monkeypatch.setattr(orchestrator, "SCRAPER_DIR", scraper_dir)
+
+    result = orchestrator.run_scraper("wasgeht.py")
+    assert result["status"] == "success"
+    with StagingPipeline(staging_dir=tmp_path / "staged") as pipeline:
+        orchestrator.stage_result(pipeline, result)
+    assert pipeline.staged == {"wasgeht": 2} and not pipeline.failed
+
+    merged_file = tmp_path / "merged_data.csv"
+    assert merge_staged_chunks(merged_file, tmp_path / "staged") == 2
+
+    # Read like push_to_bigquery.py does
+    merged = pd.read_csv(merged_file, index_col=0)
+    assert list(merged.columns) == FINAL_COLUMNS
+    assert list(merged["Subject"]) == ["Konzert im Hafen", "Lesung"]
+    assert list(merged["Location"]) == ["Kiellinie", "Stadtbücherei"]
+
+
+def test_parallel_run_fails_instead_of_waiting_forever_when_no_scraper_can_start(monkeypatch):
+    import orchestrator
+    monkeypatch.setitem(orchestrator.DOMAIN_LIMITS, "infomaxnet.de", 0)
+    monkeypatch.setitem(orchestrator.SCRAPER_DOMAINS, "hamburg_de.py", "infomaxnet.de")
+
+    with pytest.raises(ValueError, match="None of the pending scrapers can be started"):
+        orchestrator.run_scrapers_parallel(["hamburg_de.py"], workers=2, runner=lambda scraper: {"scraper": scraper})
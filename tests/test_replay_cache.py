@@ -0,0 +1,101 @@
+import threading
+import types
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import replay_cache
+from replay_cache import RecordingAdapter, ReplayAdapter, ReplayArchive, freeze_clock, record_snapshot
+
+PAGE = b"<html><head><title>Events</title></head><body><div class='event'>Konzert</div></body></html>"
+
+
+class WebsiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = ReplayArchive(tmp_path / "archive")
+    monkeypatch.setattr(replay_cache, "_archive", archive)
+    monkeypatch.setattr(replay_cache, "_server", None)
+    yield archive
+    if replay_cache._server is not None:
+        replay_cache._server.shutdown()
+
+
+@pytest.fixture
+def website():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebsiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/events?page=2"
+    server.shutdown()
+
+
+def session_with(adapter):
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def test_recorded_page_is_replayed_without_the_website(archive, website):
+    recorded = session_with(RecordingAdapter()).get(website)
+    assert recorded.status_code == 200
+    assert archive.recorded_at() is not None
+
+    # The replay only asks the stand-in server, pages not in the archive are answered with 404
+    replayed = session_with(ReplayAdapter()).get(website.replace("page=2", "page=3"))
+    assert replayed.status_code == 404
+    replayed = session_with(ReplayAdapter()).get(website)
+    assert replayed.status_code == 200
+    assert replayed.url == website
+    assert b"<div class='event'>Konzert</div>" in replayed.content
+
+
+def test_browser_snapshot_keeps_harvested_events_and_drops_scripts(archive):
+    html = (
+        "<html><head><script>loadMore()</script><script type=\"application/ld+json\">{}</script></head><body>"
+        "<div class=\"event\" data-harvested=\"\">Eins</div><div class=\"event\" data-harvested>Zwei</div></body></html>"
+    )
+    record_snapshot("https://example.org/events", html)
+
+    replayed = session_with(ReplayAdapter()).get("https://example.org/events")
+    assert replayed.status_code == 200
+    assert '<div class="event">Eins</div><div class="event">Zwei</div>' in replayed.text
+    assert "loadMore" not in replayed.text
+    assert "ld+json" in replayed.text
+    assert '<base href="https://example.org/events">' in replayed.text
+
+
+def test_replay_clock_is_frozen_at_the_recording_time(archive, monkeypatch):
+    archive.save("GET", "https://example.org/", 200, {}, b"")
+    recorded = datetime.fromtimestamp(archive.recorded_at())
+    module = types.SimpleNamespace(date=date, datetime=datetime)
+
+    freeze_clock(module)
+    assert module.datetime is datetime  # only frozen in replay mode
+
+    monkeypatch.setattr(replay_cache, "REPLAY_MODE", "replay")
+    freeze_clock(module)
+    assert module.datetime.now() == recorded
+    assert module.datetime.today() == recorded
+    assert module.date.today() == recorded.date()
+    assert module.datetime.strptime("2024-05-17", "%Y-%m-%d") == datetime(2024, 5, 17)
+
+
+def test_recording_time_is_kept_when_more_pages_are_recorded(archive):
+    archive.save("GET", "https://example.org/1", 200, {}, b"")
+    first = archive.recorded_at()
+    archive.save("GET", "https://example.org/2", 200, {}, b"")
+    assert archive.recorded_at() == first
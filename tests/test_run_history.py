@@ -0,0 +1,68 @@
+import pytest
+
+from run_history import DEFAULT_DURATION, PREDICTION_RUNS, RunHistory, lpt_order, plan_schedule
+
+
+@pytest.fixture
+def history(tmp_path):
+    return RunHistory(tmp_path / "run_history.json")
+
+
+def test_scraper_without_history_gets_the_default_duration(history):
+    assert history.predict_duration("meine_stadt.py") == DEFAULT_DURATION
+
+
+def test_prediction_is_the_median_of_the_recent_successful_runs(history):
+    for duration in [900] + [100, 110, 120, 130, 140][:PREDICTION_RUNS]:
+        history.record("wasgeht.py", duration, "success")
+    history.record("wasgeht.py", 5, "failed")
+    history.record("wasgeht.py", 3, "error")
+
+    assert history.predict_duration("wasgeht.py") == 120  # the failed runs and the run before the last PREDICTION_RUNS don't count
+    assert history.failure_rate("wasgeht.py") == 2 / 8
+
+
+def test_scraper_with_failed_runs_only_gets_the_default_duration(history):
+    history.record("eventim.py", 12, "failed")
+    assert history.predict_duration("eventim.py") == DEFAULT_DURATION
+
+
+def test_history_is_kept_between_runs(history, tmp_path):
+    history.record("live_gigs.py", 42, "success", pages=3)
+    reloaded = RunHistory(tmp_path / "run_history.json")
+    assert reloaded.predict_duration("live_gigs.py") == 42
+    assert reloaded.average_pages("live_gigs.py") == 3
+
+
+def test_lpt_order_starts_the_longest_scrapers_first_and_keeps_the_order_of_ties():
+    predictions = {"a.py": 10, "b.py": 300, "c.py": 10, "d.py": 50}
+    assert lpt_order(["a.py", "b.py", "c.py", "d.py"], predictions) == ["b.py", "d.py", "a.py", "c.py"]
+    assert lpt_order([], {}) == []
+
+
+def test_plan_schedule_fills_free_workers_with_the_next_scrapers():
+    predictions = {"long.py": 100, "mid.py": 60, "short1.py": 30, "short2.py": 30}
+    finish = plan_schedule(list(predictions), predictions, 2, lambda scraper: scraper, {})
+    assert finish == {"long.py": 100, "mid.py": 60, "short1.py": 90, "short2.py": 120}
+
+
+def test_plan_schedule_respects_domain_limits():
+    predictions = {"hamburg_de.py": 50, "sh-tourismus.py": 40, "live_gigs.py": 10}
+    domains = {"hamburg_de.py": "infomaxnet.de", "sh-tourismus.py": "infomaxnet.de", "live_gigs.py": "livegigs.de"}
+
+    # Scrapers of the same domain run one after the other by default, another domain's scraper uses the free worker
+    finish = plan_schedule(list(predictions), predictions, 3, domains.get, {})
+    assert finish == {"hamburg_de.py": 50, "sh-tourismus.py": 90, "live_gigs.py": 10}
+
+    finish = plan_schedule(list(predictions), predictions, 3, domains.get, {"infomaxnet.de": 2})
+    assert finish == {"hamburg_de.py": 50, "sh-tourismus.py": 40, "live_gigs.py": 10}
+
+
+def test_plan_schedule_without_scrapers_is_empty():
+    assert plan_schedule([], {}, 4, lambda scraper: scraper, {}) == {}
+
+
+def test_plan_schedule_fails_clearly_when_no_scraper_can_start():
+    predictions = {"hamburg_de.py": 50}
+    with pytest.raises(ValueError, match="None of the pending scrapers can be started"):
+        plan_schedule(list(predictions), predictions, 2, lambda scraper: "infomaxnet.de", {"infomaxnet.de": 0})
@@ -0,0 +1,91 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import sharding
+from sharding import finalize_shards, mark_shard_done, partial_output, shard_units
+
+SCRAPERS = ["biunsinnorden.py", "eventbrite.py", "hamburg_de.py", "our_neumuenster_py.py", "kiel-sailing-city.py",
+            "live_gigs.py", "sh-tourismus.py", "rausgegangen.py", "unser_luebeck.py", "kiel-magazin.py", "meine_stadt.py"]
+
+
+@pytest.fixture(autouse=True)
+def shard_output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "SHARD_OUTPUT_DIR", tmp_path / "shards")
+
+
+def finish_shard(index, count, run_id, subjects):
+    path = partial_output(index, count, run_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if subjects:
+        pd.DataFrame({"Subject": subjects, "City": "Kiel"}).to_csv(path)
+    else:
+        path.write_text("")
+    mark_shard_done([], index, count, run_id)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 11, 12])
+def test_shards_are_disjoint_and_cover_all_units(count):
+    shards = [shard_units(SCRAPERS, index, count) for index in range(count)]
+
+    assert sorted(unit for shard in shards for unit in shard) == sorted(SCRAPERS)
+    assert sum(len(shard) for shard in shards) == len(SCRAPERS)
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    assert shard_units(SCRAPERS, 0, count) == shard_units(list(SCRAPERS), 0, count)  # the same partition on every node
+
+
+def test_shard_index_outside_the_count_is_rejected():
+    with pytest.raises(ValueError):
+        shard_units(SCRAPERS, 3, 3)
+
+
+def test_sharded_run_without_run_id_is_rejected():
+    with pytest.raises(ValueError, match="run id"):
+        partial_output(0, 2, None)
+
+
+def test_last_shard_merges_the_partial_outputs_including_empty_shards(tmp_path):
+    finish_shard(0, 3, "run-1", ["Konzert", "Lesung"])
+    assert not finalize_shards(tmp_path / "merged_data.csv", 3, "run-1")
+
+    finish_shard(1, 3, "run-1", [])  # a shard without scrapers
+    finish_shard(2, 3, "run-1", ["Party"])
+    assert finalize_shards(tmp_path / "merged_data.csv", 3, "run-1")
+
+    merged = pd.read_csv(tmp_path / "merged_data.csv", index_col=0)
+    assert list(merged.index) == [0, 1, 2]
+    assert list(merged["Subject"]) == ["Konzert", "Lesung", "Party"]
+    assert list(merged.columns) == ["Subject", "City"]
+
+
+def test_only_one_of_the_shards_finishing_at_once_finalizes(tmp_path):
+    count = 8
+    for index in range(count):
+        finish_shard(index, count, "run-2", [f"Event {index}"])
+
+    barrier = threading.Barrier(count)
+    finalized = []
+
+    def finalize(index):
+        barrier.wait()
+        if finalize_shards(tmp_path / f"merged_by_{index}.csv", count, "run-2"):
+            finalized.append(index)
+
+    threads = [threading.Thread(target=finalize, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(finalized) == 1
+    assert len(pd.read_csv(tmp_path / f"merged_by_{finalized[0]}.csv", index_col=0)) == count
+
+
+def test_new_run_is_not_blocked_by_the_lock_of_an_earlier_run(tmp_path):
+    finish_shard(0, 1, "run-3", ["Konzert"])
+    assert finalize_shards(tmp_path / "merged_data.csv", 1, "run-3")
+    assert not finalize_shards(tmp_path / "merged_data.csv", 1, "run-3")
+
+    finish_shard(0, 1, "run-4", ["Lesung"])
+    assert finalize_shards(tmp_path / "merged_data.csv", 1, "run-4")
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from event_sink import JsonLinesSink, MemorySink, collect_events, iter_event_frames
+from staging import FINAL_COLUMNS, concat_csv_files, iter_csv_chunks, stage_frame
+
+
+def make_events(count, city="Kiel"):
+    return [{"Subject": f"Konzert {number}", "Start_date": "2024-05-17", "End_date": "2024-05-17", "City": city} for number in range(count)]
+
+
+def test_file_sink_is_returned_and_read_in_chunks(tmp_path):
+    result = collect_events(make_events(7), JsonLinesSink(tmp_path / "events.jsonl", batch_size=3))
+
+    assert isinstance(result, JsonLinesSink)
+    chunks = list(iter_event_frames(result, chunk_size=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert pd.concat(chunks, ignore_index=True).equals(pd.DataFrame(make_events(7)))
+
+
+def test_memory_sink_still_returns_a_dataframe():
+    result = collect_events(make_events(2), MemorySink())
+
+    assert isinstance(result, pd.DataFrame)
+    assert list(iter_event_frames(result)) == [result]
+    assert list(iter_event_frames(collect_events([], MemorySink()))) == []
+
+
+def test_chunks_are_staged_and_merged_with_a_running_index(tmp_path):
+    staging_dir = tmp_path / "staged"
+    stage_frame([pd.DataFrame(make_events(2)), pd.DataFrame(make_events(3))], "wasgeht", staging_dir)
+    path, rows = stage_frame(iter([]), "eventim", staging_dir)
+    assert rows == 0 and list(pd.read_csv(path).columns) == FINAL_COLUMNS
+
+    output = tmp_path / "merged_data.csv"
+    paths = sorted(staging_dir.glob("*.csv"))
+    assert concat_csv_files(paths, output, chunk_size=2, keep_default_na=False) == 5
+
+    merged = pd.read_csv(output, index_col=0)
+    assert list(merged.index) == [0, 1, 2, 3, 4]
+    assert list(merged.columns) == FINAL_COLUMNS
+    assert list(merged["Subject"]) == ["Konzert 0", "Konzert 1", "Konzert 0", "Konzert 1", "Konzert 2"]
+
+
+def test_empty_csv_file_yields_no_chunks(tmp_path):
+    empty = tmp_path / "empty.csv"
+    empty.write_text("")
+    assert list(iter_csv_chunks(empty)) == []
+
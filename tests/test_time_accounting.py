@@ -0,0 +1,52 @@
+from pathlib import Path
+import time
+
+import pandas as pd
+import pytest
+from selenium.webdriver.support.ui import WebDriverWait
+
+import scraper_registry
+from time_accounting import profiled
+
+
+def test_sleep_and_waits_are_only_wrapped_while_a_profile_is_active():
+    plain_sleep, plain_until = time.sleep, WebDriverWait.until
+
+    with profiled("outer"):
+        wrapped_sleep = time.sleep
+        assert wrapped_sleep is not plain_sleep
+        assert WebDriverWait.until is not plain_until
+        with profiled("inner") as profile:
+            time.sleep(0)
+        assert time.sleep is wrapped_sleep
+
+    assert profile.calls["sleep"] == 1
+    assert time.sleep is plain_sleep
+    assert WebDriverWait.until is plain_until
+
+
+def fake_entry_points(scrape):
+    return lambda source: (scrape, None)
+
+
+def test_profile_is_written_when_the_scraper_fails(monkeypatch):
+    def scrape():
+        raise RuntimeError("website down")
+
+    monkeypatch.setattr(scraper_registry, "get_entry_points", fake_entry_points(scrape))
+    with pytest.raises(RuntimeError):
+        list(scraper_registry.iter_scraper_frames("failing"))
+
+    assert Path("time_profiles/failing.json").exists()
+
+
+def test_profile_is_written_when_the_frames_are_not_consumed_until_the_end(monkeypatch):
+    def scrape():
+        return pd.DataFrame({"Subject": ["Konzert", "Lesung", "Flohmarkt"]})
+
+    monkeypatch.setattr(scraper_registry, "get_entry_points", fake_entry_points(scrape))
+    frames = scraper_registry.iter_scraper_frames("stopped", chunk_size=1)
+    next(frames)
+    frames.close()
+
+    assert Path("time_profiles/stopped.json").exists()
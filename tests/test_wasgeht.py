@@ -0,0 +1,32 @@
+from urllib.parse import urlparse
+
+from wasgeht import clear_city_selection
+
+
+class CookieJarDriver:
+    """Stands in for a pooled Chrome, keeps the cookies of all websites like the browser does."""
+
+    def __init__(self, cookies):
+        self.cookies = cookies
+
+    def execute_cdp_cmd(self, command, params):
+        if command == "Network.getCookies":
+            hosts = [urlparse(url).hostname for url in params["urls"]]
+            return {"cookies": [cookie for cookie in self.cookies if any(host.endswith(cookie["domain"].lstrip(".")) for host in hosts)]}
+        if command == "Network.deleteCookies":
+            self.cookies = [cookie for cookie in self.cookies if (cookie["name"], cookie["domain"], cookie["path"]) != (params["name"], params["domain"], params["path"])]
+            return {}
+        raise AssertionError(f"Unexpected command: {command}")
+
+
+def test_city_selection_is_cleared_without_the_consent_of_other_websites():
+    driver = CookieJarDriver([
+        {"name": "ort", "value": "Kiel", "domain": ".wasgehtapp.de", "path": "/"},
+        {"name": "PHPSESSID", "value": "1", "domain": "www.wasgehtapp.de", "path": "/"},
+        {"name": "consent", "value": "all", "domain": ".rausgegangen.de", "path": "/"},
+        {"name": "OptanonConsent", "value": "yes", "domain": ".meinestadt.de", "path": "/"},
+    ])
+
+    clear_city_selection(driver)
+
+    assert [cookie["name"] for cookie in driver.cookies] == ["consent", "OptanonConsent"]
@@ -0,0 +1,99 @@
+import pytest
+
+import work_queue
+from work_queue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(tmp_path / "work_queue.sqlite")
+    yield queue
+    queue.close()
+
+
+def expire_leases(monkeypatch):
+    # Leases handed out from now on have already expired
+    monkeypatch.setattr(work_queue, "LEASE_SECONDS", -1)
+
+
+def test_units_are_handed_out_longest_first_and_retries_after_new_units(queue):
+    queue.enqueue("run-1", [("live_gigs", None, 60), ("meine_stadt", ["Kiel"], 900), ("eventbrite", None, 300)])
+
+    first = queue.lease("run-1", "worker-a")
+    assert (first["source"], first["cities"], first["attempts"]) == ("meine_stadt", ["Kiel"], 1)
+    assert queue.fail(first["id"], "worker-a", "browser crashed")
+
+    assert [queue.lease("run-1", "worker-a")["source"] for _ in range(3)] == ["eventbrite", "live_gigs", "meine_stadt"]
+    assert queue.lease("run-1", "worker-a") is None
+
+
+def test_units_of_other_runs_are_not_handed_out(queue):
+    queue.enqueue("run-1", [("live_gigs", None, 60)])
+    assert queue.lease("run-2", "worker-a") is None
+
+
+def test_unit_is_retried_until_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 3)
+    queue.enqueue("run-1", [("hamburg_de", None, 100)])
+
+    for attempt in range(1, 4):
+        unit = queue.lease("run-1", "worker-a")
+        assert unit["attempts"] == attempt
+        assert not queue.is_finished("run-1")
+        queue.fail(unit["id"], "worker-a", f"timeout {attempt}")
+
+    assert queue.lease("run-1", "worker-a") is None
+    assert queue.is_finished("run-1")
+    assert queue.counts("run-1") == {"failed": 1}
+    assert queue.units("run-1")[0]["error"] == "timeout 3"
+
+
+def test_expired_lease_is_handed_to_another_worker(queue, monkeypatch):
+    queue.enqueue("run-1", [("rausgegangen", ["Kiel"], 100)])
+    expire_leases(monkeypatch)
+    stalled = queue.lease("run-1", "worker-a")
+
+    monkeypatch.setattr(work_queue, "LEASE_SECONDS", 600)
+    taken_over = queue.lease("run-1", "worker-b")
+    assert taken_over["id"] == stalled["id"] and taken_over["attempts"] == 2
+    assert not queue.renew(stalled["id"], "worker-a")
+    assert queue.renew(taken_over["id"], "worker-b")
+
+
+def test_worker_that_lost_its_lease_cannot_complete_the_unit(queue, monkeypatch):
+    queue.enqueue("run-1", [("rausgegangen", ["Kiel"], 100)])
+    expire_leases(monkeypatch)
+    stalled = queue.lease("run-1", "worker-a")
+    taken_over = queue.lease("run-1", "worker-b")
+
+    assert not queue.complete(stalled["id"], "worker-a", "unit-1-worker-a.csv", 10)
+    assert not queue.fail(stalled["id"], "worker-a", "too late")
+    assert queue.units("run-1")[0]["status"] == "leased"
+
+    assert queue.complete(taken_over["id"], "worker-b", "unit-1-worker-b.csv", 12)
+    unit = queue.units("run-1")[0]
+    assert (unit["status"], unit["worker"], unit["result_path"], unit["rows"]) == ("done", "worker-b", "unit-1-worker-b.csv", 12)
+    assert queue.is_finished("run-1")
+
+
+def test_run_worker_drops_the_result_of_a_lost_lease(tmp_path, monkeypatch):
+    queue_file = tmp_path / "work_queue.sqlite"
+    setup = WorkQueue(queue_file)
+    setup.enqueue("run-1", [("live_gigs", None, 60)])
+    setup.close()
+
+    def scrape_unit(source, cities, path):
+        # Another worker takes the unit over while this one is still scraping
+        other = WorkQueue(queue_file)
+        other._transaction([("UPDATE units SET worker = 'worker-b'", ())])
+        other.close()
+        path.write_text("Subject\nKonzert\n")
+        return 1
+
+    monkeypatch.setattr(work_queue, "scrape_unit", scrape_unit)
+    monkeypatch.setattr(work_queue, "POLL_SECONDS", 0)
+    monkeypatch.setattr(work_queue, "MAX_ATTEMPTS", 1)
+    expire_leases(monkeypatch)
+
+    assert work_queue.run_worker("run-1", queue_file, tmp_path / "results", worker="worker-a") == 0
+    assert list((tmp_path / "results" / "run-1").iterdir()) == []
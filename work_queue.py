@@ -0,0 +1,289 @@
+"""
+Durable work queue for scrape workers.
+
+Static sharding (see sharding.py) gives every node a fixed part of the scrapers, but the scrapers are very uneven (hamburg_de
+yields thousands of events, live_gigs about a hundred), so some nodes finish long before others. In queue mode the
+orchestrator puts small work units into a SQLite file instead: one unit per scraper, and one unit per city for the scrapers
+that can be restricted to cities. Any number of worker processes, on this host or on other hosts sharing the file, take the
+next unit, scrape it and write its events back as result file. Long units are handed out first (predicted from the run
+history), so they don't end up last, and units that failed before only after the units not tried yet.
+
+A worker leases a unit for LEASE_SECONDS and renews the lease while it scrapes. If a worker dies, its lease expires and the
+unit is handed to another worker. A worker that lost its lease (e.g. it was stalled longer than LEASE_SECONDS) can't complete
+the unit anymore, it throws its result away. A failed unit is retried until it was tried MAX_ATTEMPTS times. The queue is finished when
+every unit is done or failed for good, then the orchestrator merges the result files (merge_results()).
+
+Starting additional workers for a run (e.g. on another host with the queue file on shared storage), with the run id the
+orchestrator logged when it enqueued the units:
+    python work_queue.py worker --run-id 2024-05-17T06-00-00-4242
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from staging import concat_csv_files
+
+# File of the queue and folder of the result files (both on storage all workers share)
+WORK_QUEUE_FILE = Path(os.getenv("WORK_QUEUE_FILE", "./finalized_scrapers/work_queue.sqlite"))
+WORK_RESULT_DIR = Path(os.getenv("WORK_RESULT_DIR", "./finalized_scrapers/work_results"))
+
+# How long a worker holds a unit without renewing the lease (in seconds)
+LEASE_SECONDS = int(os.getenv("WORK_LEASE_SECONDS", "600"))
+
+# How often a unit is tried before it counts as failed
+MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", "3"))
+
+# How long an idle worker waits before it asks for a unit again (units leased by others may still come back)
+POLL_SECONDS = 5
+
+# Directory containing the scraper scripts
+SCRAPER_DIR = Path(__file__).resolve().parent / "finalized_scrapers"
+if not (SCRAPER_DIR / "scraper_registry.py").exists():
+    SCRAPER_DIR = Path(__file__).resolve().parent / "finalized scrapers"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    cities TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result_path TEXT,
+    rows INTEGER,
+    error TEXT,
+    UNIQUE (run_id, source, cities)
+)
+"""
+
+
+class WorkQueue:
+    """Work units of scraper runs in a SQLite file (status: pending, leased, done or failed)."""
+
+    def __init__(self, path=WORK_QUEUE_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()  # the lease keeper renews leases from another thread
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(SCHEMA)
+
+    def _transaction(self, statements):
+        # Runs (sql, parameters) pairs in one write transaction and returns the rows of the last statement
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters in statements:
+                    cursor.execute(sql, parameters)
+                rows = cursor.fetchall()
+                cursor.execute("COMMIT")
+                return rows
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, run_id, units):
+        """
+        Adds the units of a run (units that are already queued for the run are kept as they are).
+
+        Args:
+            run_id (str): Id of the run.
+            units (list): (source, cities, priority) per unit, cities is None for a unit covering all cities.
+        """
+        self._transaction([
+            ("INSERT OR IGNORE INTO units (run_id, source, cities, priority) VALUES (?, ?, ?, ?)",
+             (run_id, source, json.dumps(cities, ensure_ascii=False), priority))
+            for source, cities, priority in units
+        ])
+
+    def lease(self, run_id, worker):
+        """Leases the next unit (pending, or leased by a worker whose lease expired), returns None if there is none."""
+        now = time.time()
+        rows = self._transaction([(
+            "UPDATE units SET status = 'leased', attempts = attempts + 1, worker = ?, lease_expires = ? "
+            "WHERE id = (SELECT id FROM units WHERE run_id = ? AND attempts < ? "
+            "AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY attempts, priority DESC, id LIMIT 1) "
+            "RETURNING id, source, cities, attempts",
+            (worker, now + LEASE_SECONDS, run_id, MAX_ATTEMPTS, now),
+        )])
+        if not rows:
+            return None
+        unit = dict(rows[0])
+        unit["cities"] = json.loads(unit["cities"])
+        return unit
+
+    def renew(self, unit_id, worker):
+        """Extends the lease of a unit, returns False if the worker lost the lease."""
+        rows = self._transaction([(
+            "UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased' RETURNING id",
+            (time.time() + LEASE_SECONDS, unit_id, worker),
+        )])
+        return bool(rows)
+
+    def complete(self, unit_id, worker, result_path, rows):
+        """Marks a unit as done with its result file, returns False if the worker lost the lease (the unit stays as it is)."""
+        updated = self._transaction([(
+            "UPDATE units SET status = 'done', result_path = ?, rows = ?, error = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased' RETURNING id",
+            (str(result_path), rows, unit_id, worker),
+        )])
+        return bool(updated)
+
+    def fail(self, unit_id, worker, error):
+        """
+        Hands a failed unit back for a retry (or marks it as failed after MAX_ATTEMPTS), returns False if the worker lost
+        the lease.
+        """
+        rows = self._transaction([(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ?, lease_expires = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased' RETURNING id",
+            (MAX_ATTEMPTS, str(error)[:2000], unit_id, worker),
+        )])
+        return bool(rows)
+
+    def counts(self, run_id):
+        """Number of units per status of a run."""
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM units WHERE run_id = ? GROUP BY status", (run_id,)).fetchall()
+        return {status: count for status, count in rows}
+
+    def is_finished(self, run_id):
+        """Whether no unit of the run can be leased anymore now or later."""
+        with self._lock:
+            open_units = self._connection.execute(
+                "SELECT COUNT(*) FROM units WHERE run_id = ? AND status IN ('pending', 'leased') AND attempts < ?",
+                (run_id, MAX_ATTEMPTS),
+            ).fetchone()[0]
+            expired_last_attempts = self._connection.execute(
+                "SELECT COUNT(*) FROM units WHERE run_id = ? AND status = 'leased' AND attempts >= ? AND lease_expires >= ?",
+                (run_id, MAX_ATTEMPTS, time.time()),
+            ).fetchone()[0]
+        return open_units == 0 and expired_last_attempts == 0
+
+    def units(self, run_id):
+        with self._lock:
+            return [dict(row) for row in self._connection.execute("SELECT * FROM units WHERE run_id = ? ORDER BY id", (run_id,))]
+
+    def close(self):
+        self._connection.close()
+
+
+class LeaseKeeper(threading.Thread):
+    """Renews the lease of a unit in the background while the worker scrapes it."""
+
+    def __init__(self, queue, unit_id, worker):
+        super().__init__(daemon=True)
+        self.queue, self.unit_id, self.worker = queue, unit_id, worker
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(LEASE_SECONDS / 3):
+            if not self.queue.renew(self.unit_id, self.worker):
+                logging.warning(f"Worker {self.worker} lost the lease of unit {self.unit_id}.")
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def scrape_unit(source, cities, path):
+    """Runs the scraper of a unit in this process, writes its events in the final data format to path and returns their number."""
+    if str(SCRAPER_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRAPER_DIR))
+    from event_sink import EVENT_SPOOL_DIR, JsonLinesSink
+    from scraper_registry import run_scraper_plugin_to_csv
+
+    # Units of the same scraper may run at the same time, so every unit streams its raw events into a file of its own
+    suffix = "_".join(cities) if cities else "all"
+    sink = JsonLinesSink(EVENT_SPOOL_DIR / f"{source}_{suffix}.jsonl")
+    return run_scraper_plugin_to_csv(source, path, cities=cities, sink=sink)
+
+
+def run_worker(run_id, queue_file=WORK_QUEUE_FILE, result_dir=WORK_RESULT_DIR, worker=None):
+    """Takes units of a run from the queue and scrapes them until the queue is finished, returns the number of units done."""
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(queue_file)
+    result_dir = Path(result_dir) / run_id
+    result_dir.mkdir(parents=True, exist_ok=True)
+    done = 0
+    try:
+        while True:
+            unit = queue.lease(run_id, worker)
+            if unit is None:
+                if queue.is_finished(run_id):
+                    return done
+                time.sleep(POLL_SECONDS)
+                continue
+
+            logging.info(f"Worker {worker} scraping unit {unit['id']}: {unit['source']} {unit['cities'] or ''} (attempt {unit['attempts']})")
+            keeper = LeaseKeeper(queue, unit["id"], worker)
+            keeper.start()
+            try:
+                # A unit whose lease expired may be scraped by two workers at once, so every worker writes a file of its own
+                path = result_dir / f"unit-{unit['id']}-{worker}.csv"
+                rows = scrape_unit(unit["source"], unit["cities"], path)
+                if queue.complete(unit["id"], worker, path, rows):
+                    done += 1
+                else:
+                    logging.warning(f"Worker {worker} lost the lease of unit {unit['id']}, its result is dropped.")
+                    path.unlink(missing_ok=True)
+            except Exception as ex:
+                logging.error(f"Unit {unit['id']} ({unit['source']}) failed: {ex}")
+                queue.fail(unit["id"], worker, ex)
+            finally:
+                keeper.stop()
+    finally:
+        queue.close()
+
+
+def merge_results(run_id, output_file, queue_file=WORK_QUEUE_FILE):
+    """Merges the result files of all units done into output_file, returns the units that failed."""
+    queue = WorkQueue(queue_file)
+    try:
+        units = queue.units(run_id)
+    finally:
+        queue.close()
+
+    paths = [unit["result_path"] for unit in units if unit["status"] == "done" and unit["rows"]]
+    failed = [f"{unit['source']} {json.loads(unit['cities']) or ''}".strip() for unit in units if unit["status"] != "done"]
+    rows = concat_csv_files(paths, output_file) if paths else 0
+    if rows:
+        logging.info(f"Merged the results of {len(paths)} units ({rows} rows) into {output_file}.")
+    else:
+        logging.warning(f"No results found for run {run_id}.")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape work units from the queue.")
+    parser.add_argument("command", choices=["worker", "status"])
+    parser.add_argument("--run-id", required=True, help="Run to work on (logged by the orchestrator)")
+    parser.add_argument("--queue", default=str(WORK_QUEUE_FILE), help="SQLite file of the queue")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "worker":
+        done = run_worker(args.run_id, queue_file=args.queue)
+        logging.info(f"Queue of run {args.run_id} finished, {done} units scraped by this worker.")
+    else:
+        queue = WorkQueue(args.queue)
+        print(queue.counts(args.run_id))
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()